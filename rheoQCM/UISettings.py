@@ -223,8 +223,10 @@ config_default = {
 
     # export data file type
     'export_datafiletype': ';;'.join([
-        # 'csv file (*.csv)',
         'excel file (*.xlsx)',
+        'csv file (*.csv)',
+        'json lines file (*.jsonl)',
+        'parquet file (*.parquet)',
         # 'json file (*.json)',
         # 'hdf5 file (*.h5)',
         # 'Matlab file (*.mat)',
@@ -384,6 +386,44 @@ config_default = {
     ]),
 
     'vna_wait_time_extra': 0.05, # extra time adds to wait_time
+    # start the scan of the next harmonic before fitting/plotting the previous one (processing during the scan)
+    'vna_scan_pipeline': True,
+    # collect data (temperature, scan, fit and track) in a background thread. The UI only saves and plots the data
+    'acquisition_thread': True,
+    # plotting of spectra when the UI is busy. 'latest': plot the latest data of each harmonic; 'drop_new': keep the data not plotted
+    'acquisition_plot_policy': 'latest',
+    # no spectra are plotted while more than this number of scans are not saved by the UI
+    'acquisition_max_pending': 2,
+
+    # simulated analyzer (modules/AccessMyVNA_dummy.py) used in place of myVNA (e.g. test on Linux)
+    'vna_simulator': {
+        'enable': False, # use the simulated analyzer
+        'f1': 5e6, # fundamental frequency in Hz
+        'g1': 50, # half bandwidth of the fundamental in Hz. gamma_n = g1 * n
+        'amp': 5e-3, # peak conductance of the fundamental in S. amp_n = amp / n
+        'phi': 0, # phase angle of peaks in rad
+        'noise': 1e-3, # std of noise relative to amp_n
+        'drift_f': -0.01, # drift of f_n / n in Hz/s
+        'drift_g': 0.001, # drift of gamma_n / n in Hz/s
+        'spurious': 0, # number of spurious peaks around each harmonic
+        'latency_scale': 1, # scale of the calculated scan time (0: no wait)
+        'read_latency': 0, # time in s of each GetScanData call
+        'max_harmonic': 25, # highest harmonic synthesized
+        'seed': None, # seed of random numbers
+    },
+
+    # simulated temperature sensor (TempModules.SimTempSensor) used with the simulated analyzer
+    'temp_simulator': {
+        't0': 25, # temperature in C at start
+        'drift': 0.1, # drift in C/min
+        'amp': 0, # amplitude of oscillation in C
+        'period': 600, # period of oscillation in s
+        'noise': 0.01, # std of noise in C
+        'nsamples': 1, # number of points for average
+        'setup': 0.05, # time in s to create a task
+        'latency': 0.02, # time in s of each read
+        'seed': None, # seed of random numbers
+    },
 
     'channel_opts': OrderedDict([
     # key: str; val: for display in combobox
@@ -561,6 +601,17 @@ config_default = {
 
     ## mpl settings
     'max_mpl_toolbar_height': 20, # in px
+    # redraw lines with changed data over a cached background (blitting) instead of redrawing the whole figure
+    'mpl_blit': True,
+    # autoscale the axes when the data fill less than this fraction of the view (or leave it)
+    'mpl_blit_shrink': 0.5,
+    # max redraws per second of the plots updated in data collection, refit and plotting data. the updates in between are merged (0: redraw on each update)
+    'plot_max_rate': 10,
+    # decimate the data over time plots (mpl_plt1/2) to the min/max of bins of 'mpl_lod_px' pixels of the view. rebuilt by zoom/pan
+    'mpl_lod': True,
+    'mpl_lod_px': 1, # in px
+    # draw figures not shown (e.g. in other tabs) when they are shown the first time after changed. it saves startup time
+    'mpl_defer_draw': True,
 
     # font size for mpl_sp figures
     'mpl_sp_fontsize': 5,
@@ -636,6 +687,8 @@ config_default = {
     'contour_array': { # values for initializing contour plot
         'levels': 100, # contour levels
         'num': 100, # data size num*num
+        'num_coarse': 25, # data size of the grid plotted first if the num*num grid is not calculated (0: not used)
+        'cache_size': 8, # number of calculated grids kept
         'phi_lim': [0, np.pi / 2], # phi limit in degree
         'dlam_lim': [0, 1], # d/lambda limit 
         'cmap': 'hsv', # jet, hsv, hot, rainbow, gist_rainbow colormap string
@@ -670,6 +723,16 @@ config_default = {
 
     'temp_class_opts_list': [], # this key will be updated while running and for the updating of 'comboBox_tempmodule'
 
+    # read the temperature sensor in a background thread (TempModules.TempSampler) with the task kept open.
+    # the temperature of each scan is interpolated at the scan time without waiting for the sensor
+    'temp_sampler': {
+        'enable': True,
+        'interval': 0.5, # time in s between reads
+        'maxlen': 1200, # number of samples kept
+        'max_age': 5, # temperature is nan if the last sample is older than this (s)
+        'timeout': 5, # time in s to wait for the first read
+    },
+
     ######## params for PekTracker module #########
     # minium distance between the peakes to be found in Hz
     'peak_min_distance_Hz': 1e3, 
@@ -682,6 +745,15 @@ config_default = {
     ######### params for DataSaver module #########
     'unsaved_path': r'.\unsaved_data', 
     'unsaved_filename': r'%Y%m%d%H%M%S',
+    # save data/settings to h5 file in a background thread (True) or in the UI thread (False)
+    'data_saver_write_behind': True,
+    # storage filters of raw data (f, G, B) in h5 file
+    'raw_storage': {
+        'compression': None, # None, 'gzip' or 'lzf'. NOTE: compressed raw can not be memory mapped
+        'compression_opts': None, # compression level for 'gzip' (0-9). None for default (4)
+        'shuffle': False, # byte shuffle filter before compression (better ratio for float data)
+        'f_linear': False, # save f as (start, step, npts) if it is a linear ramp. NOTE: file can not be read by versions <= 0.19.2
+    },
 
     ######### DataSaver module: import data format #####
     # a number is going to replace '{}'
@@ -1318,31 +1318,32 @@ class AccessMyVNA():
     ################ combined functions #################
     def single_scan(self):
         logger.info('single_scan') 
+        t_ready = self.start_scan()
+        return self.read_scan(t_ready)
+
+
+    def start_scan(self):
+        '''
+        start a single scan and return the time (time.time()) the data will be ready
+        the data can be processed before read_scan is called
+        '''
         logger.info('self._nsteps%s', self._nsteps) 
-        # self.Init()
         self.SingleScan()
-        logger.info('self._nsteps%s', self._nsteps) 
         self.setDisplayFreq()
         self.Autoscale()
-        logger.info('self._nsteps%s', self._nsteps) 
+        return time.time() + self._get_wait_time()
 
-        t_wait = time.time() + self._get_wait_time()
-        # wait for some time
-        bg_wait_till(t_wait) # sleep
 
-        # # used thread
-        # thread = threading.Thread(target=bg_wait_till, args=(t_wait,))
-        # thread.start()
-        # thread.join()
+    def read_scan(self, t_ready):
+        '''
+        wait till t_ready and read the data of the scan started by start_scan
+        '''
+        # wait for some time
+        bg_wait_till(t_ready) # sleep
 
         logger.info('self._nsteps%s', self._nsteps) 
-        # ret, nSteps = self.GetScanSteps()
         ret, f, G = self.GetScanData(nStart=0, nEnd=int(self._nsteps-1), nWhata=-1, nWhatb=15)
-        # time.sleep(1)
-        logger.info('self._nsteps%s', self._nsteps) 
         ret, f, B = self.GetScanData(nStart=0, nEnd=int(self._nsteps-1), nWhata=-1, nWhatb=16)
-        # self.Close()
-        logger.info('self._nsteps%s', self._nsteps) 
         return ret, f, G * 1e3, B * 1e3 # f in Hz; G & B in mS
 
 
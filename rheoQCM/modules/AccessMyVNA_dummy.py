@@ -0,0 +1,379 @@
+'''
+simulated analyzer with the interface of AccessMyVNA
+It does not need myVNA (Windows dll) and can be used to run and profile the
+acquisition (scan, tracking, fitting and saving) on any system.
+Multi-harmonic G/B Lorentzians are synthesized with noise, drift, spurious
+peaks and the scan latency of the analyzer.
+use it in place of AccessMyVNA:
+    from modules.AccessMyVNA_dummy import AccessMyVNA
+or set config_default['vna_simulator']['enable'] to True
+'''
+
+import time
+import numpy as np
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+# default parameters of simulation
+sim_default = {
+    'f1': 5e6, # fundamental frequency in Hz
+    'g1': 50, # half bandwidth of the fundamental in Hz. gamma_n = g1 * n
+    'amp': 5e-3, # peak conductance of the fundamental in S. amp_n = amp / n
+    'phi': 0, # phase angle of peaks in rad
+    'noise': 1e-3, # std of noise relative to amp_n
+    'drift_f': -0.01, # drift of f_n / n in Hz/s
+    'drift_g': 0.001, # drift of gamma_n / n in Hz/s
+    'spurious': 0, # number of spurious peaks around each harmonic
+    'latency_scale': 1, # scale of the calculated scan time (0: no wait)
+    'read_latency': 0, # time in s of each GetScanData call
+    'max_harmonic': 25, # highest harmonic synthesized
+    'seed': None, # seed of random numbers
+}
+
+# load vna_wait_time_extra and simulation parameters
+try:
+    import UISettings
+    config_default = UISettings.get_config()
+    settings_default = UISettings.get_settings()
+except:
+    config_default = {}
+    settings_default = {}
+
+# initialize extra_time by default
+extra_time = config_default.get('vna_wait_time_extra', 0.05) # in s. This extra time will be added to the calculated value
+
+if 'vna_wait_time_extra' in settings_default:
+    extra_time = settings_default['vna_wait_time_extra']
+    logger.info('use user settings vna_wait_time_extra')
+
+sim_default.update(config_default.get('vna_simulator', {}))
+sim_default.pop('enable', None)
+# end load
+
+
+# what codes of GetScanData
+WHAT_FREQ = -1
+WHAT_G = 15
+WHAT_B = 16
+
+
+def fun_G(x, amp, cen, wid, phi):
+    '''
+    function of relation between frequency (f) and conductance (G)
+    same as PeakTracker.fun_G
+    '''
+    return amp * (4 * wid**2 * x**2 * np.cos(phi) - 2 * wid * x * np.sin(phi) * (cen**2 - x**2)) / (4 * wid**2 * x**2 + (cen**2 -x**2)**2)
+
+
+def fun_B(x, amp, cen, wid, phi):
+    '''
+    function of relation between frequency (f) and susceptance (B)
+    same as PeakTracker.fun_B
+    '''
+    return amp * (4 * wid**2 * x**2 * np.sin(phi) + 2 * wid * x * np.cos(phi) * (cen**2 - x**2)) / (4 * wid**2 * x**2 + (cen**2 -x**2)**2)
+
+
+def bg_wait_till(t_wait):
+    while time.time() < t_wait:
+        time.sleep(0.01)
+
+
+class AccessMyVNA():
+    '''
+    simulated analyzer with the methods of AccessMyVNA
+    kwargs: parameters of simulation to replace sim_default
+    '''
+    def __init__(self, **kwargs):
+        self.sim = {**sim_default, **kwargs}
+        self.rng = np.random.default_rng(self.sim['seed'])
+        self._t0 = time.time() # start of drift
+
+        # spurious peaks by harmonic {n: (offsets (in gamma_n), amp ratios, wid ratios)}
+        harms = np.arange(1, self.sim['max_harmonic'] + 1, 2)
+        nspur = self.sim['spurious']
+        self._spurs = {n: (self.rng.uniform(-4, 4, nspur), self.rng.uniform(0.05, 0.2, nspur), self.rng.uniform(0.2, 0.5, nspur)) for n in harms}
+
+        self._nsteps = np.array(400, dtype=int)
+        self._naverage = np.array(1, dtype=int)
+        self._instrmode = np.array(0, dtype=int)
+        self._displaymode = np.array(0, dtype=int)
+        self._chn = 1 # avtive channel
+        self._f = [np.nan, np.nan] # start & stop  frequencies [start, stop]
+        _, self._speed, self._step_delay, self._start_delay, self._phase_delay = self.get_speed_delays()
+
+        self._is_open = False
+        self._scan = None # last scan {'t_end', 'f', 'G', 'B'}
+        self.nscans = 0 # number of scans
+        self.nreads = 0 # number of GetScanData calls
+        logger.info('simulated analyzer %s', self.sim)
+
+    # use __enter__ __exit__ for with or use try finally
+    def __enter__(self):
+        self.Init()
+        self.ShowWindow(1)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.Close()
+
+
+    def Init(self):
+        self._is_open = True
+        return 0
+
+    def Close(self):
+        self._is_open = False
+
+    def ShowWindow(self, nValue=1):
+        return 0
+
+    def SetScanSteps(self, nSteps=400):
+        self._nsteps = np.array(nSteps, dtype=int)
+        return 0, nSteps
+
+    def GetScanSteps(self):
+        return 0, self._nsteps
+
+    def SetScanAverage(self, nAverage=1):
+        self._naverage = np.array(nAverage, dtype=int)
+        return 0, nAverage
+
+    def GetScanAverage(self):
+        return 0, self._naverage
+
+    def GetDoubleArray(self, nWhat=0, nIndex=0, nArraySize=9):
+        ndRes = np.zeros(nArraySize, dtype=np.float64)
+        if nWhat == 0: # GET_SCAN_FREQ_DATA
+            ndRes[:2] = self._f
+        elif nWhat == 5: # [transChn, reflectchn]
+            ndRes[:2] = [2., 1.] if self._chn == 1 else [1., 2.]
+        return 0, ndRes
+
+    def SetDoubleArray(self, nWhat=0, nIndex=0, nArraySize=9, nData=None):
+        if nData is None:
+            return 0, None
+        return 0, np.asarray(nData, dtype=np.float64)
+
+    def GetIntegerArray(self, nWhat=5, nIndex=0, nArraySize=4):
+        ndRes = np.zeros(nArraySize, dtype=int)
+        if nWhat == 5: # ADC_speed, ADC_step_delay, sweep_start_delay, phase_change_delay
+            ndRes[:4] = [1, 0, 0, 0]
+        return 0, ndRes
+
+    def SetIntegerArray(self, nWhat=5, nIndex=0, nArraySize=4, nData=None):
+        if nData is None:
+            return 0, None
+        return 0, np.asarray(nData, dtype=int)
+
+    def Getinstrmode(self):
+        return 0, self._instrmode
+
+    def Setinstrmode(self, nMode=0):
+        self._instrmode = np.array(nMode, dtype=int)
+        return 0, nMode
+
+    def Getdisplaymode(self):
+        return 0, self._displaymode
+
+    def Setdisplaymode(self, nMode=0):
+        self._displaymode = np.array(nMode, dtype=int)
+        return 0, nMode
+
+
+    def SingleScan(self):
+        '''
+        starts a single scan
+        the spectra are synthesized at the start of the scan and available after the scan time
+        '''
+        t_start = time.time()
+        f, G, B = self.synthesize(t_start)
+        self._scan = {'t_end': t_start + self._get_wait_time() - extra_time * self.sim['latency_scale'], 'f': f, 'G': G, 'B': B}
+        self.nscans += 1
+        return 0, None
+
+    def EqCctRefine(self):
+        return 0, None
+
+    def SetFequencies(self, f1=4.95e6, f2=5.05e6, nFlags=1):
+        self._f = [f1, f2]
+        return 0, f1, f2
+
+
+    def GetScanData(self, nStart=0, nEnd=299, nWhata=-1, nWhatb=15):
+        '''
+        return data of the last scan
+        if the scan is not finished, it waits till the end of the scan
+        nWhat: -1: frequency; 15: G (S); 16: B (S)
+        '''
+        if self._scan is None: # no scan
+            return -1, np.zeros(nEnd - nStart + 1), np.zeros(nEnd - nStart + 1)
+        bg_wait_till(self._scan['t_end'])
+        if self.sim['read_latency']:
+            time.sleep(self.sim['read_latency'])
+        self.nreads += 1
+        what = {WHAT_FREQ: self._scan['f'], WHAT_G: self._scan['G'], WHAT_B: self._scan['B']}
+        return 0, what[nWhata][nStart:nEnd+1].copy(), what[nWhatb][nStart:nEnd+1].copy()
+
+
+    def Autoscale(self):
+        return 0
+
+    def LoadCalibration(self, fileName):
+        return 0
+
+    def SaveCalibration(self, fileName):
+        return 0
+
+    def LoadConfiguration(self, fileName):
+        return 0
+
+    def SaveConfiguration(self, fileName):
+        return 0
+
+
+    ################ simulation #################
+    def true_peak(self, harm, t=None):
+        '''
+        return the center (Hz) and half bandwidth (Hz) of harmonic harm at time t (s, time.time()) without noise
+        '''
+        if t is None:
+            t = time.time()
+        n = int(harm)
+        dt = t - self._t0
+        return n * (self.sim['f1'] + self.sim['drift_f'] * dt), n * (self.sim['g1'] + self.sim['drift_g'] * dt)
+
+
+    def synthesize(self, t):
+        '''
+        return f, G, B (in S) of current frequency span and steps at time t
+        '''
+        f = np.linspace(self._f[0], self._f[1], int(self._nsteps))
+        G = np.zeros_like(f)
+        B = np.zeros_like(f)
+        phi = self.sim['phi']
+        for n in range(1, self.sim['max_harmonic'] + 1, 2):
+            cen, wid = self.true_peak(n, t)
+            if abs(f.mean() - cen) > 0.5 * self.sim['f1']: # only harmonics close to the span
+                continue
+            amp = self.sim['amp'] / n
+            G += fun_G(f, amp, cen, wid, phi)
+            B += fun_B(f, amp, cen, wid, phi)
+            for off, a, w in zip(*self._spurs[n]):
+                G += fun_G(f, amp * a, cen + off * wid, wid * w, phi)
+                B += fun_B(f, amp * a, cen + off * wid, wid * w, phi)
+            noise = self.sim['noise'] * amp / np.sqrt(max(int(self._naverage), 1))
+            G += self.rng.normal(0, noise, f.size)
+            B += self.rng.normal(0, noise, f.size)
+        return f, G, B
+
+
+    ################ combined functions #################
+    def single_scan(self):
+        t_ready = self.start_scan()
+        return self.read_scan(t_ready)
+
+
+    def start_scan(self):
+        '''
+        start a single scan and return the time (time.time()) the data will be ready
+        '''
+        self.SingleScan()
+        self.setDisplayFreq()
+        self.Autoscale()
+        return time.time() + self._get_wait_time()
+
+
+    def read_scan(self, t_ready):
+        '''
+        wait till t_ready and read the data of the scan started by start_scan
+        '''
+        bg_wait_till(t_ready) # sleep
+        ret, f, G = self.GetScanData(nStart=0, nEnd=int(self._nsteps-1), nWhata=-1, nWhatb=15)
+        ret, f, B = self.GetScanData(nStart=0, nEnd=int(self._nsteps-1), nWhata=-1, nWhatb=16)
+        return ret, f, G * 1e3, B * 1e3 # f in Hz; G & B in mS
+
+
+    def setDisplayFreq(self):
+        ret, nData = self.SetDoubleArray(nWhat=3, nIndex=0, nArraySize=2, nData=self._f)
+
+
+    def change_settings(self, refChn=1, nMode=0, nSteps=400, nAverage=1):
+        ret, nMode =    self.Setinstrmode(nMode)
+        ret, nData =    self.setADCChannel(refChn)
+        ret, nSteps =   self.SetScanSteps(nSteps)
+        ret, nAverage = self.SetScanAverage(nAverage)
+
+
+    def set_steps_freq(self, nSteps=300, f1=4.95e6, f2=5.00e6):
+        # set scan parameters
+        ret, nSteps =   self.SetScanSteps(nSteps)
+        self.SetFequencies(f1, f2, nFlags=1)
+
+
+    def setADCChannel(self, reflectchn=1, paths={}):
+        self._chn = reflectchn
+        return 0, reflectchn
+
+
+    def getADCChannel(self):
+        return 0, self._chn
+
+
+    def set_vna(self, setflg):
+        '''
+        set analyzer by setflg (dict)
+        setflg: {'f1', 'f2', 'steps', 'chn', 'avg', 'speed', ...}
+        '''
+        for flg, val in setflg.items():
+            if val is None:
+                continue
+            if (flg == 'f') and (self._f != val): # set frequency
+                ret, self._f[0], self._f[1] = self.SetFequencies(f1=val[0], f2=val[1], nFlags=1)
+            elif (flg == 'steps') and self._nsteps != val: # set scan steps
+                ret, self._nsteps = self.SetScanSteps(nSteps=val)
+            elif (flg == 'chn') and val != 'none' and (self._chn != int(val)): # set scan channel
+                ret, self._chn = self.setADCChannel(reflectchn=int(val), paths=setflg.get('cal', {}))
+            elif (flg == 'avg') and (self._naverage != val): # set scan average
+                ret, self._naverage = self.SetScanAverage(nAverage=val)
+            elif (flg == 'instrmode') and (self._instrmode != val): # set instrument mode
+                ret, self._instrmode = self.Setinstrmode(nMode=0)
+        return 0
+
+
+    def get_freq_span(self):
+        ''' get frequency span from vna setup '''
+        ret, ndResult = self.GetDoubleArray(nWhat=0, nIndex=0, nArraySize=9)
+        return ret, ndResult[0:1]
+
+
+    def get_speed_delays(self):
+        ''' get adc_speed and delays'''
+        ret, delays = self.GetIntegerArray(nWhat=5, nIndex=0, nArraySize=4)
+        ADC_speed, ADC_step_delay, sweep_start_delay, phase_change_delay = delays
+
+        return ret, ADC_speed, ADC_step_delay, sweep_start_delay, phase_change_delay
+
+
+    def _get_wait_time(self):
+        '''
+        scan time of the analyzer (same timing as AccessMyVNA._get_wait_time)
+        scaled by sim['latency_scale']
+        '''
+        naverage = int(self._naverage)
+        average_delay = 95 # in us, delay between scans for an average
+        mbuffer = 70
+        delay = 4000
+        dds_load = 90 # microseconds
+        num_phase = 4 #[0, 90, 180, 270] # CDS phase points
+        start_delay = self._start_delay + 960 # plus system start delay
+        conversion_delay = 320  # updates DDS at the end of an ADC conversion
+        usb_frame_time = 125 # USB version 0.22
+
+        conversion_time = conversion_delay + self._step_delay + mbuffer + 110 + num_phase * self._phase_delay # microseconds
+        if conversion_time % usb_frame_time != 0:
+            conversion_time = (conversion_time // usb_frame_time)*usb_frame_time + usb_frame_time + 320 # microseconds
+
+        total_time = dds_load * 1e-6 + start_delay * 1e-6 + int(self._nsteps) * conversion_time * 1e-6 + delay * 1e-6 # get total time in seconds
+        return (total_time * naverage + average_delay * (naverage - 1) * 1e-6 + extra_time) * self.sim['latency_scale']
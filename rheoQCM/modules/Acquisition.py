@@ -0,0 +1,410 @@
+'''
+modules for data acquisition with the analyzer
+'''
+
+import copy
+import queue
+import threading
+import time
+import datetime
+import traceback
+from collections import deque, OrderedDict
+import numpy as np
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def span_check(freq_range, f1=None, f2=None):
+    '''
+    check if lower limit ('f1' in Hz) and upper limit ('f2' in Hz) in freq_range [bf1, bf2] of the harmonic
+    if out of the limit, return the part in the range
+    NOTE: if f1 and/or f2 isnan, the nan values will returned
+    '''
+    bf1, bf2 = freq_range # in Hz
+    if f1 and (f1 < bf1 or f1 >= bf2): # f1 out of limt
+        f1 = bf1
+    if f2 and (f2 > bf2 or f2 <= bf1): # f2 out of limt
+        f2 = bf2
+    if f1 and f2 and (f1 >= f2):
+        f2 = bf2
+    return [f1, f2]
+
+
+def fit_and_track(peak_tracker, chn_name, harm, f, G, B, harmdata, freq_span, freq_range=None, fit=True):
+    '''
+    fit (if fit) and track the scanned data (f, G, B) of harm and chn_name with peak_tracker
+    harmdata, freq_span: settings['harmdata'] and settings['freq_span'] for peak_tracker.update_input
+    freq_range: [bf1, bf2] of harm to check the tracked span
+    return: fs, gs (nan if not fitted), span (next span, nan if tracking failed) and
+        frame: dict of the data to plot (spectra, fitting, tracking)
+    '''
+    # put f, G, B to peak_tracker for fitting and/or tracking
+    peak_tracker.update_input(chn_name, harm, harmdata=harmdata, freq_span=freq_span, fGB=[f, G, B])
+    frame = {'chn_name': chn_name, 'harm': harm, 'f': f, 'G': G, 'B': B, 'fit': None}
+
+    fs_val, gs_val = np.nan, np.nan
+    if fit:
+        fit_result = peak_tracker.peak_fit(chn_name, harm, components=False)
+        logger.info(fit_result['v_fit']) 
+        v_fit = fit_result['v_fit']
+        if 'g_c' in v_fit: # fitting successed
+            gc_list = [v_fit['g_c']['value']] * 2 # make its len() == 2
+        else: # fitting failed
+            gc_list = [np.nan, np.nan]
+        # recorded center
+        cen_rec_freq = v_fit['cen_rec']['value']
+        params = peak_tracker.get_output(key='params', chn_name=chn_name, harm=harm)
+        fs_val = cen_rec_freq # fs
+        gs_val = v_fit['wid_rec']['value'] # gs = half_width
+        frame['fit'] = {
+            'fit_g': fit_result['fit_g'],
+            'fit_b': fit_result['fit_b'],
+            'factor_span': peak_tracker.get_output(key='factor_span', chn_name=chn_name, harm=harm),
+            'gc_list': gc_list,
+            'cen_rec_freq': cen_rec_freq,
+            'cen_rec_G': peak_tracker.get_output(key='gmod', chn_name=chn_name, harm=harm).eval(params, x=cen_rec_freq),
+            'cen_rec_B': peak_tracker.get_output(key='bmod', chn_name=chn_name, harm=harm).eval(params, x=cen_rec_freq),
+            'chisqr': v_fit['chisqr'],
+        }
+
+    # get span from tracking
+    span, cen_trk_freq = peak_tracker.peak_track(chn_name=chn_name, harm=harm)
+    if freq_range is not None: # check span range is in range
+        span = span_check(freq_range, *span)
+    idx_trk = np.argmin(np.abs(f - cen_trk_freq))
+    frame.update(span=span, cen_trk_freq=cen_trk_freq, cen_trk_G=G[idx_trk], cen_trk_B=B[idx_trk])
+
+    return fs_val, gs_val, span, frame
+
+
+class ScanPipeline:
+    '''
+    scan harmonics one by one with the analyzer (AccessMyVNA or AccessMyVNA_dummy)
+    the next harmonic is set and started as soon as the data of the previous one is read,
+    and the data of the previous harmonic is processed (fitting, tracking, plotting) while the analyzer is scanning
+    '''
+    def __init__(self, vna, pipeline=True, nhistory=100):
+        '''
+        vna: analyzer class with set_vna, start_scan and read_scan
+        pipeline: if False, each harmonic is processed after its data is read and before the next scan (serial)
+        nhistory: number of cycles kept in self.history
+        '''
+        self.vna = vna
+        self.pipeline = pipeline
+        self.history = deque(maxlen=nhistory) # timing of cycles
+        self.last = {} # timing of the last cycle
+
+
+    def run(self, chn_name, harm_list, get_setflg, process=None):
+        '''
+        scan harm_list of chn_name and call process with the data of each harmonic
+        NOTE: vna needs to be opened (with vna:) by the caller
+        get_setflg: function (chn_name, harm) returns setflg for vna.set_vna
+        process: function (chn_name, harm, f, G, B) called in the order of harm_list
+        return: {harm: (f, G, B)} or None if failed to set or read the analyzer
+        '''
+        data = {}
+        timing = {'chn_name': chn_name, 'nharm': len(harm_list), 'scan': 0., 'wait': 0., 'process': 0., 'overlap': 0.}
+        t_cycle = time.perf_counter()
+        prev = None # (harm, f, G, B) not processed
+
+        for harm in harm_list:
+            ret = self.vna.set_vna(get_setflg(chn_name, harm))
+            if ret != 0:
+                logger.warning('There is an error while setting VNA!')
+                return None
+            t_start = time.perf_counter()
+            t_ready = self.vna.start_scan()
+            if prev is not None: # process the previous harmonic during the scan
+                t_process = self._process(process, chn_name, *prev)
+                timing['process'] += t_process
+                timing['overlap'] += t_process # processing time hidden by the scan
+                prev = None
+            t_read = time.perf_counter()
+            ret, f, G, B = self.vna.read_scan(t_ready)
+            t_end = time.perf_counter()
+            timing['wait'] += t_end - t_read # time blocked by the analyzer
+            timing['scan'] += t_end - t_start # from start of scan to end of reading
+
+            if (f is None) or (f[0] == f[-1]): # vna error
+                logger.warning('Analyzer connection error!')
+                return None
+
+            data[harm] = (f, G, B)
+            if self.pipeline:
+                prev = (harm, f, G, B)
+            else:
+                timing['process'] += self._process(process, chn_name, harm, f, G, B)
+
+        if prev is not None: # the last harmonic
+            timing['process'] += self._process(process, chn_name, *prev)
+
+        timing['cycle'] = time.perf_counter() - t_cycle
+        self.last = timing
+        self.history.append(timing)
+        logger.info('scan cycle %s: %.3f s (scan %.3f s, wait %.3f s, process %.3f s)', chn_name, timing['cycle'], timing['scan'], timing['wait'], timing['process'])
+        return data
+
+
+    def _process(self, process, chn_name, harm, f, G, B):
+        ''' call process and return the time spent '''
+        t_start = time.perf_counter()
+        if process is not None:
+            process(chn_name, harm, f, G, B)
+        return time.perf_counter() - t_start
+
+
+    def summary(self):
+        '''
+        return mean timing (s) of the cycles in self.history
+        '''
+        if not self.history:
+            return {}
+        return {key: np.mean([timing[key] for timing in self.history]) for key in ['cycle', 'scan', 'wait', 'process', 'overlap']}
+
+
+class AcquisitionEngine:
+    '''
+    run the data collection (temperature, scanning, fitting and tracking) in a background thread
+    at fixed intervals, so scans are not delayed by the UI (saving, plotting)
+    results are passed to the UI through queues:
+        data: one result per cycle (for saving). never dropped
+        plot frames: data to plot of each harmonic. frames may be dropped (plot_policy):
+            'latest': a frame replaces the frame of the same chn_name and harm not plotted yet
+            'drop_new': a frame is dropped if the frame of the same chn_name and harm is not plotted yet
+            all frames are dropped while more than max_pending data results are not taken by the UI (back-pressure)
+    the UI is notified by on_data, on_plot, on_stopped (e.g. emit of Qt signals). a notification is not sent again till the queue is taken
+    '''
+    def __init__(self, vna, peak_tracker, temp_sensor=None, pipeline=True, plot_policy='latest', max_pending=2, on_data=None, on_plot=None, on_stopped=None):
+        '''
+        vna: analyzer class (AccessMyVNA or AccessMyVNA_dummy)
+        peak_tracker: PeakTracker used only by this engine
+        temp_sensor: class with get_tempC. with temp_at (TempModules.TempSampler), the temperature is interpolated at the time of each channel after scanning
+        '''
+        self.vna = vna
+        self.peak_tracker = peak_tracker
+        self.temp_sensor = temp_sensor
+        self.scan_pipeline = ScanPipeline(vna, pipeline=pipeline)
+        self.plot_policy = plot_policy
+        self.max_pending = max_pending
+        self.on_data = on_data
+        self.on_plot = on_plot
+        self.on_stopped = on_stopped
+
+        self._plan = None
+        self._ver = 0 # version of plan. increased by set_plan
+        self._span_vers = {} # {(chn_name, harm): version of plan in which the span was set by the UI}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._data = queue.Queue()
+        self._frames = OrderedDict() # {(chn_name, harm): frame}
+        self._data_notified = False
+        self._plot_notified = False
+        self.stats = {}
+
+
+    def set_plan(self, plan, spans=None):
+        '''
+        set the plan of following cycles. it can be called while running
+        return the version of the plan (result['plan_ver'] of the results collected with it)
+        plan: {
+            'interval': time between the starts of cycles in s,
+            'chn_names': ['samp', 'ref'],
+            'harm_list': ['1', '3', ...],
+            'chns': {'samp': 1, 'ref': 2}, # adc channel of chn_name
+            'cal': {'ADC1': path, 'ADC2': path}, # calibration files
+            'steps': {chn_name: {harm: int}}, # scan steps
+            'harmdata': settings['harmdata'],
+            'freq_span': settings['freq_span'],
+            'freq_range': settings['freq_range'],
+            'fit': {chn_name: {harm: bool}}, # if fit harm
+            'temp': bool, # if read temperature
+            'time_str_format': str,
+        }
+        NOTE: the engine tracks the spans while running. freq_span of plan is only used for harmonics not scanned yet
+        spans: {chn_name: {harm: [f1, f2]}} spans changed in the UI. they replace the tracked spans
+        '''
+        plan = copy.deepcopy(plan)
+        with self._lock:
+            self._ver += 1
+            plan['ver'] = self._ver
+            if self._plan is not None: # keep tracked spans
+                for chn_name, tracked in self._plan['freq_span'].items():
+                    plan['freq_span'].setdefault(chn_name, {}).update(tracked)
+            for chn_name, harm_spans in (spans or {}).items():
+                for harm, span in harm_spans.items():
+                    plan['freq_span'].setdefault(chn_name, {})[harm] = list(span)
+                    self._span_vers[(chn_name, harm)] = self._ver # not replaced by the cycles of older plans
+            self._plan = plan
+            return self._ver
+
+
+    def start(self, plan=None):
+        if self.is_running():
+            return
+        self._plan = None # spans from plan
+        self._span_vers = {}
+        if plan is not None:
+            self.set_plan(plan)
+        self._stop_event.clear()
+        self.stats = {'cycles': 0, 'overruns': 0, 'frames': 0, 'frames_dropped': 0, 'frames_shed': 0, 'max_pending': 0, 'cycle_time': deque(maxlen=100), 'lateness': deque(maxlen=100)}
+        self._thread = threading.Thread(target=self._run, name='acquisition', daemon=True)
+        self._thread.start()
+        logger.info('acquisition engine started')
+
+
+    def stop(self, wait=False, timeout=None):
+        '''
+        stop after the running cycle
+        '''
+        self._stop_event.set()
+        if wait and self._thread is not None:
+            self._thread.join(timeout)
+
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+
+    def get_data(self):
+        '''
+        return list of all data results not taken
+        result: {'t', 'temp', 'f', 'G', 'B', 'fs', 'gs' (dicts by chn_name), 'chn_names', 'harm_list', 'freq_span', 'plan_ver', 'error'}
+        '''
+        results = []
+        with self._lock:
+            self._data_notified = False
+            while True:
+                try:
+                    results.append(self._data.get_nowait())
+                except queue.Empty:
+                    break
+        return results
+
+
+    def get_plot_frames(self):
+        '''
+        return list of plot frames not taken (see fit_and_track)
+        '''
+        with self._lock:
+            frames = list(self._frames.values())
+            self._frames.clear()
+            self._plot_notified = False
+        return frames
+
+
+    def _put_frame(self, frame):
+        notify = False
+        with self._lock:
+            self.stats['frames'] += 1
+            key = (frame['chn_name'], frame['harm'])
+            if self._data.qsize() > self.max_pending: # the UI is behind. no plotting
+                self.stats['frames_shed'] += 1
+                return
+            if key in self._frames:
+                self.stats['frames_dropped'] += 1
+                if self.plot_policy == 'drop_new':
+                    return
+                del self._frames[key]
+            self._frames[key] = frame
+            if not self._plot_notified:
+                self._plot_notified = notify = True
+        if notify and self.on_plot is not None:
+            self.on_plot()
+
+
+    def _put_data(self, result):
+        notify = False
+        with self._lock:
+            self._data.put(result)
+            self.stats['max_pending'] = max(self.stats['max_pending'], self._data.qsize())
+            if not self._data_notified:
+                self._data_notified = notify = True
+        if notify and self.on_data is not None:
+            self.on_data()
+
+
+    def _run(self):
+        t_next = time.monotonic()
+        try:
+            while not self._stop_event.is_set():
+                self.stats['lateness'].append(time.monotonic() - t_next)
+                t_start = time.monotonic()
+                with self._lock:
+                    plan = self._plan
+                if not self._run_cycle(plan): # error
+                    break
+                self.stats['cycles'] += 1
+                self.stats['cycle_time'].append(time.monotonic() - t_start)
+
+                # start of the next cycle on the grid of interval
+                t_next += plan['interval']
+                if t_next < time.monotonic(): # cycle longer than interval
+                    self.stats['overruns'] += 1
+                    t_next += np.ceil((time.monotonic() - t_next) / plan['interval']) * plan['interval']
+                self._stop_event.wait(max(t_next - time.monotonic(), 0))
+        finally:
+            logger.info('acquisition engine stopped %s', {key: val for key, val in self.stats.items() if not isinstance(val, deque)})
+            if self.on_stopped is not None:
+                self.on_stopped()
+
+
+    def _run_cycle(self, plan):
+        '''
+        collect data of all channels once and put the result to data queue
+        return False if there is an error
+        '''
+        result = {'chn_names': plan['chn_names'], 'harm_list': plan['harm_list'], 'plan_ver': plan.get('ver', 0), 't': {}, 'temp': {}, 'f': {}, 'G': {}, 'B': {}, 'fs': {}, 'gs': {}, 'error': None}
+        try:
+            for chn_name in plan['chn_names']:
+                fs, gs = [], []
+                t_scan = time.time()
+                result['t'][chn_name] = datetime.datetime.fromtimestamp(t_scan).strftime(plan['time_str_format'])
+                result['temp'][chn_name] = None
+                if plan['temp'] and self.temp_sensor is not None and not hasattr(self.temp_sensor, 'temp_at'): # read sensor before scanning
+                    result['temp'][chn_name] = self.temp_sensor.get_tempC()
+
+                def get_setflg(chn_name, harm):
+                    return {'f': plan['freq_span'][chn_name][harm], 'steps': plan['steps'][chn_name][harm], 'chn': plan['chns'][chn_name], 'cal': plan['cal']}
+
+                def process(chn_name, harm, f, G, B):
+                    fs_val, gs_val, span, frame = fit_and_track(self.peak_tracker, chn_name, harm, f, G, B, plan['harmdata'], plan['freq_span'], freq_range=plan['freq_range'][harm], fit=plan['fit'][chn_name][harm])
+                    if not any(np.isnan(span)): # tracking successed
+                        with self._lock: # the plan may be replaced by set_plan during the cycle
+                            plan['freq_span'][chn_name][harm] = span
+                            if self._span_vers.get((chn_name, harm), 0) <= plan.get('ver', 0): # not set by the UI after this cycle started
+                                self._plan['freq_span'].setdefault(chn_name, {})[harm] = span
+                    fs.append(fs_val)
+                    gs.append(gs_val)
+                    self._put_frame(frame)
+
+                with self.vna:
+                    data = self.scan_pipeline.run(chn_name, plan['harm_list'], get_setflg, process=process)
+                if data is None: # vna error
+                    result['error'] = 'Failed to connect with analyzer!'
+                    break
+                result['f'][chn_name] = {harm: val[0] for harm, val in data.items()}
+                result['G'][chn_name] = {harm: val[1] for harm, val in data.items()}
+                result['B'][chn_name] = {harm: val[2] for harm, val in data.items()}
+                result['fs'][chn_name] = fs
+                result['gs'][chn_name] = gs
+                if plan['temp'] and hasattr(self.temp_sensor, 'temp_at'): # sampled while scanning
+                    result['temp'][chn_name] = self.temp_sensor.temp_at(t_scan)
+        except Exception as e:
+            logger.exception('acquisition failed')
+            result['error'] = traceback.format_exc()
+        result['freq_span'] = copy.deepcopy(plan['freq_span'])
+        self._put_data(result)
+        return result['error'] is None
+
+
+    def summary(self):
+        '''
+        return counts and mean times (s) of cycles
+        '''
+        stats = {key: val for key, val in self.stats.items() if not isinstance(val, deque)}
+        for key in ['cycle_time', 'lateness']:
+            stats[key] = np.mean(self.stats[key]) if self.stats.get(key) else np.nan
+        return stats
@@ -48,16 +48,428 @@ import os
 import re
 import datetime
 import time # for test
+import threading
+import contextlib
+import warnings
 import pandas as pd
 import numpy as np
-from scipy.interpolate import interp1d # , splrep, splev
 import h5py
 import json
-import openpyxl
+# openpyxl (excel files) is imported by pandas when it is used
 import csv
 import logging
 logger = logging.getLogger(__name__)
 
+try: # for exporting data to parquet file
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+    logger.info('pyarrow is not available. Exporting to parquet file is disabled.')
+
+
+# suffix of the dataset written before replacing the old one
+h5_tmp_suffix = '_tmp'
+# order to write items: data tables first, settings last
+h5_write_order = ('data/', 'prop/', 'exp_ref', 'settings')
+# columns of qcm arrays interpolated by DataSaver.shape_qcm_arrays_b_to_a (f columns first). complex columns are calculated from them
+qcm_interp_cols = ['fs', 'delfs', 'f0s', 'gs', 'delgs', 'g0s']
+
+
+def snapshot_df(df, prev=None, start=0):
+    '''
+    copy of df with the lists in the cells copied too (e.g.: for saving in the background)
+    df.copy() does not copy the lists in the cells (e.g.: fs, gs, marks), which are changed in place by the GUI
+    prev: a snapshot of df taken before. the copied lists of its rows before start (not changed since) are used again
+    start: position of the first row changed after prev was taken
+    '''
+    snapshot = df.copy()
+    if prev is None or not prev.columns.equals(df.columns) or prev.shape[0] < start or not prev.index[:start].equals(df.index[:start]):
+        start = 0 # copy all
+    start = min(start, df.shape[0])
+    for col in snapshot.columns[snapshot.dtypes == object]:
+        cells = np.empty(df.shape[0] - start, dtype=object) # rows changed
+        for i, v in enumerate(df[col].values[start:]):
+            cells[i] = list(v) if isinstance(v, list) else v
+        if start:
+            cells = np.concatenate([prev[col].values[:start], cells])
+        snapshot[col] = pd.Series(cells, index=snapshot.index, dtype=object)
+    return snapshot
+
+
+def write_h5_items(path, items, lock):
+    '''
+    write items [(key, snapshot), ...] to h5 file of path as str datasets
+    snapshot: str or df (serialized to json here). None: delete key from file
+    Each item is written to key + h5_tmp_suffix first and moved to key after it is flushed to disk.
+    So, there is always a complete copy (key or key + h5_tmp_suffix) in the file if the program crashes while writing.
+    '''
+    # serialize before opening file
+    items = [(key, snapshot if (snapshot is None) or isinstance(snapshot, str) else snapshot.to_json()) for key, snapshot in items]
+    # write in crash-safe order
+    items.sort(key=lambda item: [i for i, prefix in enumerate(h5_write_order) if item[0].startswith(prefix)][:1] or [len(h5_write_order)])
+
+    with lock:
+        with h5py.File(path, 'a') as fh:
+            for key, text in items:
+                tmp_key = key + h5_tmp_suffix
+                if tmp_key in fh: # left by a crash
+                    del fh[tmp_key]
+                if text is None: # delete
+                    if key in fh:
+                        del fh[key]
+                    continue
+                fh.create_dataset(tmp_key, data=text, dtype=h5py.special_dtype(vlen=str))
+                fh.flush()
+                if key in fh:
+                    del fh[key]
+                fh.move(tmp_key, key)
+                if key == 'settings' and 'settings_default' in fh: # saved by version < 0.17.0
+                    # it is not necessary, since version >= 0.17.0 saves a copy of information in settings.
+                    del fh['settings_default']
+            fh.flush()
+
+
+class SaveWorker(threading.Thread):
+    '''
+    write-behind thread for DataSaver
+    Snapshots of tables are queued by their key in h5 file (e.g.: 'data/samp') and written in the background.
+    Queuing a key which is still waiting replaces its snapshot (only the latest one is written).
+    '''
+    def __init__(self, lock):
+        super().__init__(name='DataSaverWriter', daemon=True)
+        self._lock = lock # lock for h5 file access
+        self._cond = threading.Condition()
+        self._pending = {} # {path: {key: snapshot}}
+        self._busy = False # writing
+        self._stopflg = False
+        # counters
+        self.nqueued = 0
+        self.ncoalesced = 0 # number of snapshots replaced before written
+        self.nwritten = 0
+        self.t_write = 0 # time used for the last writing in s
+
+
+    def put(self, path, items):
+        '''
+        queue items [(key, snapshot), ...] to write to path
+        '''
+        with self._cond:
+            pending = self._pending.setdefault(path, {})
+            for key, snapshot in items:
+                if key in pending:
+                    self.ncoalesced += 1
+                pending[key] = snapshot
+                self.nqueued += 1
+            self._cond.notify_all()
+
+
+    def run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._stopflg:
+                    self._cond.wait()
+                if not self._pending: # stopped and nothing to write
+                    return
+                pending, self._pending = self._pending, {}
+                self._busy = True
+
+            for path, items in pending.items():
+                t0 = time.time()
+                try:
+                    write_h5_items(path, list(items.items()), self._lock)
+                    self.nwritten += len(items)
+                except Exception as e:
+                    logger.exception('Failed to write %s to %s', list(items.keys()), path)
+                self.t_write = time.time() - t0
+                logger.info('write-behind %s items in %s s', len(items), self.t_write)
+
+            with self._cond:
+                self._busy = False
+                self._cond.notify_all()
+
+
+    def flush(self, timeout=None):
+        '''
+        wait until all queued items are written
+        return True if all are written
+        '''
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending and not self._busy, timeout=timeout)
+
+
+    def stop(self, timeout=None):
+        '''
+        write all queued items and stop the thread
+        '''
+        with self._cond:
+            self._stopflg = True
+            self._cond.notify_all()
+        self.join(timeout=timeout)
+
+
+class HarmonicTable:
+    '''
+    dense arrays of the harmonic columns of one df
+    The columns with a list per row (fs, gs, marks, prop values) are converted 
+    to contiguous (N, n_harm) float64 arrays once and reused until the table
+    is changed (invalidate) or replaced by another df.
+    None in the lists is converted to nan.
+    '''
+    def __init__(self, nharm):
+        self.nharm = nharm # number of harmonics. used for empty df
+        self._df = None # df the arrays built from
+        self._nrows = 0
+        self._start = None # rows from _start are changed or appended
+        self._arrs = {} # {col: ndarray}
+        self.nbuild = 0 # number of arrays built
+
+
+    def invalidate(self, col=None, start=None):
+        '''
+        clear cached array of col. If None, clear all
+        start: if given, only rows from start are changed (or appended) and the
+               arrays are updated from start by the next get
+        '''
+        if start is not None:
+            self._start = start if self._start is None else min(self._start, start)
+        if col is not None:
+            self._arrs.pop(col, None)
+        elif start is None:
+            self._arrs.clear()
+        else:
+            self._arrs.pop(col, None)
+
+
+    def get(self, df, col):
+        '''
+        return the read-only (N, n_harm) array of column col in df
+        '''
+        if self._start is not None: # update changed rows only
+            start = min(self._start, self._nrows, df.shape[0])
+            for key, arr in self._arrs.items():
+                arr = np.concatenate([arr[:start], self.to_array(df[key].iloc[start:], self.nharm)])
+                arr.flags.writeable = False
+                self._arrs[key] = arr
+            self._start = None
+            self._df = df
+            self._nrows = df.shape[0]
+        elif df is not self._df or df.shape[0] != self._nrows: # df replaced
+            self._arrs.clear()
+            self._df = df
+            self._nrows = df.shape[0]
+        arr = self._arrs.get(col)
+        if arr is None:
+            arr = self.to_array(df[col], self.nharm)
+            arr.flags.writeable = False
+            self._arrs[col] = arr
+            self.nbuild += 1
+        return arr
+
+
+    def set(self, df, col, arr):
+        '''
+        set cached array of column col in df with arr which is already saved to df[col]
+        df can be a copy of the df of the table with only col changed. 
+        arrays of the other columns are kept if the number of rows is the same.
+        '''
+        if self._start is not None or df.shape[0] != self._nrows:
+            self._arrs.clear()
+            self._start = None
+        self._df = df
+        self._nrows = df.shape[0]
+        arr = np.ascontiguousarray(arr, dtype=float)
+        arr.flags.writeable = False
+        self._arrs[col] = arr
+
+
+    @staticmethod
+    def to_array(s, nharm):
+        '''
+        convert series of lists s to (N, n_harm) float64 array
+        '''
+        if s.shape[0] == 0:
+            return np.empty((0, nharm), dtype=float)
+        try:
+            arr = np.array(s.values.tolist(), dtype=float) # the dtype=float replace None with np.nan
+        except ValueError: # lists with different length
+            arr = None
+        if arr is None or arr.ndim != 2:
+            arr = np.full((s.shape[0], nharm), np.nan)
+            for i, row in enumerate(s.values):
+                if isinstance(row, (list, tuple, np.ndarray)):
+                    row = np.array(row, dtype=float)[:nharm]
+                    arr[i, :row.size] = row
+        return np.ascontiguousarray(arr)
+
+
+class RefModel:
+    '''
+    reference f0 and g0 of all harmonics for one segment of reference data
+    f and g are stacked in a (2 * n_harm, n_knots) array and evaluated for all harmonics and rows in one call.
+    kind: 'const': mean of the segment (x is not used)
+          kind of scipy.interpolate.interp1d ('linear', 'nearest', 'quadratic', 'cubic', ...): interpolated by x (temperature)
+    out of the range of knots is nan.
+    '''
+    def __init__(self, x, fs, gs, kind='const'):
+        '''
+        x: (n_knots,) array of temperature. not used for kind == 'const'
+        fs, gs: (n_knots, n_harm) arrays of f and g of the reference segment
+        '''
+        fs = np.asarray(fs, dtype=float)
+        gs = np.asarray(gs, dtype=float)
+        self.nharm = fs.shape[1]
+        self.kind = kind
+        self._interps = [] # [(rows of self.y, interp1d), ...] for kind other than 'const' and 'linear'
+
+        if kind == 'const':
+            with warnings.catch_warnings(): # all nan harmonics
+                warnings.simplefilter('ignore', category=RuntimeWarning)
+                self.y = np.concatenate([np.nanmean(fs, axis=0), np.nanmean(gs, axis=0)]) # (2 * n_harm,)
+            return
+
+        x = np.asarray(x, dtype=float)
+        sel = ~np.isnan(x) # knots with temperature
+        order = np.argsort(x[sel], kind='stable')
+        self.x = x[sel][order]
+        self.y = np.concatenate([fs[sel][order], gs[sel][order]], axis=1).T # (2 * n_harm, n_knots)
+
+        if kind != 'linear':
+            # nan in a row spreads to all rows in the spline. So, rows with nan are interpolated separately
+            finite = np.isfinite(self.y).all(axis=1)
+            groups = [np.flatnonzero(finite)] + [[i] for i in np.flatnonzero(~finite & ~np.isnan(self.y).all(axis=1))]
+            from scipy.interpolate import interp1d # imported here for startup time
+            try:
+                self._interps = [(rows, interp1d(self.x, self.y[rows], kind=kind, axis=1, fill_value=np.nan, bounds_error=False, assume_sorted=True)) for rows in groups if len(rows)]
+            except ValueError as err: # not enough knots for kind
+                logger.warning('%s interpolation of reference failed (%s). Use linear.', kind, err)
+                self.kind = 'linear'
+                self._interps = []
+
+
+    def eval(self, x):
+        '''
+        return f0s, g0s as (len(x), n_harm) arrays at x
+        '''
+        x = np.atleast_1d(np.asarray(x, dtype=float))
+        if self.kind == 'const':
+            y = np.broadcast_to(self.y[:, None], (self.y.shape[0], x.size))
+        elif self._interps:
+            y = np.full((self.y.shape[0], x.size), np.nan)
+            for rows, interp in self._interps:
+                y[rows] = interp(x)
+        else:
+            y = self._interp_linear(x)
+        return y[:self.nharm].T.copy(), y[self.nharm:].T.copy()
+
+
+    def _interp_linear(self, x):
+        '''
+        linear interpolation of all rows in self.y at x
+        '''
+        y = np.full((self.y.shape[0], x.size), np.nan)
+        if self.x.size == 0:
+            return y
+        inrange = (x >= self.x[0]) & (x <= self.x[-1]) # nan is out of range
+        xin = x[inrange]
+        i = np.clip(np.searchsorted(self.x, xin, side='right'), 1, max(self.x.size - 1, 1))
+        if self.x.size == 1: # single point
+            y[:, inrange] = self.y[:, [0]]
+            return y
+        x0, x1 = self.x[i - 1], self.x[i]
+        dx = x1 - x0
+        w = np.divide(xin - x0, dx, out=np.zeros_like(xin), where=dx != 0)
+        y0 = self.y[:, i - 1]
+        y[:, inrange] = y0 + (self.y[:, i] - y0) * w
+        return y
+
+
+    def __call__(self, x):
+        '''
+        return [[f1, f3, ...], [g1, g3, ...]] at x as the functions made by DataSaver.make_interpfun
+        '''
+        f0s, g0s = self.eval(x)
+        return [list(f0s.T), list(g0s.T)]
+
+
+def minmax_rows(ys, nbins):
+    '''
+    min/max decimation
+    return sorted positions of the min and max rows of each column of ys in nbins bins of rows and the first and last rows
+    ys: (N, n_cols) array. nan is ignored (bins of a column with all nan are skipped)
+    '''
+    nrows = ys.shape[0]
+    if nrows <= 2 * nbins: # no need to decimate
+        return np.arange(nrows)
+    binsize = int(np.ceil(nrows / nbins))
+    nbins = int(np.ceil(nrows / binsize))
+    pad = nbins * binsize - nrows
+    ys = np.concatenate([ys, np.full((pad, ys.shape[1]), np.nan)]).reshape(nbins, binsize, ys.shape[1])
+    start = np.arange(nbins)[:, None] * binsize # first row of bins
+    valid = ~np.isnan(ys).all(axis=1) # (nbins, n_cols)
+    rows_min = np.argmin(np.where(np.isnan(ys), np.inf, ys), axis=1) + start
+    rows_max = np.argmax(np.where(np.isnan(ys), -np.inf, ys), axis=1) + start
+    return np.unique(np.concatenate([[0, nrows - 1], rows_min[valid], rows_max[valid]]))
+
+
+def budget_rows(select, n, npts, n_min=1):
+    '''
+    decimate with a shared budget of npts rows for all columns
+    select: function of n (bins or points of each column) returning the sorted positions of the union of columns
+    n: n to start with. it is reduced till at most npts rows are selected
+    if more than npts rows are selected with n_min, npts of them are taken evenly
+    '''
+    rows = select(n)
+    while rows.size > npts and n > n_min: # columns share less rows
+        n = max(min(n - 1, n * npts // rows.size), n_min)
+        rows = select(n)
+    if rows.size > npts: # too many columns for npts
+        rows = rows[np.linspace(0, rows.size - 1, npts).astype(int)]
+    return rows
+
+
+def lttb_rows(x, ys, npts):
+    '''
+    largest-triangle-three-buckets decimation
+    return sorted positions of about npts rows selected for each column of ys (union of columns)
+    x: (N,) array
+    ys: (N, n_cols) array. nan rows of a column are not selected for it
+    '''
+    nrows = ys.shape[0]
+    if nrows <= npts or npts < 3: # no need to decimate
+        return np.arange(nrows)
+    edges = np.linspace(1, nrows - 1, npts - 1).astype(int) # buckets between the first and last rows
+    rows = [np.array([0, nrows - 1])]
+    for j in range(ys.shape[1]):
+        y = ys[:, j]
+        valid = np.flatnonzero(~np.isnan(y) & ~np.isnan(x))
+        if valid.size <= npts:
+            rows.append(valid)
+            continue
+        # buckets of valid rows
+        bounds = np.searchsorted(valid, edges)
+        # mean of next buckets
+        sums_x = np.concatenate([[0], np.cumsum(x[valid])])
+        sums_y = np.concatenate([[0], np.cumsum(y[valid])])
+        sel = [valid[0]]
+        for b in range(len(bounds) - 1):
+            lo, hi = bounds[b], bounds[b + 1]
+            if lo >= hi: # empty bucket
+                continue
+            nlo, nhi = hi, bounds[b + 2] if b + 2 < len(bounds) else valid.size
+            if nlo < nhi:
+                xc, yc = (sums_x[nhi] - sums_x[nlo]) / (nhi - nlo), (sums_y[nhi] - sums_y[nlo]) / (nhi - nlo)
+            else: # the last bucket
+                xc, yc = x[valid[-1]], y[valid[-1]]
+            xa, ya = x[sel[-1]], y[sel[-1]]
+            cand = valid[lo:hi]
+            area = np.abs((xa - xc) * (y[cand] - ya) - (xa - x[cand]) * (yc - ya))
+            sel.append(cand[np.argmax(area)])
+        sel.append(valid[-1])
+        rows.append(np.array(sel))
+    return np.unique(np.concatenate(rows))
+
 
 class DataSaver:
     def __init__(self, ver='', settings={}):
@@ -67,6 +479,16 @@ class DataSaver:
 
         self._chn_keys = ['samp', 'ref'] # raw data groups
         self._ref_keys = {'fs': 'f0', 'gs': 'g0'} # corresponding keys storing the reference
+        self._raw_storage_default = { # filters for raw data. overwritten by settings['raw_storage']
+            'compression': None, # None, 'gzip', 'lzf'
+            'compression_opts': None, # level of 'gzip'
+            'shuffle': False, # byte shuffle before compression
+            'f_linear': False, # save linear f as attrs (f_start, f_step) instead of an array
+        }
+        self._raw_chunk_bytes = 1024 * 1024 # maximum size of a raw data chunk in bytes
+        self._f_linear_tol = 1e-6 # in Hz. max deviation of f from linear ramp to be saved as (start, step)
+        self._h5_lock = threading.RLock() # lock for accessing h5 file (shared with self.writer)
+        self.writer = None # write-behind thread (SaveWorker). started by self.start_writer()
         self.ver  = ver # version information
         self.settings = settings
 
@@ -80,6 +502,17 @@ class DataSaver:
         self.mode = ''  # mode of datasaver 'init': new file; 'load': append/load file
         self.path = ''
         self.saveflg = True # flag to show if modified data has been saved to file
+        self._dirty = set() # keys of tables in h5 file modified after last saving. e.g.: 'data/samp', 'prop/samp/353_3'
+        self._deleted = set() # keys of tables in h5 file removed after last saving
+        self._snapshots = {} # {key of table in h5 file: the last snapshot saved (snapshot_df)}
+        self._snapshot_start = {} # {key of table in h5 file: position of the first row changed after the last snapshot}
+        self._harm_tables = {} # {key of table in h5 file: HarmonicTable} dense arrays of harmonic columns
+        self._t_cache = {} # {chn_name: {'df', 'nrows', 't_str', 't_ns', 't_ref', 't_s'}} parsed t of data tables
+        self._t_ref_cache = (None, None) # (strings of t0 and t0_shifted, parsed t_ref)
+        self._data_ver = {} # {chn_name: int} version of data tables. increased when a table is modified
+        self._ref_state = {} # {chn_name: state} state the reference calculated from (self._get_ref_state)
+        self._derived_cache = {} # {chn_name: {'state', 'nrows', 'arrs'}} values calculated from data and reference (self._get_derived_arr)
+        self._open_rows = {} # {chn_name: position of the row being acquired}. rows before it are not changed by acquisition
         self.refflg = {chn_name: False for chn_name in self._chn_keys} # flag if the reference has been set
         self.queue_list = []
         # following attributes will be save in file
@@ -233,81 +666,111 @@ class DataSaver:
         mech_key = self.get_mech_key(nhcalc)
         logger.info(mech_key) 
 
+        data_queue_id = getattr(self, chn_name)['queue_id'].values.astype(int)
+        cols = data_keys + mech_keys_single + mech_keys_multiple
+
         if mech_key in getattr(self, chn_name + '_prop').keys():
             logger.info('mech_key exists') 
-            df_mech = getattr(self, chn_name + '_prop')[mech_key].copy()
-            logger.info(df_mech.head()) 
-            logger.info(df_mech.columns) 
-            mech_queue_id = df_mech['queue_id']
-            data_queue_id = getattr(self, chn_name)['queue_id']
-            # logger.info(mech_queue_id) 
-            # logger.info(data_queue_id) 
+            df_mech = getattr(self, chn_name + '_prop')[mech_key]
+            mech_queue_id = df_mech['queue_id'].values.astype(int)
+            changed = False
             
             # add missed columns
-            exisit_cols = df_mech.columns
-            for col in mech_keys_single:
-                if col not in exisit_cols: # previous version w/ new column in the current list
-                    logger.info('col %s not in df_mech', col)
-                    df_mech[col] = np.nan
-                    df_mech[col] = df_mech[col].apply(lambda x: self.nan_harm_list()) # add list of nan to all null
-            for col in mech_keys_multiple:
-                if col not in exisit_cols: # previous version w/ new column in the current list
-                    logger.info('col %s not in df_mech', col)
-                    df_mech[col] = np.nan
-                    df_mech[col] = df_mech[col].apply(lambda x: self.nan_harm_list()) # add 
-            logger.info(df_mech) 
+            missed_cols = [col for col in mech_keys_single + mech_keys_multiple if col not in df_mech.columns] # previous version w/ new column in the current list
+            if missed_cols:
+                logger.info('cols %s not in df_mech', missed_cols)
+                df_mech = df_mech.copy()
+                for col in missed_cols:
+                    df_mech[col] = self._nan_harm_lists(df_mech.shape[0]) # add list of nan to all rows
+                changed = True
 
             # check if queue_id is the same as self.chn_name
-            if mech_queue_id.equals(data_queue_id):
-
-                return df_mech
-            else:
-                # delete the extra queue_id
-                df_mech = df_mech[df_mech['queue_id'].isin(set(mech_queue_id) & set(data_queue_id))]
-                # add the missed queue_id, this will leave other columns as NA
-                # df_mech = df_mech.append(pd.DataFrame.from_dict(dict(queue_id=list(set(data_queue_id) - set(mech_queue_id)))), ignore_index = True)
-                # logger.info(df_mech) 
-                # logger.info(data_queue_id[data_queue_id.isin(set(data_queue_id) - set(mech_queue_id))].to_frame()) 
-                df_mech = df_mech.merge(data_queue_id[data_queue_id.isin(set(data_queue_id) - set(mech_queue_id))].to_frame(), how='outer')
-                logger.info(df_mech) 
-                # replace na with self.nan_harm_list
-                for col in mech_keys_single:
-                    logger.info('col: %s; type: %s', col, type(df_mech[col]))
-                    #TODO error here: use a.all() or a.any()
-                    df_mech[col] = df_mech[col].apply(lambda x: self.nan_harm_list() if np.isnan(x).all() else x) # add list of nan to all null
-                for col in mech_keys_multiple:
-                    df_mech[col] = df_mech[col].apply(lambda x: self.nan_harm_list() if np.isnan(x).all() else x) # add list of nan to all null
-                logger.info(df_mech) 
+            n_mech = mech_queue_id.size
+            if np.array_equal(mech_queue_id, data_queue_id[:n_mech]): # same or new queues appended (e.g.: after acquisition)
+                if data_queue_id.size > n_mech: # append rows of the new queue_id only
+                    logger.info('append %s queues to %s', data_queue_id.size - n_mech, mech_key)
+                    df_mech = pd.concat([df_mech, self._nan_mech_rows(data_queue_id[n_mech:], df_mech.columns)], ignore_index=True)
+                    if not changed: # only the new rows need to be flagged
+                        self.update_mech_df_in_prop(chn_name, nhcalc, df_mech, rows=range(n_mech, df_mech.shape[0]))
+                        return snapshot_df(df_mech)
+                    changed = True
+            else: # queues deleted or reordered
+                logger.info('reshape %s to %s queues', mech_key, data_queue_id.size)
+                # positions of data queue_id in df_mech. -1 if missed
+                pos = pd.Index(mech_queue_id).get_indexer(data_queue_id)
+                # delete the extra queue_id and keep the order of data
+                df_mech = df_mech.iloc[pos[pos >= 0]]
+                # add the missed queue_id
+                df_mech = pd.concat([df_mech, self._nan_mech_rows(data_queue_id[pos < 0], df_mech.columns)], ignore_index=True)
+                # sort rows in the order of data
+                order = np.argsort(np.concatenate([np.flatnonzero(pos >= 0), np.flatnonzero(pos < 0)]), kind='stable')
+                df_mech = df_mech.iloc[order].reset_index(drop=True)
+                changed = True
+
+            if not changed: # nothing to update
+                return snapshot_df(df_mech)
         else: # not exist, make a new dataframe
             logger.info('mech_key does not exist') 
-            df_mech = pd.DataFrame(columns=data_keys+mech_keys_single+mech_keys_multiple)
-
-            # set values
-            nrows = len(getattr(self, chn_name)['queue_id'])
-            nan_list = [self.nan_harm_list()] * nrows 
-            logger.info(nan_list) 
-            df_mech['queue_id'] = getattr(self, chn_name)['queue_id']
-            df_mech['queue_id'] = df_mech['queue_id'].astype('int')
-            # df_mech['t'] = getattr(self, chn_name)['t']
-            # df_mech['temp'] = getattr(self, chn_name)['temp']
-            for df_key in mech_keys_single:
-                # df_mech[df_key] = np.nan
-                df_mech[df_key] = nan_list
-            for df_key in mech_keys_multiple:
-                df_mech[df_key] = nan_list
-
-        logger.info(df_mech['delf_calcs'].head) 
+            df_mech = self._nan_mech_rows(data_queue_id, cols)
 
         # set it to class
         self.update_mech_df_in_prop(chn_name, nhcalc, df_mech)
 
-        return getattr(self, chn_name + '_prop')[mech_key].copy()
+        # the lists in cells are copied. they are changed in place by the caller
+        return snapshot_df(getattr(self, chn_name + '_prop')[mech_key])
+
+
+    def _nan_harm_lists(self, n):
+        '''
+        return a list of n lists of nan for harmonics (a new list for each row)
+        '''
+        return [self.nan_harm_list() for _ in range(n)]
+
+
+    def _nan_mech_rows(self, queue_ids, cols):
+        '''
+        return a df of prop with rows of queue_ids and list of nan in the other columns cols
+        '''
+        df = pd.DataFrame({col: self._nan_harm_lists(len(queue_ids)) for col in cols if col != 'queue_id'}, columns=cols)
+        df['queue_id'] = np.asarray(queue_ids, dtype=int)
+        return df
+
+
+    @contextlib.contextmanager
+    def _open_h5(self, mode='r', path=None):
+        '''
+        open h5 file (self.path by default) with self._h5_lock
+        '''
+        with self._h5_lock:
+            with h5py.File(path or self.path, mode) as fh:
+                yield fh
+
+
+    def _h5_keys(self, group):
+        '''
+        return the set of names in h5 group
+        names of datasets which were not replaced because of a crash (with h5_tmp_suffix) are counted as their original names
+        '''
+        return {key[:-len(h5_tmp_suffix)] if key.endswith(h5_tmp_suffix) else key for key in group.keys()}
+
+
+    def _h5_get(self, group, key):
+        '''
+        return group[key]
+        if it doesn't exist (crashed while saving), return the complete copy saved with h5_tmp_suffix
+        '''
+        if key in group:
+            return group[key]
+        return group[key + h5_tmp_suffix]
 
 
     def init_file(self, path, settings, t0):
         '''
         initiate hdf5 file for data saving
         '''
+        # write queued data before the file is changed
+        self.flush()
+
         # initiated attributes
         self._init_attrs()
 
@@ -327,7 +790,7 @@ class DataSaver:
 
         # create groups for raw data
         # dt = h5py.special_dtype(vlen=str)
-        with h5py.File(path, 'w') as fh:
+        with self._open_h5('w', path=path) as fh:
             fh.create_group('data')
             fh.create_group('raw')
             fh.create_group('prop')
@@ -336,13 +799,16 @@ class DataSaver:
         self._save_ver()
         logger.info(self.ver) 
         # save settings here to make sure the data file has enough information for reading later, even though the program crashes while running
-        self.save_data_settings(settings=self.settings)
+        self.save_data_settings(settings=self.settings, force=True)
 
 
     def load_file(self, path):
         '''
         load data information from exist hdf5 file
         '''
+        # write queued data before reading
+        self.flush()
+
         self._init_attrs()
 
         self.mode = 'load'
@@ -354,13 +820,13 @@ class DataSaver:
             return {}
 
         # get data information
-        with h5py.File(self.path, 'r') as fh:
+        with self._open_h5('r') as fh:
             key_list = list(fh.keys())
             logger.info(key_list) 
            
             dump_exp_ref = self._make_exp_ref()
-            if 'exp_ref' in fh.keys():
-                self.exp_ref = json.loads(fh['exp_ref'][()])
+            if 'exp_ref' in self._h5_keys(fh):
+                self.exp_ref = json.loads(self._h5_get(fh, 'exp_ref')[()])
                 self.exp_ref.pop('func', None)
                 for key, val in dump_exp_ref.items():
                     if key not in self.exp_ref:
@@ -380,21 +846,20 @@ class DataSaver:
             # self.queue_list = list(fh['raw/samp'].keys())
             # self.queue_list = [int(s) for s in fh['raw/samp'].keys()]
 
-            logger.info(fh['data/samp'][()]) 
             for chn_name in self._chn_keys:
                 # df for data from samp/ref chn
-                setattr(self, chn_name, pd.read_json(fh['data/' + chn_name][()]).sort_values(by=['queue_id'])) 
+                setattr(self, chn_name, pd.read_json(self._h5_get(fh['data'], chn_name)[()]).sort_values(by=['queue_id'])) 
                 
                 # df for data form samp_ref/ref_ref chn
-                if chn_name + '_ref' in fh['data'].keys():
-                    setattr(self, chn_name + '_ref', pd.read_json(fh['data/' + chn_name + '_ref'][()]).sort_values(by=['queue_id'])) 
+                if chn_name + '_ref' in self._h5_keys(fh['data']):
+                    setattr(self, chn_name + '_ref', pd.read_json(self._h5_get(fh['data'], chn_name + '_ref')[()]).sort_values(by=['queue_id'])) 
                 else:
                     setattr(self, chn_name + '_ref', self._make_df())
 
                 # load prop
                 if ('prop' in fh.keys()) and (chn_name in fh['prop'].keys()): # prop exists
-                    for mech_key in fh['prop/' + chn_name].keys():
-                        getattr(self, chn_name + '_prop')[mech_key] = pd.read_json(fh['prop/' + chn_name + '/' + mech_key][()]).sort_values(by=['queue_id']) 
+                    for mech_key in self._h5_keys(fh['prop/' + chn_name]):
+                        getattr(self, chn_name + '_prop')[mech_key] = pd.read_json(self._h5_get(fh['prop/' + chn_name], mech_key)[()]).sort_values(by=['queue_id']) 
                 
                 
             # replace None with nan in self.samp and self.ref
@@ -420,6 +885,11 @@ class DataSaver:
 
             self.raw  = {} # raw data from last queue
 
+            # data in memory is the same as in file
+            self._dirty.clear()
+            self._deleted.clear()
+            self._snapshots.clear()
+            self._snapshot_start.clear()
             self.saveflg = True
 
             # logger.info(self.samp) 
@@ -430,8 +900,8 @@ class DataSaver:
         check if the file is generated by this program and 
         return boolean
         '''
-        with h5py.File(path, 'r') as fh:
-            key_list = list(fh.keys())
+        with self._open_h5('r', path=path) as fh:
+            key_list = list(self._h5_keys(fh))
             attr_list = list(fh.attrs)
         
         if set(['data', 'exp_ref', 'raw', 'settings']).issubset(key_list) and set(['ver']).issubset(attr_list):
@@ -450,8 +920,8 @@ class DataSaver:
             return
 
         try: # try to load settings from file
-            with h5py.File(path, 'r') as fh:
-                settings = json.loads(fh['settings'][()])
+            with self._open_h5('r', path=path) as fh:
+                settings = json.loads(self._h5_get(fh, 'settings')[()])
                 if 'settings_init' in fh.keys(): # saved by version < 0.17.0
                     settings_init = json.loads(fh['settings_init'][()])
                     for key, val in settings_init.items():
@@ -503,7 +973,7 @@ class DataSaver:
         if temp is not None:
             self.update_queue_col(chn_name, queue_id, 'temp', temp)
 
-        self.saveflg = False
+        self._set_dirty('data/' + chn_name, rows=np.flatnonzero(getattr(self, chn_name).queue_id.values == queue_id))
 
 
     def dynamic_save(self, chn_names, harm_list, t='', temp=np.nan, f=None, G=None, B=None, fs=[np.nan], gs=[np.nan], marks=[0]):
@@ -529,7 +999,8 @@ class DataSaver:
         # save raw data to file by chn_names
         self._save_raw(chn_names, harm_list, t=t, temp=temp, f=f, G=G, B=B)
 
-        self.saveflg = False
+        for chn_name in chn_names: # only the last row is changed
+            self._set_dirty('data/' + chn_name, rows=[getattr(self, chn_name).shape[0] - 1], acquiring=True)
 
 
     def _append_new_queue(self, chn_names, queue_id=None):
@@ -570,10 +1041,60 @@ class DataSaver:
             })
             # append empty data to chn_name
             setattr(self, chn_name, getattr(self, chn_name).append(data_new, ignore_index=True))
+            self._open_rows[chn_name] = getattr(self, chn_name).shape[0] - 1
+            self._set_dirty('data/' + chn_name, rows=[self._open_rows[chn_name]], acquiring=True)
         
         return queue_id
 
 
+    def _save_queues_bulk(self, chn_name, harm_list, t, temp, fs, gs, queue_ids=None):
+        '''
+        append many queues (rows) to self.<chn_name> in one pass (e.g.: importing data from other software)
+        NOTE: raw data is not saved. Use dynamic_save for data with raw spectra
+        harm_list: list of str ['1', '3', '5', '7', '9']
+        t: (N,) str
+        temp: (N,) float
+        fs, gs: (N, len(harm_list)) arrays of harmonics in harm_list
+        queue_ids: (N,) int. If None, continue from max(self.queue_list)
+        marks of harmonics in harm_list are set to 0
+        return: queue_ids
+        '''
+        nrows = len(t)
+        if queue_ids is None: # add new ids
+            start = max(self.queue_list) + 1 if self.queue_list else 0
+            queue_ids = np.arange(start, start + nrows)
+
+        # put harmonics in harm_list to the columns of all harmonics
+        harm_cols = [int((int(harm) - 1) / 2) for harm in harm_list]
+        arrs = {col: np.full((nrows, len(self.nan_harm_list())), np.nan) for col in ['marks', 'fs', 'gs']}
+        arrs['marks'][:, harm_cols] = 0
+        arrs['fs'][:, harm_cols] = np.asarray(fs, dtype=float)
+        arrs['gs'][:, harm_cols] = np.asarray(gs, dtype=float)
+
+        data_new = pd.DataFrame({
+            'queue_id': np.asarray(queue_ids, dtype=int),  
+            't': list(t), # str
+            'temp': np.asarray(temp, dtype=float), # float
+            'marks': arrs['marks'].tolist(),
+            'fs': arrs['fs'].tolist(),
+            'gs': arrs['gs'].tolist(),
+        })
+        df = getattr(self, chn_name)
+        nrows_old = df.shape[0]
+        df = pd.concat([df, data_new], ignore_index=True) if nrows_old else data_new
+        setattr(self, chn_name, df)
+        self.queue_list.extend(data_new['queue_id'].tolist())
+        self._set_dirty('data/' + chn_name)
+
+        if nrows_old == 0: # keep the arrays in cache
+            if 'data/' + chn_name not in self._harm_tables:
+                self._harm_tables['data/' + chn_name] = HarmonicTable(len(self.nan_harm_list()))
+            for col, arr in arrs.items():
+                self._harm_tables['data/' + chn_name].set(df, col, arr)
+
+        return queue_ids
+
+
     def _save_queue_data(self, chn_names, harm_list, queue_id=None, t=np.nan, temp=np.nan, fs=[np.nan], gs=[np.nan], marks=[0]):
         '''
         NOTE: only update one test a time
@@ -640,7 +1161,7 @@ class DataSaver:
         '''
 
         t0 = time.time()
-        with h5py.File(self.path, 'a') as fh:
+        with self._open_h5('a') as fh:
             for chn_name in chn_names:
                 # creat group for test
                 g_queue = fh.create_group('raw/' + chn_name + '/' + str(max(self.queue_list)))
@@ -653,52 +1174,183 @@ class DataSaver:
 
                 for harm in harm_list:
                     # create data_set for f, G, B of the harm
-                    g_queue.create_dataset(harm, data=np.stack((f[chn_name][harm], G[chn_name][harm], B[chn_name][harm]), axis=0))
+                    self._create_raw_dataset(g_queue, harm, f[chn_name][harm], G[chn_name][harm], B[chn_name][harm])
         t1 = time.time()
         logger.info(t1 - t0) 
 
 
-    def save_data(self):
+    def _get_raw_storage(self):
+        '''
+        return the filters for saving raw data from self.settings['raw_storage'] with defaults
+        '''
+        raw_storage = self._raw_storage_default.copy()
+        raw_storage.update(self.settings.get('raw_storage', None) or {})
+        return raw_storage
+
+
+    def _raw_chunks(self, shape, itemsize):
+        '''
+        return chunk shape for a raw dataset with shape (nrows, npts)
+        one chunk holds the whole spectrum unless it is larger than self._raw_chunk_bytes
+        '''
+        nrows, npts = shape
+        npts_chunk = max(1, min(npts, self._raw_chunk_bytes // (nrows * itemsize)))
+        return (nrows, npts_chunk)
+
+
+    def _f_linear_params(self, f):
+        '''
+        return (f_start, f_step) if f is a linear ramp within self._f_linear_tol
+        else return None
+        '''
+        f = np.asarray(f, dtype=float)
+        if f.ndim != 1 or f.size < 2 or not np.isfinite(f).all():
+            return None
+        f_step = (f[-1] - f[0]) / (f.size - 1)
+        if np.abs(f - (f[0] + f_step * np.arange(f.size))).max() > self._f_linear_tol:
+            return None
+        return f[0], f_step
+
+
+    def _create_raw_dataset(self, g_queue, harm, f, G, B):
+        '''
+        create dataset of raw data (f, G, B) of harm in group g_queue with filters from self._get_raw_storage()
+        the dataset is [f, G, B] (3, npts) or [G, B] (2, npts) with attrs f_start and f_step if f_linear is set and f is linear
+        '''
+        raw_storage = self._get_raw_storage()
+
+        f_params = self._f_linear_params(f) if raw_storage['f_linear'] else None
+        if f_params is None: # save f as array
+            data = np.stack((f, G, B), axis=0)
+        else:
+            data = np.stack((G, B), axis=0)
+
+        if data.ndim != 2: # no raw data (e.g. imported data with nan placeholder)
+            ds = g_queue.create_dataset(harm, data=data)
+        elif raw_storage['compression'] or raw_storage['shuffle']:
+            ds = g_queue.create_dataset(
+                harm,
+                data=data,
+                chunks=self._raw_chunks(data.shape, data.dtype.itemsize),
+                compression=raw_storage['compression'],
+                compression_opts=raw_storage['compression_opts'] if raw_storage['compression'] == 'gzip' else None,
+                shuffle=raw_storage['shuffle'],
+            )
+        else: # contiguous (can be memory mapped)
+            ds = g_queue.create_dataset(harm, data=data)
+
+        if f_params is not None:
+            ds.attrs['f_start'], ds.attrs['f_step'] = f_params
+        return ds
+
+
+    def _read_raw_dataset(self, ds):
+        '''
+        return raw data in ds as array (3, npts) [f, G, B]
+        f is regenerated if it is saved as f_start and f_step
+        '''
+        if 'f_step' not in ds.attrs: # f saved as array
+            return ds[()]
+        raw = np.empty((3, ds.shape[1]), dtype=float)
+        ds.read_direct(raw, dest_sel=np.s_[1:, :])
+        raw[0, :] = self._linear_f(ds)
+        return raw
+
+
+    def _linear_f(self, ds):
+        '''
+        return f of raw dataset ds saved as f_start and f_step
+        '''
+        return ds.attrs['f_start'] + ds.attrs['f_step'] * np.arange(ds.shape[1])
+
+
+    def _set_dirty(self, *keys, rows=None, col=None, acquiring=False):
+        '''
+        flag tables modified. they will be written by the next saving
+        keys: keys of the tables in h5 file. e.g.: 'data/samp', 'data/samp_ref', 'prop/samp/353_3'
+        rows: list of positions of the rows changed or appended (e.g.: in acquisition). 
+              cached arrays of the other rows are kept. 
+              If None, any rows may be changed and all cached arrays of the tables are cleared.
+        col: if given, only column col is changed (e.g.: 'marks')
+        acquiring: True if only the row being acquired (_append_new_queue) is changed.
+              otherwise, the row is not being acquired anymore
+        '''
+        self._dirty.update(keys)
+        self._deleted.difference_update(keys)
+        start = min(rows) if (rows is not None) and len(rows) else None
+        for key in keys: # cached arrays are not valid anymore
+            self._snapshot_start[key] = 0 if start is None else min(self._snapshot_start.get(key, start), start)
+            if key in self._harm_tables:
+                self._harm_tables[key].invalidate(col=col, start=start)
+            if key.startswith('data/'):
+                chn_name = key[5:]
+                if col == 'marks': # marks are not used by the reference and derived values
+                    continue
+                if chn_name in self._t_cache: # check t strings by the next call
+                    self._t_cache[chn_name]['df'] = None
+                if not acquiring: # changed by other functions (e.g.: refit)
+                    self._open_rows.pop(chn_name, None)
+                dependents = self._ref_dependents(chn_name, rows) # channels use the changed rows as reference
+                if (start is None) or (start < self._open_rows.get(chn_name, np.inf)) or dependents: # reference and derived values need to be recalculated
+                    for chn in set([chn_name] + dependents):
+                        self._data_ver[chn] = self._data_ver.get(chn, 0) + 1
+                elif chn_name in self._derived_cache: # only rows being acquired changed. update them only
+                    cache = self._derived_cache[chn_name]
+                    cache['nrows'] = min(cache['nrows'], start)
+        self.saveflg = False
+
+
+    def _ref_dependents(self, chn_name, rows=None):
+        '''
+        return list of channels whose reference is calculated from rows (positions) of chn_name
+        rows: if None, all rows
+        '''
+        dependents = []
+        for chn in self._chn_keys:
+            ref = self.exp_ref.get(chn + '_ref')
+            if not ref or ref[0] != chn_name:
+                continue
+            if rows is None:
+                dependents.append(chn)
+                continue
+            idx = [i for l in ref[1] for i in (l if isinstance(l, list) else [l])]
+            if not idx or any(i is None for i in idx): # reference point by point
+                dependents.append(chn)
+            elif np.isin(rows, getattr(self, chn_name).index.get_indexer(idx)).any():
+                dependents.append(chn)
+        return dependents
+
+
+    def end_acquisition(self):
+        '''
+        no row is being acquired anymore (test stopped)
+        '''
+        self._open_rows.clear()
+
+
+    def _pop_dirty(self, keys, force=False):
+        '''
+        return keys which need to be saved and clear their flags
+        force: if True, return all keys
+        '''
+        if not force:
+            keys = [key for key in keys if key in self._dirty]
+        self._dirty.difference_update(keys)
+        return keys
+
+
+    def save_data(self, force=False):
         '''
         save samp (df), ref (df) to h5 file serializing with json
+        only tables modified after last saving are written
+        force: if True, write all tables
         '''
-        with h5py.File(self.path, 'a') as fh:
-            for key in self._chn_keys:
-                logger.info(key) 
-                # logger.info(fh['data/' + key]) 
-                if key in fh['data']:
-                    data = fh['data/' + key]
-                    # logger.info(data) 
-                    # logger.info(data[()]) 
-                    data[()] = getattr(self, key).to_json()
-                else:
-                    fh.create_dataset('data/' + key, data=getattr(self, key).to_json(), dtype=h5py.special_dtype(vlen=str)) 
-                if key + '_ref' in fh['data']:
-                    data_ref = fh['data/' + key + '_ref']
-                    # logger.info(data_ref[()]) 
-                    data_ref[()] = getattr(self, key + '_ref').to_json()
-                else:
-                    fh.create_dataset('data/' + key + '_ref', data=getattr(self, key + '_ref').to_json(), dtype=h5py.special_dtype(vlen=str))
-        
-        # following is using delete/create protocal
-        """ with h5py.File(self.path, 'a') as fh:
-            for key in self._chn_keys:
-                logger.info(key) 
-                # logger.info(fh['data/' + key]) 
-                if key in fh['data']:
-                    del fh['data/' + key]
-                if key + '_ref' in fh['data']:
-                    del fh['data/' + key + '_ref']
-                logger.info(json.dumps(getattr(self, key).to_dict())) 
-                # fh['data/' + key] = json.dumps(getattr(self, key).to_dict())        
-                fh.create_dataset('data/' + key, data=getattr(self, key).to_json(), dtype=h5py.special_dtype(vlen=str))  
-
-                # save <key>_ref
-                logger.info(getattr(self, key + '_ref').columns) 
-                logger.info(getattr(self, key + '_ref').head()) 
-                logger.info(getattr(self, key + '_ref').head().to_json()) 
-                data_ref = getattr(self, key + '_ref').to_json()
-                fh.create_dataset('data/' + key + '_ref', data=data_ref, dtype=h5py.special_dtype(vlen=str)) """ 
+        keys = []
+        for key in self._chn_keys:
+            keys.extend(['data/' + key, 'data/' + key + '_ref'])
+        keys = self._pop_dirty(keys, force=force)
+        logger.info('save %s', keys) 
+        self._save_items([(key, self._snapshot(key, getattr(self, key.split('/')[-1]))) for key in keys])
 
 
     def save_settings(self, settings={}):
@@ -708,91 +1360,117 @@ class DataSaver:
         if not settings:
             settings = self.settings
 
-        with h5py.File(self.path, 'a') as fh:
-            if 'settings' in fh:
-                data_settings =  fh['settings']
-                data_settings[()] = json.dumps(settings)
-            else:
-                fh.create_dataset('settings', data=json.dumps(settings))
-            # delete/create protocal
-            # if 'settings' in fh:
-            #     del fh['settings']
-            # fh.create_dataset('settings', data=json.dumps(settings))
-            if 'settings_default' in fh: # saved by version < 0.17.0
-                # it is not necessary, since version >= 0.17.0 saves a copy of information in settings.
-                del fh['settings_default']
+        self._save_items([('settings', json.dumps(settings))])
 
 
-    def save_data_settings(self, settings={}):
+    def save_data_settings(self, settings={}, force=False):
         '''
         wrap up of save_data and save_settings and save_exp_ref
+        force: if True, write all tables even they are not modified
         '''
-        self.save_data()
+        self.save_data(force=force)
         if not settings:
             settings = self.settings
         self.save_settings(settings=settings)
-        self.save_prop()
+        self.save_prop(force=force)
         self.save_exp_ref()
         self.saveflg = True
 
 
-    def save_prop(self):
+    def save_prop(self, force=False):
         '''
         save prop data to file
+        only mech_df modified after last saving are written and removed ones are deleted from file
+        force: if True, write all mech_df
         '''
-        with h5py.File(self.path, 'a') as fh:
-            for chn_name in self._chn_keys:
-                for mech_key, mech_df in getattr(self, chn_name + '_prop').items():
-                    if ('prop' not in fh.keys()) or (chn_name not in fh['prop'].keys()):
-                        fh.create_dataset('prop/' + chn_name + '/' + mech_key, data=mech_df.to_json(), dtype=h5py.special_dtype(vlen=str))
-                    else: 
-                        if mech_key in fh['prop/' + chn_name].keys():
-                            data_prop = fh['prop/' + chn_name + '/' + mech_key]
-                            data_prop[()] = mech_df.to_json()
-                        else:
-                            # create data_set for mech_df
-                            fh.create_dataset('prop/' + chn_name + '/' + mech_key, data=mech_df.to_json(), dtype=h5py.special_dtype(vlen=str))
-
-                        # delete/create protocal
-                        # if mech_key in fh['prop/' + chn_name].keys():
-                        #     del fh['prop/' + chn_name + '/' + mech_key]
-                        # else:
-                        # # create data_set for mech_df
-                        # fh.create_dataset('prop/' + chn_name + '/' + mech_key, data=mech_df.to_json(), dtype=h5py.special_dtype(vlen=str))
+        keys = []
+        for chn_name in self._chn_keys:
+            keys.extend(['prop/' + chn_name + '/' + mech_key for mech_key in getattr(self, chn_name + '_prop').keys()])
+        keys = self._pop_dirty(keys, force=force)
+        logger.info('save %s', keys) 
+        items = [(key, self._snapshot(key, getattr(self, key.split('/')[1] + '_prop')[key.split('/')[2]])) for key in keys]
+
+        # delete removed mech_df
+        items.extend([(key, None) for key in self._deleted])
+        self._deleted.clear()
+
+        self._save_items(items)
 
 
     def save_exp_ref(self):
-        with h5py.File(self.path, 'a') as fh:
-            # save reference
+        # make a copy for saving
+        exp_ref = self.exp_ref.copy()
+        # set func = {} in exp_ref which cannot be saved as text
+        exp_ref['func'] = {}
 
-            # make a copy for saving
-            exp_ref = self.exp_ref.copy()
-            # set func = {} in exp_ref which cannot be saved as text
-            exp_ref['func'] = {}
+        logger.info(self.exp_ref) 
+        self._save_items([('exp_ref', json.dumps(exp_ref))])
+
+
+    def _snapshot(self, key, df):
+        '''
+        return a copy of table df of key for saving (snapshot_df)
+        only the lists of the rows changed (_set_dirty) after the last snapshot of key are copied
+        '''
+        snapshot = snapshot_df(df, prev=self._snapshots.get(key), start=self._snapshot_start.pop(key, 0))
+        self._snapshots[key] = snapshot
+        return snapshot
+
+
+    def _save_items(self, items):
+        '''
+        save items to file. 
+        items: list of (key, snapshot). snapshot is a str or a copy of df by _snapshot (serialized to json when writing)
+        if the write-behind thread is running, the items are queued and written in the background
+        otherwise, they are written here
+        '''
+        if not items:
+            return
+        if self.writer is not None and self.writer.is_alive():
+            self.writer.put(self.path, items)
+        else:
+            write_h5_items(self.path, items, self._h5_lock)
+
+
+    def start_writer(self):
+        '''
+        start the write-behind thread. 
+        After it starts, save_data, save_settings, save_prop and save_exp_ref return without waiting for the file writing
+        '''
+        if self.writer is None or not self.writer.is_alive():
+            self.writer = SaveWorker(self._h5_lock)
+            self.writer.start()
 
-            logger.info(self.exp_ref) 
-            if 'exp_ref' in fh:
-                data_exp_ref =  fh['exp_ref']
-                data_exp_ref[()] = json.dumps(exp_ref)
-            else:
-                fh.create_dataset('exp_ref',data=json.dumps(exp_ref))
 
-            # delete/create protocal
-            # if 'exp_ref' in fh:
-            #     del fh['exp_ref']
-            # fh.create_dataset('exp_ref',data=json.dumps(exp_ref))
+    def stop_writer(self, timeout=None):
+        '''
+        write all queued items to file and stop the write-behind thread
+        '''
+        if self.writer is not None:
+            self.writer.stop(timeout=timeout)
+            self.writer = None
+
+
+    def flush(self, timeout=None):
+        '''
+        wait until all queued items are written to file
+        return True if all are written
+        '''
+        if self.writer is not None:
+            return self.writer.flush(timeout=timeout)
+        return True
 
 
     def _save_ver(self):
         '''
         save ver (str) to file
         '''
-        with h5py.File(self.path, 'a') as fh:
+        with self._open_h5('a') as fh:
             fh.attrs['ver'] = self.ver
 
 
     def get_chn_queue_list_from_raw(self, chn_name):
-        with h5py.File(self.path, 'r') as fh:
+        with self._open_h5('r') as fh:
             chn_queue_list = list(fh['raw/'+ chn_name].keys())
             chn_queue_list = list(map(int, chn_queue_list)) # convert from str to int
             logger.info(chn_queue_list)
@@ -800,7 +1478,7 @@ class DataSaver:
 
 
     def get_queue_id_harms_from_raw(self, chn_name, queue_id):
-        with h5py.File(self.path, 'r') as fh:
+        with self._open_h5('r') as fh:
             harms = list(fh['raw/'+ chn_name + '/' + str(queue_id)].keys())
         return [str(harm) for harm in harms]
 
@@ -819,16 +1497,22 @@ class DataSaver:
     def get_raw(self, chn_name, queue_id, harm, with_t_temp=False):
         '''
         return a set of raw data (f, G, B) or (f, G, B, t, temp)
+        f, G, B are None if the raw data doesn't exist (e.g.: queues imported by _save_queues_bulk)
         '''
-        with h5py.File(self.path, 'r') as fh:
-            t = fh['raw/' + chn_name + '/' + str(int(queue_id))].attrs['t']
-            if 'temp' in fh['raw/' + chn_name + '/' + str(int(queue_id))].attrs.keys():
-                temp = fh['raw/' + chn_name + '/' + str(int(queue_id))].attrs['temp']
-            else:
-                temp = np.nan
+        with self._open_h5('r') as fh:
+            if self._raw_exists(fh, chn_name, queue_id): # raw group of queue exists
+                t = fh['raw/' + chn_name + '/' + str(int(queue_id))].attrs['t']
+                if 'temp' in fh['raw/' + chn_name + '/' + str(int(queue_id))].attrs.keys():
+                    temp = fh['raw/' + chn_name + '/' + str(int(queue_id))].attrs['temp']
+                else:
+                    temp = np.nan
+            else: # use t and temp of data
+                df_queue = self.get_queue(chn_name, queue_id)
+                t = df_queue.t.iloc[0] if df_queue.shape[0] else np.nan
+                temp = df_queue.temp.iloc[0] if df_queue.shape[0] else np.nan
 
             if self._raw_exists(fh, chn_name, queue_id, harm): # raw data exist
-                raw = fh['raw/' + chn_name + '/' + str(int(queue_id)) + '/' + harm][()]
+                raw = self._read_raw_dataset(fh['raw/' + chn_name + '/' + str(int(queue_id)) + '/' + harm])
                 self.raw = {
                     'f': raw[0, :],
                     'G': raw[1, :],
@@ -845,22 +1529,131 @@ class DataSaver:
 
         if with_t_temp:
             return [self.raw['f'], self.raw['G'], self.raw['B'], t, temp]
-        else: 
+        else:
             return [self.raw['f'], self.raw['G'], self.raw['B']]
 
 
-    def _raw_exists(self, file_handle, chn_name, queue_id, harm):
+    def _raw_offset(self, ds):
+        '''
+        return the byte offset of dataset ds in the file if it is stored contiguously without filters
+        return None if the dataset cannot be mapped directly (chunked, compressed or not allocated)
+        '''
+        if ds.chunks is not None or ds.compression is not None:
+            return None
+        return ds.id.get_offset()
+
+
+    def get_raw_view(self, chn_name, queue_id, harm):
+        '''
+        return raw data of ONE QUEUE as an array (3, npts) [f, G, B] without reading it into memory
+        the array is a read-only np.memmap over the dataset in the h5 file if it is stored contiguously.
+        otherwise (chunked/compressed or f saved as f_start and f_step) a copy of the data is returned.
+        return None if the raw data doesn't exist
+        NOTE: release the returned memmap before the file is modified (e.g. deleting raw data)
+        '''
+        with self._open_h5('r') as fh:
+            if not self._raw_exists(fh, chn_name, queue_id, harm): # raw data doesn't exist
+                logger.warning('No raw data found for %s, %s, %s', chn_name, queue_id, harm)
+                return None
+
+            ds = fh['raw/' + chn_name + '/' + str(int(queue_id)) + '/' + harm]
+            offset = self._raw_offset(ds)
+            if offset is None or 'f_step' in ds.attrs: # can not be mapped, read it
+                return self._read_raw_dataset(ds)
+            shape, dtype = ds.shape, ds.dtype
+
+        return np.memmap(self.path, mode='r', dtype=dtype, shape=shape, offset=offset)
+
+
+    def get_raw_queue_ids(self, chn_name, harm, queue_ids=None, t_range=None):
+        '''
+        return ndarray of queue_id of chn_name with raw data of harm
+        queue_ids: list of queue_id to select from. If None, use all queue_id in data
+        t_range: [t1, t2] time range in s relative to t0 (include both ends). None for no limit on that end
+        '''
+        queue_id = self.get_queue_id(chn_name)
+        sel = np.ones(queue_id.shape[0], dtype=bool)
+        if queue_ids is not None:
+            sel &= queue_id.isin(queue_ids).values
+        if t_range is not None:
+            t = self.get_t_s(chn_name).values
+            t1, t2 = t_range
+            if t1 is not None:
+                sel &= t >= t1
+            if t2 is not None:
+                sel &= t <= t2
+        queue_id = queue_id[sel].values.astype(int)
+
+        with self._open_h5('r') as fh:
+            if 'raw' not in fh or chn_name not in fh['raw']:
+                return np.array([], dtype=int)
+            g_chn = fh['raw/' + chn_name]
+            return np.array([qid for qid in queue_id if str(qid) in g_chn and harm in g_chn[str(qid)]], dtype=int)
+
+
+    def get_raw_stack(self, chn_name, harm, queue_ids=None, t_range=None, out=None):
+        '''
+        return raw data of harm from multiple queues stacked in one array
+        e.g.: all harmonic 3 spectra of 'samp' between t1 and t2:
+            get_raw_stack('samp', '3', t_range=[t1, t2])
+        queue_ids: list of queue_id. If None, use all queue_id with raw data
+        t_range: [t1, t2] time range in s relative to t0
+        out: optional preallocated float array (3, M, npts) to read into
+        return a dict
+        {
+            'queue_id': ndarray (M,),
+            'f': ndarray (M, npts),
+            'G': ndarray (M, npts),
+            'B': ndarray (M, npts),
+        }
+        f, G, B are views of one (3, M, npts) buffer. Spectra with less than npts points are padded with nan.
+        '''
+        queue_id = self.get_raw_queue_ids(chn_name, harm, queue_ids=queue_ids, t_range=t_range)
+
+        with self._open_h5('r') as fh:
+            g_chn = fh['raw/' + chn_name] if queue_id.size else None
+            dsets = [g_chn[str(qid) + '/' + harm] for qid in queue_id]
+            npts = max([ds.shape[1] for ds in dsets], default=0)
+
+            if out is None:
+                out = np.empty((3, len(dsets), npts), dtype=float)
+            elif out.shape != (3, len(dsets), npts):
+                raise ValueError('out should have shape {}'.format((3, len(dsets), npts)))
+
+            for i, ds in enumerate(dsets):
+                n = ds.shape[1]
+                # read directly into the buffer (no intermediate array)
+                if 'f_step' in ds.attrs: # f saved as f_start and f_step
+                    ds.read_direct(out, source_sel=np.s_[:, :n], dest_sel=np.s_[1:, i, :n])
+                    out[0, i, :n] = self._linear_f(ds)
+                else:
+                    ds.read_direct(out, source_sel=np.s_[:, :n], dest_sel=np.s_[:, i, :n])
+                if n < npts:
+                    out[:, i, n:] = np.nan
+
+        return {
+            'queue_id': queue_id,
+            'f': out[0],
+            'G': out[1],
+            'B': out[2],
+        }
+
+
+    def _raw_exists(self, file_handle, chn_name, queue_id, harm=None):
         '''
         check if corresponding raw data exists
         file_handle: handle to the file
+        harm: if None, check the group of queue_id only
+        queues without raw data (e.g.: imported by _save_queues_bulk) have no group in the file
         '''
         logger.info('raw chn:%s id:%s harm:%s', chn_name, queue_id, harm)
-        logger.info('raw in fh: %s', 'raw' in file_handle.keys())
-        logger.info('chn_name in fh["raw"]: %s', chn_name in file_handle['raw'])
-        logger.info('queue_id in raw/chn_name: %s', str(int(queue_id)) in file_handle['raw/'+chn_name])
-        logger.info('harm in raw/chn_name/queue_id: %s', harm in file_handle['raw/' + chn_name + '/' + str(int(queue_id))])
 
-        if 'raw' in file_handle.keys() and chn_name in file_handle['raw'] and str(int(queue_id)) in file_handle['raw/'+chn_name] and harm in file_handle['raw/' + chn_name + '/' + str(int(queue_id))]: 
+        # check level by level. a missing group raises KeyError when indexed
+        exists = 'raw' in file_handle.keys() and chn_name in file_handle['raw'] and str(int(queue_id)) in file_handle['raw/'+chn_name]
+        if exists and harm is not None:
+            exists = harm in file_handle['raw/' + chn_name + '/' + str(int(queue_id))]
+
+        if exists: 
             logger.info('raw exists')
             return True
         else:
@@ -896,7 +1689,7 @@ class DataSaver:
         else: # new, append
             getattr(self, chn_name).merge(pd.DataFrame.from_dict({col: [val], 'queue_id': [queue_id]}), how='outer')
 
-        self.saveflg = False
+        self._set_dirty('data/' + chn_name, rows=np.flatnonzero(getattr(self, chn_name).queue_id.values == queue_id))
 
 
     def update_mech_queue(self, chn_name, nhcalc, queue):
@@ -932,7 +1725,7 @@ class DataSaver:
 
         getattr(self, chn_name + '_prop')[mech_key].update(queue)
 
-        self.saveflg = False
+        self._set_dirty('prop/' + chn_name + '/' + mech_key)
 
 
     def replace_none_with_nan_after_loading(self):
@@ -977,17 +1770,19 @@ class DataSaver:
                     getattr(self, chn_name + '_prop')[mech_key] = df
 
 
-    def update_mech_df_in_prop(self, chn_name, nhcalc, mech_df):
+    def update_mech_df_in_prop(self, chn_name, nhcalc, mech_df, rows=None):
         '''
         save mech_df to self.'chn_nam'_mech[nhcalc]
+        rows: positions of rows changed or appended. If None, all rows may be changed
         '''
         # set queue_id as int
-        mech_df['queue_id'] = mech_df.queue_id.astype('int')
+        if mech_df['queue_id'].dtype != 'int':
+            mech_df['queue_id'] = mech_df.queue_id.astype('int')
 
         getattr(self, chn_name + '_prop')[self.get_mech_key(nhcalc)] = mech_df
         logger.info('mech_df in data_saver') 
         logger.info(getattr(self, chn_name + '_prop')[self.get_mech_key(nhcalc)]) 
-        self.saveflg = False
+        self._set_dirty('prop/' + chn_name + '/' + self.get_mech_key(nhcalc), rows=rows)
     
 
     def get_mech_df_in_prop(self, chn_name, nhcalc):
@@ -1016,22 +1811,35 @@ class DataSaver:
 
         if chn_name is None: # remove all from all channels
             for chn in self._chn_keys:
+                self._set_deleted(*['prop/' + chn + '/' + mech_key for mech_key in getattr(self, chn + '_prop').keys()])
                 getattr(self, chn + '_prop').clear()
                 logger.warning('All properties data removed.')
-                self.saveflg = False
         else:
             if mech_keys: # given mech_keys to remove
                 for mech_key in mech_keys:
-                    complete = getattr(self, chn_name + '_prop').pop(mech_keys, None)
+                    complete = getattr(self, chn_name + '_prop').pop(mech_key, None)
                     if complete is None:
                         logger.warning('{} does not exist'.format(mech_key))
                     else:
                         logger.warning('{} removed from {}'.format(mech_key, chn_name))
-                        self.saveflg = False
+                        self._set_deleted('prop/' + chn_name + '/' + mech_key)
             else: # clear chn_name
+                self._set_deleted(*['prop/' + chn_name + '/' + mech_key for mech_key in getattr(self, chn_name + '_prop').keys()])
                 getattr(self, chn_name + '_prop').clear()
                 logger.warning('All properties data removed.')
-                self.saveflg = False                
+
+
+    def _set_deleted(self, *keys):
+        '''
+        flag tables removed. they will be deleted from file by the next saving
+        keys: keys of the tables in h5 file. e.g.: 'prop/samp/353_3'
+        '''
+        self._deleted.update(keys)
+        self._dirty.difference_update(keys)
+        for key in keys:
+            self._snapshots.pop(key, None)
+            self._snapshot_start.pop(key, None)
+        self.saveflg = False
             
 
     ####################################################
@@ -1045,9 +1853,20 @@ class DataSaver:
         this function export the self.data.samp and ...ref 
         in the ext form
         fileName: string of full path with file name
+        .csv, .jsonl and .parquet files are written in chunks by self.data_stream_exporter 
+        and the export statistic (dict) is returned
         '''
         # TODO add exp_ref
 
+        # get ext
+        name, ext = os.path.splitext(fileName)
+        if ext.lower() in ['.csv', '.jsonl', '.parquet']:
+            try:
+                return self.data_stream_exporter(fileName, mark=mark, dropnanmarkrow=dropnanmarkrow, unit_t=unit_t, unit_temp=unit_temp)
+            except PermissionError as err:
+                logger.warning('Permission denied.\nCheck if your file is open.')
+                return
+
         # get df of samp and ref channel
         on_cols = ['queue_id', 't', 'temp']
         df_samp = pd.merge(
@@ -1095,18 +1914,6 @@ class DataSaver:
                                 mech_df = self.reshape_mech_df(chn_name, mech_key, mark=mark, dropnanmarkrow=dropnanmarkrow, dropnancolumn=dropnancolumn)
                                 mech_df.to_excel(writer, sheet_name=chn_name[0].upper() + '_' + mech_key)
 
-            elif ext.lower() == '.csv': # TODO add prop
-                # add chn_name to samp and ref df
-                # and append ref to samp
-                with open(fileName, 'w') as f:
-                    csvwriter = csv.writer(f)
-                    csvwriter.writerow(['Version'] + [self.ver] + [''] + ['t0'] + [self.exp_ref['t0']]+ [''] + ['shifted t0'] + [self.exp_ref['t0_shifted']])
-                
-                if self.ref.shape[0] > 0:
-                    df_samp.assign(chn='samp').append(df_ref.assign(chn='ref')).append(df_samp_ref.assign(chn='samp_ref')).append(df_ref_ref.assign(chn='ref_ref')).to_csv(fileName, mode='a')
-                else:
-                    df_samp.assign(chn='samp').append(df_samp_ref.assign(chn='samp_ref')).to_csv(fileName, mode='a')
-
             elif ext.lower() == '.json': # TODO add prop
                 with open(fileName, 'w') as f:
                     ## lines with indent (this will make the file larger)
@@ -1140,6 +1947,124 @@ class DataSaver:
             logger.warning('Permission denied.\nCheck if your file is open.')
 
     
+    def data_stream_exporter(self, fileName, chunk_rows=10000, mark=False, dropnanmarkrow=False, unit_t='s', unit_temp='C'):
+        '''
+        export samp, ref, samp_ref and ref_ref to .csv, .jsonl (json lines) or .parquet file in chunks of rows.
+        delta values (delf, delg) are calculated for each chunk from the reference functions
+        so the memory used depends on chunk_rows instead of the number of data points.
+        All channels are written in the same columns with a 'chn' column.
+        Harmonics without data in all channels are not exported.
+        fileName: string of full path with file name
+        chunk_rows: number of rows in each chunk
+        return a dict of export statistic {'rows', 'seconds', 'rows_per_s', 'bytes'}
+        '''
+        t_start = time.time()
+        name, ext = os.path.splitext(fileName)
+        ext = ext.lower()
+
+        if ext == '.parquet' and pq is None:
+            logger.warning('pyarrow is required for exporting parquet file!')
+            return
+
+        chn_names = [chn_name for chn_name in self._chn_keys + [chn + '_ref' for chn in self._chn_keys] if getattr(self, chn_name).shape[0] > 0]
+
+        # harmonics with data
+        harm_idx = np.zeros(len(self.nan_harm_list()), dtype=bool)
+        for chn_name in chn_names:
+            s = getattr(self, chn_name)['fs']
+            for start in range(0, s.shape[0], chunk_rows):
+                harm_idx |= np.isfinite(np.array(s.iloc[start:start+chunk_rows].values.tolist(), dtype=float)).any(axis=0)
+        harm_idx = np.flatnonzero(harm_idx)
+        harms = [str(i * 2 + 1) for i in harm_idx]
+
+        columns = ['chn', 'queue_id', 't', 'temp']
+        for col in ['f', 'g', 'delf', 'delg', 'mark']:
+            columns.extend([col + harm for harm in harms])
+
+        meta = {'ver': self.ver, 't0': self.exp_ref['t0'], 't0_shifted': self.exp_ref['t0_shifted']}
+
+        nrows = 0
+        writer = None
+        with open(fileName, 'w', newline='') if ext != '.parquet' else contextlib.nullcontext() as f:
+            if ext == '.csv':
+                csvwriter = csv.writer(f)
+                csvwriter.writerow(['Version'] + [self.ver] + [''] + ['t0'] + [self.exp_ref['t0']]+ [''] + ['shifted t0'] + [self.exp_ref['t0_shifted']])
+            elif ext == '.jsonl':
+                f.write(json.dumps(meta) + '\n')
+
+            for chn_name in chn_names:
+                # use marked data only if there are marks
+                with_marks = self.with_marks(chn_name)
+                for start in range(0, getattr(self, chn_name).shape[0], chunk_rows):
+                    df = self._export_chunk(chn_name, start, start + chunk_rows, harm_idx, columns, mark=mark and with_marks, dropnanmarkrow=dropnanmarkrow and with_marks, unit_t=unit_t, unit_temp=unit_temp)
+                    if ext == '.csv':
+                        df.to_csv(f, header=(nrows == 0), index=False)
+                    elif ext == '.jsonl':
+                        lines = df.to_json(orient='records', lines=True)
+                        f.write(lines if lines.endswith('\n') or not lines else lines + '\n')
+                    elif ext == '.parquet':
+                        table = pa.Table.from_pandas(df, preserve_index=False)
+                        if writer is None:
+                            writer = pq.ParquetWriter(fileName, table.schema.with_metadata({'rheoQCM': json.dumps(meta)}))
+                        writer.write_table(table.replace_schema_metadata(writer.schema.metadata))
+                    nrows += df.shape[0]
+            if writer is not None:
+                writer.close()
+
+        t_used = time.time() - t_start
+        stat = {
+            'rows': nrows,
+            'seconds': t_used,
+            'rows_per_s': nrows / t_used if t_used else np.nan,
+            'bytes': os.path.getsize(fileName) if os.path.exists(fileName) else 0,
+        }
+        logger.info('exported %s', stat)
+        return stat
+
+
+    def _export_chunk(self, chn_name, start, stop, harm_idx, columns, mark=False, dropnanmarkrow=False, unit_t='s', unit_temp='C'):
+        '''
+        return df of rows [start: stop] of chn_name with columns for data_stream_exporter
+        harm_idx: indices of harmonics to export
+        mark: if True, set data not marked (1) to nan
+        dropnanmarkrow: if True, drop rows without marked (1) harmonic
+        '''
+        df_chn = getattr(self, chn_name).iloc[start:stop]
+        rows = np.arange(start, start + df_chn.shape[0])
+
+        fs = np.array(df_chn['fs'].values.tolist(), dtype=float)
+        gs = np.array(df_chn['gs'].values.tolist(), dtype=float)
+        marks = np.array(df_chn['marks'].values.tolist(), dtype=float)
+        if chn_name in self._chn_keys: # delta values
+            f0s, g0s = self.interp_film_ref_arr(chn_name, rows=rows)
+            delfs, delgs = fs - f0s, gs - g0s
+        else: # reference data
+            delfs = np.full_like(fs, np.nan)
+            delgs = np.full_like(gs, np.nan)
+
+        if mark: # leave values where only marks == 1
+            unmarked = marks != 1
+            for arr in [fs, gs, delfs, delgs]:
+                arr[unmarked] = np.nan
+
+        t = self._get_t_s_arr(chn_name)[start:stop]
+
+        data = {
+            'chn': chn_name,
+            'queue_id': df_chn['queue_id'].values.astype(int),
+            't': self.time_s_to_unit(t, unit=unit_t),
+            'temp': self.temp_C_to_unit(df_chn['temp'].values.astype(float), unit=unit_temp),
+        }
+        for col, arr in zip(['f', 'g', 'delf', 'delg', 'mark'], [fs, gs, delfs, delgs, marks]):
+            for i in harm_idx:
+                data[col + str(i * 2 + 1)] = arr[:, i]
+        df = pd.DataFrame(data, columns=columns)
+
+        if dropnanmarkrow: # rows with marks only
+            df = df[(marks == 1).any(axis=1)]
+        return df
+
+
     def reshape_data_df(self, chn_name, mark=False, dropnanmarkrow=True, dropnancolumn=True, deltaval=False, norm=False, unit_t=None, unit_temp=None, keep_mark=True):
         '''
         reshape and tidy data df (samp and ref) for exporting
@@ -1369,26 +2294,80 @@ class DataSaver:
         get time (t) in sec as pd.series
         t: pd.series of str
         '''
-        t = getattr(self, chn_name)['t'].copy()
-        # convert t column to datetime object
-        t = pd.to_datetime(t)
+        df = getattr(self, chn_name)
         # convert t to delta t in seconds
-        if t.shape[0] == 0:
+        if df.shape[0] == 0:
             logger.warning('no data saved!')
-            return t
+            return pd.Series([], index=df.index, dtype=float, name='t')
         else:
-            logger.info(self.get_t_ref()) 
-            # logger.info(t) 
-            t = t -  self.get_t_ref() # delta t to reference (t0)
-            t = t.dt.total_seconds() # convert to second
-            return t
+            return pd.Series(self._get_t_s_arr(chn_name), index=df.index, name='t') # copy of the cached array
+
+
+    def _get_t_s_arr(self, chn_name):
+        '''
+        return read-only array of t of chn_name in s relative to reference (t0)
+        it is calculated again only if t or t0 (t0_shifted) changed
+        '''
+        t_ns = self._get_t_ns(chn_name)
+        cache = self._t_cache[chn_name]
+        t_ref = self.get_t_ref()
+        t_ref = pd.Timestamp(t_ref).value if t_ref is not None else None # in ns
+
+        if cache['t_s'] is None or cache['t_ref'] != t_ref:
+            logger.info('t_ref %s', t_ref) 
+            if t_ref is None:
+                t_s = np.full(t_ns.shape, np.nan)
+            else:
+                t_s = (t_ns - t_ref) / 1e9 # delta t to reference (t0) in second
+                t_s[t_ns == np.iinfo(np.int64).min] = np.nan # NaT
+            t_s.flags.writeable = False
+            cache['t_ref'], cache['t_s'] = t_ref, t_s
+        return cache['t_s']
+
+
+    def _get_t_ns(self, chn_name):
+        '''
+        return read-only int64 array of t of chn_name in ns since epoch (NaT as min of int64)
+        t strings are parsed once. If the df is changed, only rows with changed (or new) t strings are parsed.
+        '''
+        df = getattr(self, chn_name)
+        cache = self._t_cache.get(chn_name)
+        if cache is not None and cache['df'] is df and cache['nrows'] == df.shape[0]:
+            return cache['t_ns']
+
+        t_str = np.asarray(df['t'], dtype=object)
+        t_ns = np.empty(t_str.shape[0], dtype=np.int64)
+        new = np.ones(t_str.shape[0], dtype=bool) # rows to parse
+        if cache is not None: # reuse rows with the same t
+            k = min(cache['t_str'].shape[0], t_str.shape[0])
+            same = cache['t_str'][:k] == t_str[:k]
+            t_ns[:k][same] = cache['t_ns'][:k][same]
+            new[:k] = ~same
+        if new.any():
+            logger.info('parse %s t of %s', new.sum(), chn_name) 
+            t_ns[new] = self._parse_t_ns(t_str[new])
+
+        t_ns.flags.writeable = False
+        self._t_cache[chn_name] = {'df': df, 'nrows': df.shape[0], 't_str': t_str, 't_ns': t_ns, 't_ref': None, 't_s': None}
+        return t_ns
+
+
+    def _parse_t_ns(self, t_str):
+        '''
+        convert array of time strings to int64 array in ns since epoch
+        '''
+        try:
+            t = pd.to_datetime(t_str, format=self.settings['time_str_format'])
+        except ValueError: # not in time_str_format
+            t = pd.to_datetime(t_str)
+        return np.asarray(t, dtype='datetime64[ns]').view(np.int64)
 
 
     def get_t_str_from_raw(self, chn_name, queue_id):
         '''
         get t from raw as str
         '''
-        with h5py.File(self.path, 'r') as fh:
+        with self._open_h5('r') as fh:
             # creat group for test
             g_queue = fh['raw/' + chn_name + '/' + str(queue_id)]
             t_str = g_queue.attrs['t']
@@ -1400,7 +2379,7 @@ class DataSaver:
         '''
         get t from raw as str
         '''
-        with h5py.File(self.path, 'r') as fh:
+        with self._open_h5('r') as fh:
             # creat group for test
             g_queue = fh['raw/' + chn_name + '/' + str(queue_id)]
             # add t, temp to attrs
@@ -1495,10 +2474,14 @@ class DataSaver:
         '''
         # find reference t from dict exp_ref first
         if 't0' in self.exp_ref.keys() and self.exp_ref.get('t0', None): # t0 exist and != None or 0
+            key = (self.exp_ref.get('t0'), self.exp_ref.get('t0_shifted', None), self.settings['time_str_format'])
+            if self._t_ref_cache[0] == key: # parsed before
+                return self._t_ref_cache[1]
             if self.exp_ref.get('t0_shifted', None):
                 t0 = datetime.datetime.strptime(self.exp_ref.get('t0_shifted'), self.settings['time_str_format']) # used shifted t0
             else:
                 t0 = datetime.datetime.strptime(self.exp_ref.get('t0'), self.settings['time_str_format']) # use t0
+            self._t_ref_cache = (key, t0)
         else: # no t0 saved in self.exp_ref
             # find t0 in self.settings
             t0 = self.settings.get('t0', self.settings.get('dateTimeEdit_reftime', None))
@@ -1559,37 +2542,189 @@ class DataSaver:
         '''
 
         if deltaval == True:
-            s = self.convert_col_to_delta_val(chn_name, col, norm=norm)
-            # logger.info(s) 
+            arr = self.get_delta_arr(chn_name, col, norm=norm)
             col = 'del' + col # change column names to 'delfs' or 'delgs' 
             if norm:
                 col = col[:-1] + 'n' + col[-1:] # change columns to 'delfns' or 'delgns'
         else:
-            s = getattr(self, chn_name)[col].copy()
+            arr = self.get_harm_arr(chn_name, col)
+
+        if mark == True:
+            arr = self._mask_unmarked(arr, self.get_harm_arr(chn_name, 'marks'))
 
+        return self._harm_arr_to_df(arr, getattr(self, chn_name).index, col[:-1])
 
-        if mark == False:
-            return pd.DataFrame(s.values.tolist(), s.index).rename(columns=lambda x: col[:-1] + str(x * 2 + 1))
+
+    def get_harm_arr(self, chn_name, col, mech_key=None):
+        '''
+        return the read-only (N, n_harm) array of column col with lists by harmonics
+        the array is cached and rebuilt only after the table is changed
+        chn_name: str of channel name ('samp', 'ref', 'samp_ref', 'ref_ref')
+        col: str of column name ('fs', 'gs', 'marks', or column in mech_df)
+        mech_key: if given, col is from chn_name's mech_df of mech_key
+        '''
+        if mech_key is None:
+            key = 'data/' + chn_name
+            df = getattr(self, chn_name)
+        else:
+            key = 'prop/' + chn_name + '/' + mech_key
+            df = getattr(self, chn_name + '_prop')[mech_key]
+
+        if key not in self._harm_tables:
+            self._harm_tables[key] = HarmonicTable(len(self.nan_harm_list()))
+        return self._harm_tables[key].get(df, col)
+
+
+    def get_delta_arr(self, chn_name, col, norm=False):
+        '''
+        return read-only (N, n_harm) array of delta values (delfs or delgs) of col ('fs' or 'gs')
+        norm: if True, nomalize value by harmonic
+        '''
+        name = 'del' + col[:-1] + ('n' if norm else '') + 's' # delfs, delgs, delfns, delgns
+        return self._get_derived_arr(chn_name, name)
+
+
+    def _get_derived_arr(self, chn_name, name):
+        '''
+        return read-only (N, n_harm) array of value calculated from data and reference of chn_name
+        name: 'f0s', 'g0s', 'delfs', 'delgs', 'delfns', 'delgns', 'fstars', 'f0stars', 'delfstars'
+        The arrays are cached. They are recalculated if the reference or data is changed 
+        and calculated for the new rows only if rows are appended.
+        '''
+        # check if the reference is set
+        if not self._ref_valid(chn_name):
+            self.set_ref_set(chn_name, *self.exp_ref[chn_name + '_ref'])
+
+        nrows = getattr(self, chn_name).shape[0]
+        state = self._ref_state.get(chn_name)
+        cache = self._derived_cache.get(chn_name)
+        if cache is None or cache['state'] != state: # reference or data changed
+            cache = {'state': state, 'nrows': 0, 'arrs': {}}
+            self._derived_cache[chn_name] = cache
+
+        start = min(cache['nrows'], nrows)
+        if start < nrows or not cache['arrs']: # calculate rows from start
+            logger.info('calculate derived values of %s from row %s', chn_name, start)
+            fs = self.get_harm_arr(chn_name, 'fs')[start:]
+            gs = self.get_harm_arr(chn_name, 'gs')[start:]
+            f0s, g0s = self.interp_film_ref_arr(chn_name, rows=np.arange(start, nrows))
+            f0s, g0s = f0s[:, :fs.shape[1]], g0s[:, :gs.shape[1]]
+            delfs, delgs = fs - f0s, gs - g0s
+            new = {
+                'f0s': f0s,
+                'g0s': g0s,
+                'delfs': delfs,
+                'delgs': delgs,
+                'delfns': self._norm_arr_by_harm(delfs),
+                'delgns': self._norm_arr_by_harm(delgs),
+                'fstars': fs + 1j * gs,
+                'f0stars': f0s + 1j * g0s,
+                'delfstars': delfs + 1j * delgs,
+            }
+            for key, arr in new.items():
+                if start > 0 and key in cache['arrs']:
+                    arr = np.concatenate([cache['arrs'][key][:start], arr])
+                arr.flags.writeable = False
+                cache['arrs'][key] = arr
+            cache['nrows'] = nrows
+
+        return cache['arrs'][name]
+
+
+    def query_window(self, chn_name, cols, window=None, by='t', npts=None, method='minmax', mark=False, mech_key=None, unit_t=None, unit_temp='C'):
+        '''
+        return data of rows in window decimated to about npts points for plotting
+        chn_name: 'samp', 'ref'
+        cols: list of str
+            't' (in unit_t), 'temp' (in unit_temp), 'queue_id', 'idx' (index of rows)
+            'fs', 'gs', 'marks': harmonic columns
+            'delfs', 'delgs', 'delfns', 'delgns': delta values (normalized by harmonic)
+            other columns of prop of mech_key. e.g.: 'drho', 'grhos'
+        window: (start, stop) of by. None for all rows
+        by: 't' (time in unit_t) or 'idx' (position of rows)
+        npts: max number of points to keep. None or 0: all points in window
+        method: 'minmax': min and max rows of each harmonic in npts / 2 bins
+                'lttb': largest-triangle-three-buckets of each harmonic (by t)
+                the rows selected by any column in cols (except t, idx and queue_id) are kept for all columns.
+                the columns share npts rows: bins (points) of each column are reduced till the union has at most npts rows
+        mark: if True, harmonic values of points not marked are nan (if there are marked points)
+        return: {'rows': positions of the selected rows, col: (n,) or (n, n_harm) array}
+        '''
+        df = getattr(self, chn_name)
+        nrows = df.shape[0]
+
+        t = None
+        if by == 't' or 't' in cols or method == 'lttb':
+            t = self.time_s_to_unit(self._get_t_s_arr(chn_name), unit=unit_t) if nrows else np.empty(0)
+
+        # rows in window
+        if window is None:
+            rows = np.arange(nrows)
+        elif by == 'idx':
+            rows = np.arange(max(int(window[0]), 0), min(int(window[1]) + 1, nrows))
         else:
-            m = getattr(self, chn_name)['marks'].copy()
-            # logger.info('mmmmm', m) 
-            idx = s.index
-            # convert s and m to ndarray
-            arr_s = np.array(s.values.tolist(), dtype=np.float) # the dtype=np.float replace None with np.nan
-            # logger.info(arr_s) 
-            arr_m = np.array(m.values.tolist(), dtype=np.float) # the dtype=np.float replace None with np.nan
-            # logger.info(arr_m) 
-            # logger.info(np.any(arr_m == 1)) 
-            if np.any(arr_m == 1): # there are marks (1)
-                logger.info('there are marks (1) in df') 
-                # replace None with np.nan
-                arr_s = arr_s * arr_m # leave values where only marks == 1
-                # replace unmarked (marks == 0) with np.nan
-                arr_s[arr_s == 0] = np.nan
-
-                return pd.DataFrame(data=arr_s, index=idx).rename(columns=lambda x: col[:-1] + str(x * 2 + 1))
-            else: # there is no marks(1)
-                return pd.DataFrame(s.values.tolist(), s.index).rename(columns=lambda x: col[:-1] + str(x * 2 + 1))
+            rows = np.flatnonzero((t >= window[0]) & (t <= window[1]))
+
+        marks = self.get_harm_arr(chn_name, 'marks') if mark else None
+        def get_col(col):
+            if col == 't':
+                return t
+            elif col == 'temp':
+                return self.temp_C_to_unit(df['temp'].values.astype(float), unit=unit_temp)
+            elif col == 'queue_id':
+                return df['queue_id'].values
+            elif col == 'idx':
+                return df.index.values
+            elif col in ['fs', 'gs', 'marks']:
+                arr = self.get_harm_arr(chn_name, col)
+            elif col in ['delfs', 'delgs', 'delfns', 'delgns']:
+                arr = self._get_derived_arr(chn_name, col)
+            else: # prop
+                arr = self.get_harm_arr(chn_name, col, mech_key=mech_key)
+            if mark and col != 'marks':
+                arr = self._mask_unmarked(arr, marks)
+            return arr
+
+        data = {col: get_col(col)[rows] for col in cols}
+
+        # decimate
+        if npts and rows.size > npts:
+            ys = [data[col] for col in cols if col not in ['t', 'idx', 'queue_id']]
+            ys = np.concatenate([y.reshape(y.shape[0], -1).astype(float) for y in ys], axis=1) if ys else np.empty((rows.size, 0))
+            if method == 'lttb':
+                sel = budget_rows(lambda n: lttb_rows(t[rows], ys, n), npts, npts, n_min=3)
+            else:
+                sel = budget_rows(lambda n: minmax_rows(ys, n), max(npts // 2, 1), npts)
+            rows = rows[sel]
+            data = {col: val[sel] for col, val in data.items()}
+            logger.info('%s rows of %s decimated to %s', nrows, chn_name, rows.size)
+
+        data['rows'] = rows
+        return data
+
+
+    def _mask_unmarked(self, arr, arr_m):
+        '''
+        return a copy of arr with values not marked (marks != 1) set to nan
+        if there is no marks (1), arr is returned
+        '''
+        if np.any(arr_m == 1): # there are marks (1)
+            logger.info('there are marks (1) in df') 
+            # leave values where only marks == 1
+            return np.where(arr_m == 1, arr, np.nan)
+        else: # there is no marks(1)
+            return arr
+
+
+    def _harm_arr_to_df(self, arr, index, prefix):
+        '''
+        return df of (N, n_harm) arr with columns = [prefix + '1', prefix + '3', ...]
+        '''
+        return pd.DataFrame(
+            data=np.array(arr, dtype=float), # copy. cached arrays are read-only
+            index=index, 
+            columns=[prefix + str(i * 2 + 1) for i in range(arr.shape[1])],
+        )
             
 
     def get_mech_column_to_columns_marked_rows(self, chn_name, mech_key, col, mark=False, dropnanmarkrow=False):
@@ -1624,36 +2759,15 @@ class DataSaver:
         NOTE: The end 's' in column names will not be removed here because the 's' in mech_df shows the value is harmonic dependent.
         '''
 
-        s = getattr(self, chn_name + '_prop')[mech_key][col].copy()
         # s = self.update_mech_df_shape(chn_name, mech_key)[col].copy() # use update_mech_df_shape function will update the mech_prop in case its shape is not updated with data
-        
         logger.info('chn_name/mech_key/col %s %s %s', chn_name, mech_key, col) 
-        logger.info('mech_s head %s', s.head()) 
-        logger.info('mech_s %s', type(s.values.tolist())) 
-        logger.info('mech_s %s', s.values.tolist()[0]) 
-        logger.info('mech_s %s', type(s.values.tolist()[0])) 
 
-        if mark == False:
-            return pd.DataFrame(s.values.tolist(), s.index).rename(columns=lambda x: col + str(x * 2 + 1))
-        else:
-            m = getattr(self, chn_name)['marks'].copy() # marks from data
-            idx = s.index
-            # convert s and m to ndarray
-            arr_s = np.array(s.values.tolist(), dtype=np.float) # the dtype=np.float replace None with np.nan
-            # logger.info(arr_s) 
-            arr_m = np.array(m.values.tolist(), dtype=np.float) # the dtype=np.float replace None with np.nan
-            # logger.info(arr_m) 
-            # logger.info(np.any(arr_m == 1)) 
-            if np.any(arr_m == 1): # there are marks (1)
-                logger.info('there are marks (1) in df') 
-                # replace None with np.nan
-                arr_s = arr_s * arr_m # leave values where only marks == 1
-                # replace unmarked (marks == 0) with np.nan
-                arr_s[arr_s == 0] = np.nan
-
-                return pd.DataFrame(data=arr_s, index=idx).rename(columns=lambda x: col + str(x * 2 + 1))
-            else: # there is no marks(1)
-                return pd.DataFrame(s.values.tolist(), s.index).rename(columns=lambda x: col + str(x * 2 + 1))
+        arr = self.get_harm_arr(chn_name, col, mech_key=mech_key)
+
+        if mark == True:
+            arr = self._mask_unmarked(arr, self.get_harm_arr(chn_name, 'marks')) # marks from data
+
+        return self._harm_arr_to_df(arr, getattr(self, chn_name + '_prop')[mech_key].index, col)
             
 
     def convert_col_to_delta_val(self, chn_name, col, norm=False):
@@ -1663,7 +2777,7 @@ class DataSaver:
         norm: if True, nomalize value by harmonic
         '''
         # check if the reference is set
-        if not self.refflg[chn_name]:
+        if not self._ref_valid(chn_name):
             # logger.info(self.exp_ref[chn_name + '_ref']) 
             self.set_ref_set(chn_name, *self.exp_ref[chn_name + '_ref'])
 
@@ -1676,22 +2790,8 @@ class DataSaver:
         if mode['cryst'] == 'single': # single crystal
             logger.info('single') 
 
-            ref_s = self.interp_film_ref(chn_name, col=col) # get reference for col (fs or gs)
-
-            # logger.info('ref_s\n%s', ref_s) 
-            
-            # convert series value to ndarray
-            col_arr = np.array(col_s.values.tolist())
-            ref_arr = np.array(ref_s.values.tolist())
-
-            # subtract ref from col elemental wise
-            col_arr = col_arr - ref_arr
-
-            # save it back to col_s
-            col_s.values[:] = col_arr.tolist()
-            
-            if norm: # normalize the data by harmonics
-                col_s = self._norm_by_harm(col_s)
+            # subtract ref from col elemental wise and save it back to col_s
+            col_s = pd.Series(self.get_delta_arr(chn_name, col, norm=norm).tolist(), index=col_s.index, name=col_s.name)
             return col_s
 
             # if mode['temp'] == 'const': # single crystal and constant temperature
@@ -1747,7 +2847,15 @@ class DataSaver:
         normalize series 'fs' or 'gs' by harmonic
         this function doesn't change the column name of series
         '''
-        return s.apply(lambda x: list(np.array(x, dtype=np.float) / np.arange(1, len(x)*2+1, 2)))
+        arr = self._norm_arr_by_harm(HarmonicTable.to_array(s, len(self.nan_harm_list())))
+        return pd.Series(arr.tolist(), index=s.index, name=s.name)
+
+
+    def _norm_arr_by_harm(self, arr):
+        '''
+        normalize (N, n_harm) array of f or g by harmonic
+        '''
+        return arr / np.arange(1, arr.shape[1]*2+1, 2)
 
 
     def minus_columns(self, df):
@@ -1788,6 +2896,7 @@ class DataSaver:
 
         df = self.reset_match_marks(df, mark_pair=(0, 1)) # mark 1 to 0
         setattr(self, chn_name + '_ref', df)
+        self._set_dirty('data/' + chn_name + '_ref')
         # logger.info(getattr(self, chn_name+'_ref'))
 
 
@@ -1837,6 +2946,7 @@ class DataSaver:
                 # clear self.<chn_name>_ref
                 if getattr(self, chn_name + '_ref').shape[0] > 0: 
                     setattr(self, chn_name + '_ref', self._make_df())
+                    self._set_dirty('data/' + chn_name + '_ref')
 
                 # clear all self.exp_ref[chn_name] 
                 if mode['temp'] == 'var':
@@ -1905,55 +3015,32 @@ class DataSaver:
                     self.refflg[chn_name] = False
                     return
                 
+                # get data
+                ref_fs = self.get_harm_arr(chn_ref_source, 'fs')
+                ref_gs = self.get_harm_arr(chn_ref_source, 'gs')
+                logger.info('chn_ref_source %s', chn_ref_source)
+
                 func_list = [] # list of funcs 
                 logger.info('reference_idx %s', reference_idx) 
-                logger.info('exp_ref %s', self.exp_ref) 
                 for ind_list in reference_idx: # iterate each list
                     logger.info('ind_list %s', ind_list)
-
-                    func_f_list = [] # func for all freq
-                    func_g_list = [] # func for all gamma
-
-                    # get data
-                    ref_fs_df = self.get_list_column_to_columns_marked_rows(chn_ref_source, 'fs', mark=False, dropnanmarkrow=False, deltaval=False)
-                    ref_gs_df = self.get_list_column_to_columns_marked_rows(chn_ref_source, 'gs', mark=False, dropnanmarkrow=False, deltaval=False)
-                    logger.info('chn_ref_source %s', chn_ref_source)
-                    # logger.info('ref_fs_df %s', ref_fs_df)
-                    # logger.info('ref_fs_df.index %s', ref_fs_df.index)
-                    # logger.info('ref_fs_df.loc[ind_list] %s', ref_fs_df.loc[ind_list])
-                    # logger.info('ref_gs_df.loc[ind_list] %s', ref_gs_df.loc[ind_list])
-                    func_f_list = ref_fs_df.loc[ind_list].mean().values.tolist() # list of float for now
-                    func_g_list = ref_gs_df.loc[ind_list].mean().values.tolist() # list of float for now
-                    logger.info('func_f_list %s', func_f_list)
-                    logger.info('func_g_list %s', func_g_list)
+                    rows = self._ref_rows(chn_ref_source, ind_list)
+                    # mean of the segment
+                    model = RefModel(None, ref_fs[rows], ref_gs[rows], kind='const')
                     # for version <= 0.18
                     # Save to self.exp_ref[chn_name] 
                     if all([isinstance(l, int) for l in self.exp_ref[chn_name+'_ref'][1]]): # all int. 
-                        self.exp_ref[chn_name]['f0'] = func_f_list
-                        self.exp_ref[chn_name]['g0'] = func_g_list
-
-                    # convert func_f/g_list to list of functions
-                    func_f_list = [lambda x, f=f: np.full_like(x, f, dtype=float) for f in func_f_list]
-                    func_g_list = [lambda x, g=g: np.full_like(x, g, dtype=float) for g in func_g_list]
-                    # print([x([0, 2]) for x in func_f_list])
-                    # print([x([0, 2]) for x in func_g_list])
+                        f0s, g0s = model.eval([0])
+                        self.exp_ref[chn_name]['f0'] = f0s[0].tolist()
+                        self.exp_ref[chn_name]['g0'] = g0s[0].tolist()
+
                     # make function for each ind_list
-                    func_list.append(self.make_interpfun(func_f_list, func_g_list))
+                    func_list.append(model)
 
                 self.exp_ref['func'][chn_name] = func_list # save to class
 
                 # calculate ref for each sample (samp) temp and save to self.samp_ref
-
-                # copy df from samp_ref_source
-                df = getattr(self, chn_name).copy()
-
-                df['fs'] = self.interp_film_ref(chn_name, col='fs')
-                df['gs'] = self.interp_film_ref(chn_name, col='gs')
-
-                # change mark 1 to 0
-                df = self.reset_match_marks(df, mark_pair=(0, 1)) # mark 1 to 0
-                # copy to samp_ref
-                setattr(self, chn_name + '_ref', df)
+                self._save_chn_ref_df(chn_name)
 
 
                 ''' for single reference
@@ -1980,8 +3067,7 @@ class DataSaver:
                 chn_ref_source = self.exp_ref[chn_name + '_ref'][0]
 
                 # check if there is temp data in self.ref
-                temp = self.get_temp_by_uint_marked_rows(chn_ref_source, dropnanmarkrow=False, unit='C') # in C. If marked only, set dropnanmarkrow=True
-                logger.info(temp) 
+                temp = getattr(self, chn_ref_source)['temp'].values.astype(float) # in C
                 if np.isnan(temp).all(): # no temp data
                     logger.warning('no temperature data in reference!')
                     self.refflg[chn_name] = False
@@ -1997,59 +3083,25 @@ class DataSaver:
                     self.refflg[chn_name] = False
                     return
                 
-                # get harm data fs in columns
-                fs = self.get_list_column_to_columns_marked_rows(chn_ref_source, 'fs', mark=False, dropnanmarkrow=False, deltaval=False, norm=False) # absolute freq in Hz. If marked, set mark=True
-                gs = self.get_list_column_to_columns_marked_rows(chn_ref_source, 'gs', mark=False, dropnanmarkrow=False, deltaval=False, norm=False) # absolute gamma in Hz. If marked, set mark=True
+                # get harm data (absolute freq and gamma in Hz)
+                fs = self.get_harm_arr(chn_ref_source, 'fs')
+                gs = self.get_harm_arr(chn_ref_source, 'gs')
 
                 func_list = [] # list of funcs 
                 logger.info('reference_idx %s', reference_idx) 
-                logger.info('exp_ref %s', self.exp_ref) 
                 for ind_list in reference_idx: # iterate each list
                     logger.info('ind_list %s', ind_list)
-                    if len(ind_list) == 1: # single point
-                        # cause single point is not allowed for interp1d, doubling the length by repeating
-                        ind_list = ind_list * 2
-                    func_f_list = [] # func for all freq
-                    func_g_list = [] # func for all gamma
-                    tempind = temp[ind_list]
-                    for harm in range(1, self.settings['max_harmonic']+2, 2): # calculate each harm
-                        fharmind = fs['f'+str(harm)][ind_list] # f of harm
-                        gharmind = gs['g'+str(harm)][ind_list] # g of harm
-
-                        # calc freq
-                        if np.isnan(fharmind).all(): # no data in harm and ind_list
-                            pass # already initiated
-                        else: # there is data
-                            logger.info('tempind %s', tempind) 
-                            logger.info('fharmind %s', fharmind) 
-                            func_f_list.append(interp1d(tempind, fharmind, kind=self.exp_ref['mode']['fit'], fill_value=np.nan, bounds_error=False))
-                        
-                        # calc gamma
-                        if np.isnan(gharmind).all(): # no data in harm and ind_list
-                            pass # already initiated
-                        else: # there is data
-                            func_g_list.append(interp1d(tempind, gharmind, kind=self.exp_ref['mode']['fit'], fill_value=np.nan, bounds_error=False))
-
-                    # make function for each ind_list
-                    func_list.append(self.make_interpfun(func_f_list, func_g_list))
+                    rows = self._ref_rows(chn_ref_source, ind_list)
+                    # interpolate all harmonics by temperature
+                    func_list.append(RefModel(temp[rows], fs[rows], gs[rows], kind=mode['fit']))
 
                 self.exp_ref['func'][chn_name] = func_list # save to class
 
                 # calculate ref for each sample (samp) temp and save to self.samp_ref
-
-                # copy df from samp_ref_source
-                df = getattr(self, chn_name).copy()
-
-                df['fs'] = self.interp_film_ref(chn_name, col='fs')
-                df['gs'] = self.interp_film_ref(chn_name, col='gs')
-
-                # change mark 1 to 0
-                df = self.reset_match_marks(df, mark_pair=(0, 1)) # mark 1 to 0
-                # copy to samp_ref
-                setattr(self, chn_name + '_ref', df)
+                self._save_chn_ref_df(chn_name)
             else:
-                pass
                 self.refflg[chn_name] = False
+                return
 
         elif mode['cryst'] == 'dual': #TODO
             if mode['temp'] == 'const': # dual crystal and constant temperature
@@ -2058,8 +3110,60 @@ class DataSaver:
                 pass
             else:
                 pass
+            self.refflg[chn_name] = False
+            return
+
+        # reference is calculated. It is reused until the state is changed
+        self.refflg[chn_name] = True
+        self._ref_state[chn_name] = self._get_ref_state(chn_name)
+
+
+    def _ref_rows(self, chn_ref_source, ind_list):
+        '''
+        return positions of rows of index ind_list in chn_ref_source
+        '''
+        rows = getattr(self, chn_ref_source).index.get_indexer(ind_list)
+        if np.any(rows < 0):
+            logger.warning('index %s does not exist in %s', np.array(ind_list)[rows < 0], chn_ref_source)
+        return rows[rows >= 0]
+
+
+    def _save_chn_ref_df(self, chn_name):
+        '''
+        copy chn_name df with fs, gs replaced by the reference values to self.<chn_name>_ref
+        '''
+        df = getattr(self, chn_name).copy()
+        f0s, g0s = self.interp_film_ref_arr(chn_name)
+        df['fs'] = f0s.tolist()
+        df['gs'] = g0s.tolist()
+
+        # change mark 1 to 0
+        df = self.reset_match_marks(df, mark_pair=(0, 1)) # mark 1 to 0
+        # copy to samp_ref
+        setattr(self, chn_name + '_ref', df)
+        self._set_dirty('data/' + chn_name + '_ref')
+
+
+    def _get_ref_state(self, chn_name):
+        '''
+        return the state which the reference of chn_name is calculated from:
+        mode, reference selection and versions of the data tables
+        NOTE: appending rows (_set_dirty with rows) does not change the versions
+        '''
+        source = self.exp_ref[chn_name + '_ref'][0]
+        return (
+            json.dumps(self.exp_ref.get('mode'), sort_keys=True),
+            json.dumps(self.exp_ref[chn_name + '_ref'], default=str),
+            self._data_ver.get(chn_name, 0),
+            self._data_ver.get(source, 0),
+        )
+
 
-        self.refflg[chn_name] = False
+    def _ref_valid(self, chn_name):
+        '''
+        return True if the reference of chn_name is calculated and nothing it depends on changed
+        '''
+        return self.refflg[chn_name] and self._ref_state.get(chn_name) == self._get_ref_state(chn_name)
 
 
     def make_interpfun(self, func_f_list, func_g_list):
@@ -2087,126 +3191,72 @@ class DataSaver:
         set all rows with the same value from self.exp_ref[chn_name]['f0'] and ['g0']
         returned df have the same size of chn_name df
         '''
-        # check if the reference is set
-        # if not self.refflg[chn_name]:
-        #     # logger.info(self.exp_ref[chn_name + '_ref']) 
-        #     self.set_ref_set(chn_name, *self.exp_ref[chn_name + '_ref'])
-
-        # samp_source = self.exp_ref['samp_ref'][0]
-        chn_temp = self.get_temp_by_uint_marked_rows(chn_name, dropnanmarkrow=False, unit='C') # in C. If marked only, set dropnanmarkrow=True
-        # logger.info(chn_temp) 
-        
-        # prepare series fro return
         cols = getattr(self, chn_name)[['fs', 'gs']].copy()
+        f0s, g0s = self.interp_film_ref_arr(chn_name)
+        cols['fs'] = f0s.tolist()
+        cols['gs'] = g0s.tolist()
 
-        # set all fs, gs to [np.nan, np.nan, ...]
-        cols['fs'] = cols['fs'].apply(lambda x: self.nan_harm_list())
-        cols['gs'] = cols['gs'].apply(lambda x: self.nan_harm_list())
+        if col is None:
+            return cols
+        else:
+            return cols[col]
 
-        mode = self.exp_ref.get('mode')
-        if mode['cryst'] == 'single':
-            if mode['temp'] == 'const': # single crystal and constant temperature
-                '''
-                # set all value the same
-                # set all fs, gs to self.exp_ref[chn_name]['f0'] and ['g0']
-                cols['fs'] = cols['fs'].apply(lambda x: self.exp_ref[chn_name]['f0'])
-                cols['gs'] = cols['gs'].apply(lambda x: self.exp_ref[chn_name]['g0'])
-                '''
-                
-                # check if all elements in self.exp_ref.samp_ref[1] is list
-                chn_idx = self.get_chn_idx_in_exp_ref(chn_name)
-                if all([isinstance(l, list) for l in chn_idx]): # all list
-                    film_idx = chn_idx
-                elif all([isinstance(l, int) for l in chn_idx]): # all int
-                    film_idx = [chn_idx] # put into a list
-                else:
-                    logger.warning('Check sample reference index!')
-                    film_idx = []
-                
-                # get interpolated f and g by chn_temp
-                for seg, ind_list in enumerate(film_idx): # iterate each list
-                    logger.info(self.exp_ref['func']) 
-                    chn_func = self.exp_ref['func'][chn_name]
-                    logger.info('len(ind_list) %s', len(ind_list)) 
-                    logger.info('len(fun) %s', len(chn_func)) 
-                    # get interpolated f, g of temp in ind_list (tempind) 
-                    # len(ind_list) can be longer than len(chn_func) 
-                    # use modulus 
-                    f_list, g_list = chn_func[seg % len(chn_func)](ind_list) # dummy values with the same size of data
-                    # logger.info('f_list %s', f_list)
-                    # transpose 
-                    fs_list = np.transpose(np.array(f_list)).tolist()
-                    logger.info('len(fs_list) %s', len(fs_list)) 
-
-                    gs_list = np.transpose(np.array(g_list)).tolist()
-
-                    # save to df
-                    # logger.info('cols.fs[ind_list] %s', cols.fs[ind_list])
-                    # logger.info('fs_list %s', fs_list)
-                    cols.fs[ind_list] = fs_list
-                    cols.gs[ind_list] = gs_list
-
-                # logger.info('cols[ind_list]\n%s', cols.iloc[ind_list]) 
-                logger.info(cols[col].head())
-
-            elif mode['temp'] == 'var': # single crystal and variable temperature
-                if np.isnan(chn_temp).all(): # no temp data
-                    logger.warning('no temperature data in film!')
-                    if col is None:
-                        return cols
-                    else:
-                        return cols[col]
 
-                if col not in self._ref_keys: # col is not fs or gs
-                    return cols
+    def interp_film_ref_arr(self, chn_name, rows=None):
+        '''
+        return reference f0 and g0 of chn_name as arrays (n, n_harm) by using the interpolation funcions calculated before
+        It gives the same values as interp_film_ref but only for the given rows
+        rows: ndarray of row positions of chn_name df. If None, use all rows
+        rows not in any reference segment are nan
+        '''
+        df = getattr(self, chn_name)
+        if rows is None:
+            rows = np.arange(df.shape[0])
+        rows = np.asarray(rows, dtype=int)
+        f0s = np.full((rows.size, len(self.nan_harm_list())), np.nan)
+        g0s = np.full((rows.size, len(self.nan_harm_list())), np.nan)
 
-                # calculate ref for each film (samp) temp and save to self.samp_ref
+        mode = self.exp_ref.get('mode')
+        if mode['cryst'] != 'single' or mode['temp'] not in ['const', 'var']: # dual crystal #TODO
+            return f0s, g0s
 
-                # check if all elements in self.exp_ref.samp_ref[1] is list
-                chn_idx = self.get_chn_idx_in_exp_ref(chn_name)
-                if all([isinstance(l, list) for l in chn_idx]): # all list
-                    film_idx = chn_idx
-                elif all([isinstance(l, int) for l in chn_idx]): # all int
-                    film_idx = [chn_idx] # put into a list
-                else:
-                    logger.warning('Check sample reference index!')
-                    film_idx = []
-                
-                # get interpolated f and g by chn_temp
-                for seg, ind_list in enumerate(film_idx): # iterate each list
-                    tempind = chn_temp[ind_list]
-                    logger.info(self.exp_ref['func']) 
-                    chn_func = self.exp_ref['func'][chn_name]
-                    logger.info('len(ind_list) %s', len(ind_list)) 
-                    logger.info('len(fun) %s', len(chn_func)) 
-                    # get interpolated f, g of temp in ind_list (tempind) 
-                    # len(ind_list) can be longer than len(chn_func) 
-                    # use modulus 
-                    f_list, g_list = chn_func[seg % len(chn_func)](tempind)
-                    # transpose 
-                    fs_list = np.transpose(np.array(f_list)).tolist()
-                    logger.info('len(fs_list) %s', len(fs_list)) 
-
-                    gs_list = np.transpose(np.array(g_list)).tolist()
-
-                    # save to df
-                    cols.fs[ind_list] = fs_list
-                    cols.gs[ind_list] = gs_list
-
-                logger.info('cols[ind_list]\n%s', cols.iloc[ind_list]) 
-                logger.info(cols[col].head())
-        elif mode['cryst'] == 'dual': #TODO
-            if mode['temp'] == 'const': # dual crystal and constant temperature
-                pass
-            elif mode['temp'] == 'var': # dual crystal and constant temperature
-                pass
-            else:
-                pass
- 
-        if col is None:
-            return cols
+        temp = df['temp'].values.astype(float)
+        if mode['temp'] == 'var' and np.isnan(temp).all(): # no temp data
+            logger.warning('no temperature data in film!')
+            return f0s, g0s
+
+        # check if all elements in self.exp_ref.samp_ref[1] is list
+        chn_ref = self.exp_ref[chn_name + '_ref']
+        if not ((len(chn_ref) > 2) and chn_ref[2]): # chn_idx does not exist. all rows in one segment
+            film_idx = [None]
         else:
-            return cols[col]
+            chn_idx = self.get_chn_idx_in_exp_ref(chn_name)
+            if all([isinstance(l, list) for l in chn_idx]): # all list
+                film_idx = chn_idx
+            elif all([isinstance(l, int) for l in chn_idx]): # all int
+                film_idx = [chn_idx] # put into a list
+            else:
+                logger.warning('Check sample reference index!')
+                film_idx = []
+
+        chn_func = self.exp_ref['func'].get(chn_name)
+        if not chn_func: # reference not calculated
+            return f0s, g0s
+        for seg, ind_list in enumerate(film_idx): # iterate each list
+            if ind_list is None: # all rows
+                pos = np.arange(rows.size)
+            else:
+                pos = np.flatnonzero(np.isin(rows, ind_list)) # positions of rows in the segment
+            if pos.size == 0:
+                continue
+            # temperature for 'var' and dummy values for 'const'
+            x = temp[rows[pos]] if mode['temp'] == 'var' else rows[pos]
+            # use modulus 
+            f0, g0 = chn_func[seg % len(chn_func)].eval(x)
+            f0s[pos, :f0.shape[1]] = f0
+            g0s[pos, :g0.shape[1]] = g0
+
+        return f0s, g0s
 
 
     def set_t0(self, t0=None, t0_shifted=None):
@@ -2319,7 +3369,7 @@ class DataSaver:
         return a series of booleans of rows with marked (1) harmonics
         if no marked rows, return all
         '''
-        marked_rows = getattr(self, chn_name).marks.apply(lambda x: True if 1 in x else False)
+        marked_rows = pd.Series(np.any(self.get_harm_arr(chn_name, 'marks') == 1, axis=1), index=getattr(self, chn_name).index, name='marks')
         if marked_rows.any(): # there are marked rows
             logger.info('There are marked rows')
             return marked_rows
@@ -2332,11 +3382,7 @@ class DataSaver:
         '''
         return if there are marks in data (True/False)
         '''
-        marked_rows = getattr(self, chn_name).marks.apply(lambda x: True if 1 in x else False)
-        if marked_rows.any(): # there are marked rows
-            return True
-        else: # no amrked rows
-            return False
+        return bool(np.any(self.get_harm_arr(chn_name, 'marks') == 1))
 
 
     def rows_all_nan_marks(self, chn_name):
@@ -2344,7 +3390,7 @@ class DataSaver:
         return list of booleans of rows with nan in all harmonics of marks
         This function can be used as ~self.rows_all_nan_marks() to return the rows with data
         '''
-        return getattr(self, chn_name).marks.apply(lambda x: True if np.isnan(np.array(x)).all() else False)
+        return pd.Series(np.isnan(self.get_harm_arr(chn_name, 'marks')).all(axis=1), index=getattr(self, chn_name).index, name='marks')
 
 
     def reset_match_marks(self, df, mark_pair=(0, 1)):
@@ -2353,13 +3399,8 @@ class DataSaver:
         set 1 in list element to 0
         '''
         new_mark, old_mark = mark_pair
-        df_new = df.copy()
-        logger.info(type(df_new)) 
-        logger.info(df_new.tail()) 
-        # logger.info(df_new.fs) 
-        # logger.info(df_new.marks) 
-        df_new.marks = df_new.marks.apply(lambda x: [new_mark if mark == old_mark else mark for mark in x])
-        return df_new
+        marks = self._df_marks_arr(df)
+        return self._set_marks(df, np.where(marks == old_mark, new_mark, marks))
 
 
     def mark_data(self, df, idx=[], harm=None, mark_val=1):
@@ -2371,42 +3412,97 @@ class DataSaver:
         mark_val: int 
         return: new df
         '''
-        df_new = df.copy()
-        def mark_func(row_marks):
-            # logger.info(row_marks) 
-            new_marks = []
-            for i, mark in enumerate(row_marks):
-                if str(i*2+1) == harm and mark != np.nan and mark is not None:
-                    new_marks.append(mark_val)
-                else:
-                    new_marks.append(mark)
-                return new_marks
-
-        # logger.info(df_new.marks) 
-        # df_new.marks.loc[idx].apply(mark_func)
-        df_new.marks.loc[idx] = df_new.marks.loc[idx].apply(lambda x: [mark_val if (str(i*2+1) == harm) and (mark != np.nan) and (mark is not None) else mark for i, mark in enumerate(x)])
-        logger.info(df_new.marks) 
-
-        return df_new
+        marks = self._df_marks_arr(df)
+        mask = self._sel_mask(df, {harm: idx}, marks.shape)
+        return self._set_marks(df, self._mark_arr(marks, mask, mark_val))
 
 
     def mark_all_to(self, df, mark_val=1):
         ''' 
         mark all to given mark_val e.g.: 0, 1
         '''
+        marks = self._df_marks_arr(df)
+        return self._set_marks(df, self._mark_arr(marks, np.ones(marks.shape, dtype=bool), mark_val))
+
+
+    def _df_marks_arr(self, df):
+        '''
+        return (N, n_harm) array of marks in df
+        use the cached array if df is one of the data tables
+        '''
+        for chn_name in self._chn_keys + [chn + '_ref' for chn in self._chn_keys]:
+            if df is getattr(self, chn_name):
+                return self.get_harm_arr(chn_name, 'marks')
+        return HarmonicTable.to_array(df['marks'], len(self.nan_harm_list()))
+
+
+    def _sel_mask(self, df, sel_idx_dict, shape):
+        '''
+        return boolean array (shape) of the selected points in df
+        sel_idx_dict = {
+            'harm': [index]
+        }
+        '''
+        mask = np.zeros(shape, dtype=bool)
+        for harm, idx in sel_idx_dict.items():
+            if harm is None:
+                continue
+            col = (int(harm) - 1) // 2
+            if col >= shape[1]: # harm out of range
+                continue
+            rows = df.index.get_indexer(list(idx))
+            mask[rows[rows >= 0], col] = True
+        return mask
+
+
+    def _mark_arr(self, marks, mask, mark_val):
+        '''
+        return a copy of marks with the points in mask set to mark_val
+        points without data (nan) are not changed
+        '''
+        return np.where(mask & ~np.isnan(marks), mark_val, marks)
+
+
+    def _set_marks(self, df, marks):
+        '''
+        return a copy of df with marks column replaced by (N, n_harm) array marks
+        marks are saved as lists of int with nan for harmonics without data
+        '''
         df_new = df.copy()
-        df_new.marks = df_new.marks.apply(lambda x: [mark_val if mark != np.nan and mark is not None else mark for mark in x])
-        # logger.info(df_new.marks) 
+        df_new['marks'] = self._marks_arr_to_list(marks)
         return df_new
 
 
+    def _marks_arr_to_list(self, marks):
+        '''
+        convert (N, n_harm) array of marks to list of lists
+        '''
+        obj = marks.astype(object)
+        finite = np.isfinite(marks)
+        obj[finite] = marks[finite].astype(int)
+        return obj.tolist()
+
+
+    def _update_marks(self, chn_name, df, marks):
+        '''
+        save df with new marks array to chn_name and keep marks array in cache
+        '''
+        setattr(self, chn_name, df)
+        self._set_dirty('data/' + chn_name, col='marks')
+        if 'data/' + chn_name not in self._harm_tables:
+            self._harm_tables['data/' + chn_name] = HarmonicTable(len(self.nan_harm_list()))
+        self._harm_tables['data/' + chn_name].set(df, 'marks', marks)
+
+
     ###### selector functions ######
     def selector_mark_all(self, chn_name, mark_val):
         '''
         selector function
         mark all data in chn_name to mark_val
         '''
-        setattr(self, chn_name, self.mark_all_to(getattr(self, chn_name), mark_val=mark_val))
+        marks = self.get_harm_arr(chn_name, 'marks')
+        marks = self._mark_arr(marks, np.ones(marks.shape, dtype=bool), mark_val)
+        self._update_marks(chn_name, self._set_marks(getattr(self, chn_name), marks), marks)
 
 
     def selector_mark_sel(self, chn_name, sel_idx_dict, mark_val):
@@ -2418,10 +3514,9 @@ class DataSaver:
         }
         '''
         df_chn = getattr(self, chn_name)
-        for harm, idx in sel_idx_dict.items():
-            df_chn = self.mark_data(df_chn, idx=idx, harm=harm, mark_val=mark_val)
-            # logger.info(df_chn.marks) 
-        setattr(self, chn_name, df_chn)
+        marks = self.get_harm_arr(chn_name, 'marks')
+        marks = self._mark_arr(marks, self._sel_mask(df_chn, sel_idx_dict, marks.shape), mark_val)
+        self._update_marks(chn_name, self._set_marks(df_chn, marks), marks)
 
 
     def selector_del_sel(self, chn_name, sel_idx_dict):
@@ -2433,36 +3528,42 @@ class DataSaver:
         }
         This function changes the date (fs, gs) to [nan, ...], marks to nan, and delete the raw data
         '''
-        df_chn = getattr(self, chn_name).copy()
+        df_chn = getattr(self, chn_name)
+        marks = self.get_harm_arr(chn_name, 'marks')
+        mask = self._sel_mask(df_chn, sel_idx_dict, marks.shape)
 
+        # queue_id of the selected points for deleting raw data
+        sel_queue_dict = {}
         for harm, idx in sel_idx_dict.items():
-            # set marks to -1
-            df_chn = self.mark_data(df_chn, idx=idx, harm=harm, mark_val=np.nan) # set the marks to nan
-            # set fs, gs to nan
-            df_chn.fs[idx] = df_chn.fs[idx].apply(lambda x: [np.nan if str(i*2+1) in harm else val for i, val in enumerate(x)]) # set all to nan. May not necessary
-            df_chn.gs[idx] = df_chn.gs[idx].apply(lambda x: [np.nan if str(i*2+1) in harm else val for i, val in enumerate(x)]) # set all to nan. May not necessary
+            rows = df_chn.index.get_indexer(list(idx))
+            for ind in np.array(idx)[rows < 0]:
+                logger.warning('index %s does not exist (%s, %s)', ind, chn_name, harm)
+            sel_queue_dict[harm] = df_chn.queue_id.values[rows[rows >= 0]].astype(int)
+
+        # set marks to nan
+        marks = np.where(mask, np.nan, marks)
+        df_chn = self._set_marks(df_chn, marks)
+        # set fs, gs to nan. May not necessary
+        for col in ['fs', 'gs']:
+            df_chn[col] = np.where(mask, np.nan, self.get_harm_arr(chn_name, col)).tolist()
         
         # delete rows marks are all nan
-        df_chn = df_chn[~self.rows_all_nan_marks(chn_name)]
+        rows_keep = ~np.isnan(marks).all(axis=1)
         # rest index df
-        df_chn = df_chn.reset_index(drop=True)
+        df_chn = df_chn[rows_keep].reset_index(drop=True)
         # save back to class
-        setattr(self, chn_name, df_chn)
+        self._set_dirty('data/' + chn_name) # fs, gs are changed too
+        self._update_marks(chn_name, df_chn, marks[rows_keep])
 
-        with h5py.File(self.path, 'a') as fh:
-            for harm, idxs in sel_idx_dict.items():
+        with self._open_h5('a') as fh:
+            for harm, queue_ids in sel_queue_dict.items():
                 # delete from raw
-                for ind in idxs: 
-                    if ind in df_chn.queue_id.index: # index in queue_id
-                        if self._raw_exists(fh, chn_name, int(df_chn.queue_id[ind]), harm): # raw data exist
-                            logger.info(df_chn.queue_id[ind]) 
-                            logger.info(fh['raw/' + chn_name + '/' + str(int(df_chn.queue_id[ind])) + '/' + harm]) 
-                            del fh['raw/' + chn_name + '/' + str(int(df_chn.queue_id[ind])) + '/' + harm]
-                            logger.warning('raw data deleted (%s, %s, %s)', chn_name, df_chn.queue_id[ind], harm)
-                        else:
-                            logger.warning('raw data does not exist (%s, %s, %s)', chn_name, df_chn.queue_id[ind], harm)
+                for queue_id in queue_ids: 
+                    if self._raw_exists(fh, chn_name, queue_id, harm): # raw data exist
+                        del fh['raw/' + chn_name + '/' + str(queue_id) + '/' + harm]
+                        logger.warning('raw data deleted (%s, %s, %s)', chn_name, queue_id, harm)
                     else:
-                        logger.warning('index %s does not exist (%s, %s)', ind, chn_name, harm)
+                        logger.warning('raw data does not exist (%s, %s, %s)', chn_name, queue_id, harm)
 
 
 
@@ -2523,182 +3624,159 @@ class DataSaver:
         '''
         convert delfs and delgs in df to delfstar for calculation and 
         return a df with ['queue_id', 'marks', 'fstars', 'fs', 'gs', 'delfstars', 'delfs', 'delgs', 'f0stars', 'f0s', 'g0s']
+        the columns are lists in cells. Use self.qcm_arrays for calculation with arrays
         '''
-        df = self.get_queue_id(chn_name).astype('int64').to_frame()
-        df['t'] = self.get_t_marked_rows(chn_name, dropnanmarkrow=False, unit=None)
-        df['temp'] = self.get_temp_by_uint_marked_rows( chn_name, dropnanmarkrow=False, unit=
-        'C')
+        qcm_arrs = self.qcm_arrays(chn_name)
+        df = pd.DataFrame({'queue_id': qcm_arrs['queue_id']}, index=qcm_arrs['index'])
+        df['t'] = qcm_arrs['t']
+        df['temp'] = qcm_arrs['temp']
         df['marks'] = self.get_marks(chn_name)
 
-        # get freqs and gamms in form of [n1, n3, n5, ...]
-        fs = self.get_cols(chn_name, cols=['fs']).squeeze(axis=1) # convert to series
-        gs = self.get_cols(chn_name, cols=['gs']).squeeze(axis=1) # convert to series
-        # another way is to get the series directly as follow
-        # fs = getattr(self, chn_name)['fs'].copy()
-        # gs = getattr(self, chn_name)['gs'].copy()
-
-        # get delf and delg in form of [n1, n3, n5, ...]
-        delfs = self.convert_col_to_delta_val(chn_name, 'fs', norm=False)
-        delgs = self.convert_col_to_delta_val(chn_name, 'gs', norm=False)
-        # get reference value as array
-        f0s = self.interp_film_ref(chn_name, col='fs')
-        g0s = self.interp_film_ref(chn_name, col='gs')
-
-        # convert to array
-        f_arr = np.array(fs.values.tolist())
-        g_arr = np.array(gs.values.tolist())
-
-        delf_arr = np.array(delfs.values.tolist())
-        delg_arr = np.array(delgs.values.tolist())
-
-        f0_arr = np.array(f0s.values.tolist())
-        g0_arr = np.array(g0s.values.tolist())
-
-        # get delfstar as array
-        fstar_arr = f_arr + 1j * g_arr
-        delfstar_arr = delf_arr + 1j * delg_arr
-        f0star_arr = f0_arr + 1j * g0_arr
-
-        df['fstars'] = fstar_arr.tolist()
-        df['delfstars'] = delfstar_arr.tolist()
-        df['f0stars'] = f0star_arr.tolist()
-        df['fs'] = fs
-        df['gs'] = gs
-        df['delfs'] = delfs
-        df['delgs'] = delgs
-        df['f0s'] = f0s
-        df['g0s'] = g0s
-
-        logger.info(f_arr.shape)
-        logger.info(g_arr.shape)
-        logger.info(fstar_arr.shape)
-        logger.info(df['fstars'].iloc[0])
+        for col in ['fstars', 'delfstars', 'f0stars', 'fs', 'gs', 'delfs', 'delgs', 'f0s', 'g0s']:
+            df[col] = qcm_arrs[col].tolist()
+
+        logger.info(qcm_arrs['fstars'].shape)
 
         return df
 
 
+    def qcm_arrays(self, chn_name):
+        '''
+        return data of chn_name for calculation as a dict of arrays without converting to lists
+        {
+            'index': index of rows in self.<chn_name> (the same as df_qcm), (N,)
+            'queue_id': int (N,)
+            't': time in s (N,)
+            'temp': temperature in C (N,)
+            'marks': (N, n_harm)
+            'fstars', 'delfstars', 'f0stars': complex (N, n_harm)
+            'fs', 'gs', 'delfs', 'delgs', 'f0s', 'g0s': float (N, n_harm)
+        }
+        The arrays are read-only and shared with the cache. Copy them before changing.
+        '''
+        df = getattr(self, chn_name)
+        qcm_arrs = {
+            'index': df.index.values,
+            'queue_id': df['queue_id'].values.astype('int64'),
+            't': self._get_t_s_arr(chn_name) if df.shape[0] else np.empty(0),
+            'temp': df['temp'].values.astype(float),
+            'marks': self.get_harm_arr(chn_name, 'marks'),
+            'fs': self.get_harm_arr(chn_name, 'fs'),
+            'gs': self.get_harm_arr(chn_name, 'gs'),
+        }
+        for col in ['fstars', 'delfstars', 'f0stars', 'delfs', 'delgs', 'f0s', 'g0s']:
+            qcm_arrs[col] = self._get_derived_arr(chn_name, col)
+
+        return qcm_arrs
+
+
     def shape_qcmdf_b_to_a(self, df_a, df_b, idx_a, idx_b):
         '''
         given qcm_df a and b,
         make a new df with shape of a and iterpolated data of b
-        columns = ['queue_id', 't', 'temp', 'marks', 'fstars', 'fs', 'gs', 'delfstars', 'delfs', 'delgs', 'f0stars', 'f0s', 'g0s']
+        columns = ['queue_id', 'marks', 'fstars', 'fs', 'gs', 'delfstars', 'delfs', 'delgs', 'f0stars', 'f0s', 'g0s']
+        see self.shape_qcm_arrays_b_to_a
         '''
-        logger.info('df_a %s', df_a) 
-        logger.info('df_b %s', df_b) 
-        
-        # make a new df with the same shape of df_a
-        df = df_a.copy()
-        # we don't need columns 't', and 'queue_id'
-        df.pop('t')
-        df.pop('temp')
-        
-        # get temp from df (df_a)
-        temp_a = df_a.temp
-        temp_b = df_b.temp
+        arrs = self.shape_qcm_arrays_b_to_a(self._qcm_df_to_arrays(df_a), self._qcm_df_to_arrays(df_b), idx_a, idx_b)
+        if arrs is None:
+            return
+
+        df = pd.DataFrame({'queue_id': arrs['queue_id']}, index=arrs['index'])
+        df['marks'] = df_a['marks']
+        for col in qcm_interp_cols + ['fstars', 'delfstars', 'f0stars']:
+            df[col] = arrs[col].tolist()
+        return df
+
+
+    def _qcm_df_to_arrays(self, df):
+        '''
+        convert df from self.df_qcm to dict of arrays as self.qcm_arrays
+        '''
+        nharm = len(self.nan_harm_list())
+        arrs = {
+            'index': df.index.values,
+            'queue_id': df['queue_id'].values.astype('int64'),
+            'temp': df['temp'].values.astype(float),
+            'marks': HarmonicTable.to_array(df['marks'], nharm),
+        }
+        for col in qcm_interp_cols:
+            arrs[col] = HarmonicTable.to_array(df[col], nharm)
+        return arrs
+
+
+    def shape_qcm_arrays_b_to_a(self, arrs_a, arrs_b, idx_a, idx_b):
+        '''
+        given qcm arrays a and b (self.qcm_arrays),
+        return qcm arrays with rows of a and data of b 
+        interpolated by temperature of a (variable temperature) or averaged (constant temperature)
+        idx_a, idx_b: index (list or list of lists for segments) of rows in a and b
+            segments of a use the segments of b with the same order (modulus)
+        keys = ['index', 'queue_id', 'marks', 'fstars', 'fs', 'gs', 'delfstars', 'delfs', 'delgs', 'f0stars', 'f0s', 'g0s']
+        all harmonics and columns of a segment are interpolated in one call (RefModel)
+        '''
+        nrows = arrs_a['index'].shape[0]
+        nharm = arrs_a['fs'].shape[1]
+        vals = np.full((nrows, nharm * len(qcm_interp_cols)), np.nan) # stacked columns
 
         mode = self.exp_ref.get('mode')
 
-        # iterate the columns
-        for col in df.columns:
-            if col not in ['queue_id', 't', 'temp', 'marks']: # f/g columns with columns
-                # clear all values execpt queue_id, t, temp
-                logger.info('col %s', col) 
-                df[col] = df[col].apply(lambda x: self.nan_harm_list())
-                # get value
-                col_s = df_b[col].copy()
-
-                if mode['cryst'] == 'single':
-                    col_arr = np.array(col_s.values.tolist()) # convert series to array of array ??
-                    
-                    # col_l = col_s.values.tolist()
-                    # for i in range(len(col_l)):
-                    #     try:
-                    #         logger.info(len(col_l[i]))
-                    #     except:
-                    #         logger.info(i, col_l[i])
-
-                    if mode['temp'] == 'const': # single crystal and constant temperature
-                        col_mean = np.mean(col_arr, axis=0) # get mean of each column
-                        logger.info('col_arr %s', col_arr) 
-                        logger.info('col_mean %s', col_mean) 
-                        df[col] = df[col].apply(lambda x: list(col_mean)) # save back to all rows
-                    elif mode['temp'] == 'var': # single crystal and variable temperature
-                        ## calc interp fun
-                        # check if all elements in self.exp_ref.ref_ref[1] is list
-                        if all([isinstance(l, list) for l in idx_b]): # all list
-                            pass
-                        elif all([isinstance(l, int) for l in idx_b]): # all int
-                            idx_b = [idx_b] # put into a list
-                        else:
-                            logger.warning('Check index format!')
-                            return
-
-                        logger.info('col_s %s', col_s.iloc[0]) 
-                        logger.info('col_fs %s', df_b['fs'].iloc[0]) 
-                        # logger.info('col_arr %s', col_arr) 
-                        logger.info('col_arr.shape %s', col_arr.shape) 
-                        # iterate columns in col_arr
-                        n_arr_cols = col_arr.shape[1] if len(col_arr.shape) > 1 else 1
-                        logger.info('n_arr_cols %s', n_arr_cols) 
-
-                        func_list = []
-                        # calc the fun
-                        for ind_list in idx_b:
-                            func_seg_list = []
-                            temp_b_ind = temp_b[ind_list]
-
-                            for i in range(n_arr_cols): # each column in array
-                                if n_arr_cols > 1:
-                                    col_arr_i = col_arr[ind_list, i]
-                                else: #single column
-                                    col_arr_i = col_arr[ind_list]
-                                
-                                # logger.info(i) 
-                                # logger.info(type(col_s.values)) 
-                                # logger.info(col_s.values.dtype) 
-                                # logger.info(col_s.values.tolist()) 
-                                # logger.info(col_arr) 
-                                # logger.info(type(col_arr)) 
-                                # logger.info(type(col_arr[0])) 
-                                # logger.info(type(col_arr_i)) 
-                                # logger.info(col_arr_i) 
-                                # logger.info(type(col_arr_i[0])) 
-                                # logger.info(col_arr_i[0]) 
-                                if np.isnan(col_arr_i).all(): # no data in harm and ind_list
-                                    func_seg_list.append(lambda temp: np.array([np.nan] * len(temp))) # add a func return nan
-                                else: # there is data
-                                    logger.info('%s %s', temp_b_ind.shape, col_arr_i.shape)
-                                    func_seg_list.append(interp1d(temp_b_ind, col_arr_i, kind=self.exp_ref['mode']['fit'], fill_value=np.nan, bounds_error=False))
-                            func_list.append(lambda temp: [func_seg(temp) for func_seg in func_seg_list])    
- 
-                        # check if all elements in self.exp_ref.samp_ref[1] is list
-                        if all([isinstance(l, list) for l in idx_a]): # all list
-                            pass
-                        elif all([isinstance(l, int) for l in idx_a]): # all int
-                            idx_a = [idx_a] # put into a list
-                        else:
-                            logger.warning('Check index format!')
-                        
-                        # get interpolated f and g by temp_a
-                        for seg, ind_list in enumerate(idx_a): # iterate each list
-                            temp_a_ind = temp_a[ind_list]
-                            # use modulus 
-                            v_list = func_list[seg % len(func_list)](temp_a_ind)
-                            # transpose 
-                            val_list = np.transpose(np.array(v_list)).tolist()
-                            logger.info('len(val_list) %s', len(val_list)) 
-
-                            df[col][ind_list] = val_list
-
-                elif mode['cryst'] == 'dual': #TODO
-                    if mode['temp'] == 'const': # dual crystal and constant temperature
-                        pass
-                    elif mode['temp'] == 'var': # dual crystal and constant temperature
-                        pass
-                    else:
-                        pass
-        
-        return df
+        if mode['cryst'] == 'single':
+            segs_a = self._idx_segs(idx_a)
+            segs_b = self._idx_segs(idx_b)
+            if segs_b is None:
+                logger.warning('Check index format!')
+                return
+            if segs_a is None:
+                logger.warning('Check index format!')
+                segs_a = []
+
+            rows_a = pd.Index(arrs_a['index'])
+            rows_b = pd.Index(arrs_b['index'])
+            kind = 'const' if mode['temp'] == 'const' else mode['fit']
+            n_f = len(qcm_interp_cols) // 2 # number of f columns
+            stacked_b = np.concatenate([arrs_b[col] for col in qcm_interp_cols], axis=1)
+
+            models = []
+            for ind_list in segs_b:
+                pos_b = rows_b.get_indexer(ind_list)
+                pos_b = pos_b[pos_b >= 0]
+                models.append(RefModel(arrs_b['temp'][pos_b], stacked_b[pos_b, :n_f * nharm], stacked_b[pos_b, n_f * nharm:], kind=kind))
+
+            # get interpolated f and g by temp_a
+            for seg, ind_list in enumerate(segs_a): # iterate each list
+                pos_a = rows_a.get_indexer(ind_list)
+                pos_a = pos_a[pos_a >= 0]
+                # use modulus 
+                f, g = models[seg % len(models)].eval(arrs_a['temp'][pos_a])
+                vals[pos_a] = np.concatenate([f, g], axis=1)
+
+        elif mode['cryst'] == 'dual': #TODO
+            pass
+
+        arrs = {
+            'index': arrs_a['index'],
+            'queue_id': arrs_a['queue_id'],
+            'marks': arrs_a['marks'],
+        }
+        for i, col in enumerate(qcm_interp_cols):
+            arrs[col] = vals[:, i * nharm: (i + 1) * nharm]
+        arrs['fstars'] = arrs['fs'] + 1j * arrs['gs']
+        arrs['delfstars'] = arrs['delfs'] + 1j * arrs['delgs']
+        arrs['f0stars'] = arrs['f0s'] + 1j * arrs['g0s']
+
+        return arrs
+
+
+    def _idx_segs(self, idx):
+        '''
+        return index idx as a list of segments (lists)
+        None if the format is not known
+        '''
+        if all([isinstance(l, list) for l in idx]): # all list
+            return idx
+        elif all([isinstance(l, (int, np.integer)) for l in idx]): # all int
+            return [idx] # put into a list
+        return
 
 
     def get_mech_key(self, nhcalc):
@@ -2814,8 +3892,7 @@ class DataSaver:
         else: # time column is found
             df.rename(columns={t_str[0]: 't'}, inplace=True) # rename time column
         # save t as (delt + t0) 
-        # df['t'] = (df['t'] + t0).strftime(config_default['time_str_format'])
-        df['t'] = df['t'].apply(lambda x: (t0 + datetime.timedelta(seconds=x)).strftime(config_default['time_str_format']))
+        df['t'] = (pd.Timestamp(t0) + pd.to_timedelta(df['t'].astype(float), unit='s')).dt.strftime(config_default['time_str_format'])
         
         # temperature: temp
         temp_str = list(set(config_default['data_saver_import_data']['temp']) & set(columns))
@@ -2859,15 +3936,12 @@ class DataSaver:
             harm_list = num_list
         logger.info('harm_list %s', harm_list) 
 
-        # initiate reference and create the make up raw data
+        # initiate reference
         ref_fs = {'ref':[]}
         ref_gs = {'ref':[]}
-        fGB = {'samp': {}, 'ref': {}} # a make up dict for f, G, B
         for harm in harm_list:
             ref_fs['ref'].append(f1 * harm)
             ref_gs['ref'].append(g1 * harm)
-            fGB['samp'][str(harm)] = np.nan
-            fGB['ref'][str(harm)] = np.nan
 
 
         for fs_str in config_default['data_saver_import_data']['fs']:
@@ -2915,7 +3989,7 @@ class DataSaver:
         for harm in harm_list:
             if fs_str and gs_str:
                 f_str = fs_str.format(harm)
-                g_str = fs_str.format(harm)
+                g_str = gs_str.format(harm)
             else: # delta values
                 f_str = delfs_str.format(harm)
                 g_str = delgs_str.format(harm)
@@ -2923,42 +3997,25 @@ class DataSaver:
             fg_rename_cols[g_str] = 'g'+str(harm)
         df.rename(columns=fg_rename_cols, inplace=True) # rename f/g columns 
                
-        # f/g to one column fs/gs
-        df['fs'] = df.filter(regex=r'^f\d+$').values.tolist()
-        df['gs'] = df.filter(regex=r'^g\d+$').values.tolist()
-        # queue_list 
-        df['queue_id'] = list(df.index.astype(int))
-        # marks
-        single_marks = [0 for _ in harm_list]
-        # for i in range(1, settings['max_harmonic']+2, 2):
-        #     if str(i) not in harm_list: # tested harmonic
-        #         single_marks.insert(int((i-1)/2), np.nan)
-        # logger.info(harm_list) 
-        # logger.info(single_marks) 
-        # df['marks'] = [single_marks] * df.shape[0]
-
-        ## save to self.samp 
-        # self.samp = self.samp.append(df, ignore_index=True, sort=False)
-
-        logger.info('df before dynamic_save %s', df.head()) 
-        ## ANOTHER WAY to save is use self.dynamic_save and save the data to self.samp row by row
-
         # convert harm_list from list of int to list of str
         harm_list = [str(harm) for harm in harm_list]
-        for i in df.index: # loop each row
-            self.dynamic_save(['samp'], harm_list, t={'samp': df.t[i]}, temp={'samp': df.temp[i]}, f=fGB, G=fGB, B=fGB, fs={'samp': df.fs[i]}, gs={'samp': df.gs[i]}, marks=single_marks)
-
-        # logger.info(self.samp.head()) 
-        logger.info(self.samp.fs[0]) 
-        logger.info(self.samp['marks'][0]) 
 
-        self.queue_list = list(self.samp.index)
+        ## save to self.samp in one pass. No raw data for imported data
+        self._save_queues_bulk(
+            'samp', 
+            harm_list, 
+            t=df['t'].values, 
+            temp=df['temp'].values, 
+            fs=df[['f' + harm for harm in harm_list]].values, 
+            gs=df[['g' + harm for harm in harm_list]].values,
+            queue_ids=df.index.values.astype(int),
+        )
+        logger.info(self.samp.head()) 
 
         # set ref
         # save ref_fs ref_gs to self.ref as reference
-        self.dynamic_save(['ref'], harm_list, t={'ref': t0_str}, temp={'ref': np.nan}, f=fGB, G=fGB, B=fGB, fs=ref_fs, gs=ref_gs, marks=single_marks)
+        self._save_queues_bulk('ref', harm_list, t=[t0_str], temp=[np.nan], fs=[ref_fs['ref']], gs=[ref_gs['ref']])
         logger.info(self.ref.head()) 
-        logger.info(self.ref['marks'][0]) 
         
         # set reference
         self.set_ref_set('samp', 'ref', idx_list=[0])
@@ -35,6 +35,7 @@ from matplotlib.container import ErrorbarContainer # for checking if l[ln] is Er
 from mpl_toolkits.axes_grid1 import make_axes_locatable
 
 import types
+import time
 
 import numpy as np
 import pandas as pd
@@ -44,6 +45,7 @@ logger = logging.getLogger(__name__)
 
 import UISettings 
 from modules import UIModules
+from modules.PlotRefresh import BlitManager, LineLOD, set_errorbar_data
 
 config_default = UISettings.get_config() # load default configuration
 
@@ -119,6 +121,14 @@ class MatplotlibWidget(QWidget):
         self.canvas.setFocus()
         # connect with resize function
         # self.canvas.mpl_connect("resize_event", self.resize)
+        # redraw changed lines over cached background
+        self.blit_manager = BlitManager(self.canvas, enable=config_default['mpl_blit'], shrink=config_default['mpl_blit_shrink'])
+        self.pending = {} # line updates waiting for flush_data {ln: arg}
+        self.lod = None # level of detail of the lines with many points (LineLOD)
+        # figures not shown (e.g. other tabs) are drawn when shown
+        self.defer_draw = config_default['mpl_defer_draw']
+        self.draw_deferred = False # a draw is waiting for showEvent
+        self.show_callbacks = {} # functions called once at the next showEvent by key (call_on_show)
 
         # layout
         self.vbox = QVBoxLayout()
@@ -359,11 +369,13 @@ class MatplotlibWidget(QWidget):
     def update_sp_text_chi(self, chi=None):
         '''
         chi: number
+        the text is redrawn with the lines by the next blitted frame (update_data) or full draw
         '''
         if not chi:
             self.txt['chi'].set_text('')
         else:
             self.txt['chi'].set_text(r'$\chi^2$ = {:.4f}'.format(chi))
+        self.blit_manager.add_artists([self.txt['chi']])
 
 
     def init_sp_fit(self, title='', xlabel='', ylabel='', xlim=None, ylim=None, xscale='linear', yscale='linear', *args, **kwargs):
@@ -597,6 +609,14 @@ class MatplotlibWidget(QWidget):
         
         self.cid = None # for storing the cid of pick_event
 
+        # decimate data of .l<nharm> and .lm<nharm> by the pixels of the view
+        if config_default['mpl_lod']:
+            self.lod = LineLOD(
+                self.ax[0],
+                [self.l[l_str + str(i)][0] for l_str in ['l', 'lm'] for i in range(1, int(config_default['max_harmonic']+2), 2)],
+                px_per_bin=config_default['mpl_lod_px'],
+            )
+
         # set label of ax[1]
         self.set_ax(self.ax[0], xlabel='Time (s)',ylabel=ylabel)
 
@@ -703,7 +723,10 @@ class MatplotlibWidget(QWidget):
                 
                 # logger.info(l_str) 
                 # logger.info(self.l[l_str + harm][0].get_data()) 
-                harm_x, harm_y = self.l[l_str + harm][0].get_data()
+                if self.lod is not None: # full data of decimated line
+                    harm_x, harm_y = self.lod.get_data(self.l[l_str + harm][0])
+                else:
+                    harm_x, harm_y = self.l[l_str + harm][0].get_data()
                 
                 if isinstance(harm_x, pd.Series): # if data is series (not empty)
                     sel_bool = harm_x.between(x1, x2) & harm_y.between(y1, y2)
@@ -742,6 +765,10 @@ class MatplotlibWidget(QWidget):
         x_p = thisline.get_xdata()
         y_p = thisline.get_ydata()
         ind = event.ind[0]
+        if self.lod is not None and self.lod.has(thisline): # ind in full data
+            pos = self.lod.full_pos(thisline, ind)
+        else:
+            pos = ind
         logger.info(thisline) 
         # logger.info(dir(thisline)) 
         logger.info(thisline.get_label()) 
@@ -754,7 +781,7 @@ class MatplotlibWidget(QWidget):
         logger.info('x_p %s', x_p) 
         logger.info('%s %s', x_p.iloc[ind], y_p.iloc[ind]) 
         self.l['lp'][0].set_data(x_p.iloc[ind], y_p.iloc[ind])
-        self.l['lp'][0].set_label(thisline.get_label() + '_' + str(ind)) # transfer the label of picked line and ind to 'lp'
+        self.l['lp'][0].set_label(thisline.get_label() + '_' + str(pos)) # transfer the label of picked line and ind to 'lp'
         self.canvas_draw()
 
         # set
@@ -785,7 +812,8 @@ class MatplotlibWidget(QWidget):
             self.ax.append(make_axes_locatable(self.ax[0]).append_axes("right", size="5%", pad="2%"))
 
         if not 'X' in kwargs or not 'Y' in kwargs or not 'Z' in kwargs:
-            num = config_default['contour_array']['num']
+            # placeholder till the contours are made. coarse grid for startup time
+            num = config_default['contour_array']['num_coarse'] or config_default['contour_array']['num']
             phi_lim = config_default['contour_array']['phi_lim']
             dlam_lim = config_default['contour_array']['dlam_lim']
 
@@ -868,6 +896,36 @@ class MatplotlibWidget(QWidget):
         self.ax[0].autoscale(enable=False)
 
 
+    def update_contour(self, X, Y, Z, levels, cmap, title=''):
+        '''
+        replace the contour .l['C'] and update the colorbar .l['colorbar'] of the contour plot
+        the axes and the data lines (.l<n>, .p<n>, .pm<n>) are kept
+        '''
+        if 'C' not in self.l: # not initialized
+            self.init_contour(X=X, Y=Y, Z=Z, levels=levels, cmap=cmap, title=title)
+            return
+
+        try:
+            self.l['C'].remove()
+        except AttributeError: # ContourSet is not an artist (matplotlib < 3.8)
+            for coll in self.l['C'].collections:
+                coll.remove()
+
+        self.l['C'] = self.ax[0].contourf(
+            X, Y, Z, # X, Y, Z
+            levels=levels, 
+            cmap=cmap,
+        ) # contour
+        self.l['colorbar'].update_normal(self.l['C'])
+        self.l['colorbar'].locator = ticker.MaxNLocator(nbins=6)
+        self.l['colorbar'].update_ticks()
+
+        if title:
+            self.ax[0].set_title(title)
+
+        self.canvas_draw()
+
+
     def init_legendfig(self, *args, **kwargs):
         ''' 
         plot a figure with only legend
@@ -1082,7 +1140,31 @@ class MatplotlibWidget(QWidget):
         else:
             pass
 
-    def update_data(self, *args):
+    def submit_data(self, *args):
+        '''
+        keep the updates (the same args as update_data) till flush_data
+        a new update of a line replaces the pending one
+        return number of replaced updates
+        '''
+        nsuperseded = 0
+        for arg in args:
+            if arg['ln'] in self.pending:
+                nsuperseded += 1
+                arg = {**self.pending[arg['ln']], **arg} # keep label
+            self.pending[arg['ln']] = arg
+        return nsuperseded
+
+
+    def flush_data(self):
+        '''
+        update the pending data
+        '''
+        args, self.pending = list(self.pending.values()), {}
+        if args:
+            self.update_data(*args, idle=True)
+
+
+    def update_data(self, *args, idle=False):
         ''' 
         update data of given in args (dict)
         arg = {'ln':, 'x':, 'y':, 'xerr':, 'yerr':, 'label':,}
@@ -1090,9 +1172,13 @@ class MatplotlibWidget(QWidget):
             x : x data
             y : y data
             yerr: y error
+        idle: full redraw by draw_idle
         NOTE: don't use this func to update contour
         '''
         axs = set() # initialize a empty set
+        changed = [] # artists with new data
+        relabel = False
+        lod_data = {} # data of decimated lines
         
         for arg in args:
             keys = arg.keys()
@@ -1107,25 +1193,9 @@ class MatplotlibWidget(QWidget):
                     xerr = arg['xerr'] 
                     yerr = arg['yerr']
 
-                    line, caplines, barlinecols = self.l[ln]
-                    line.set_data(x, y)
-                    # Find the ending points of the errorbars 
-                    error_positions = (x-xerr,y), (x+xerr,y), (x,y-yerr), (x,y+yerr) 
-                    # Update the caplines 
-                    for i, pos in enumerate(error_positions): 
-                        # logger.info('i %s', i) 
-                        # logger.info(caplines) 
-                        # logger.info('caplines_len %s', len(caplines)) 
-                        caplines[i].set_data(pos) 
-                    # Update the error bars 
-                    barlinecols[0].set_segments(zip(zip(x-xerr,y), zip(x+xerr,y))) 
-                    barlinecols[1].set_segments(zip(zip(x,y-yerr), zip(x,y+yerr))) 
-                    
-                    # barlinecols[0].set_segments(
-                    #     np.array([[x - xerr, y], 
-                    #     [x + xerr, y]]).transpose((2, 0, 1))
-                    # ) 
-                    axs.add(line.axes)
+                    # update line, caplines and error bars ((N, 2, 2) segments)
+                    set_errorbar_data(self.l[ln], x, y, xerr, yerr)
+                    axs.add(self.l[ln][0].axes)
             else: # not errorbar
                 ln = arg['ln'] 
                 x = arg['x'] 
@@ -1133,23 +1203,46 @@ class MatplotlibWidget(QWidget):
                 # logger.info(len(x: %s), len(y)) 
                 # self.l[ln][0].set_xdata(x)
                 # self.l[ln][0].set_ydata(y)
-                self.l[ln][0].set_data(x, y)
+                if self.lod is not None and self.lod.has(self.l[ln][0]): # decimated
+                    lod_data[self.l[ln][0]] = (x, y)
+                else:
+                    self.l[ln][0].set_data(x, y)
                 axs.add(self.l[ln][0].axes)
             
             if 'label' in keys: # with label
                 self.l[ln][0].set_label(arg['label'])
+                relabel = True # legend changed
+
+            # the changed artists
+            if isinstance(self.l[arg['ln']], ErrorbarContainer):
+                line, caplines, barlinecols = self.l[arg['ln']]
+                changed.extend([line, *caplines, *barlinecols])
+            else:
+                changed.append(self.l[arg['ln']][0])
 
-            # ax = self.l[ln][0].axes
-            # axbackground = self.canvas.copy_from_bbox(ax.bbox)
-            # logger.info(ax) 
-            # self.canvas.restore_region(axbackground)
-            # ax.draw_artist(self.l[ln][0])
-            # self.canvas.blit(ax.bbox)
+        if lod_data:
+            self.lod.set_data(lod_data)
+
+        hidden = self.defer_draw and not self.isVisible() # drawn when shown
+        if self.blit_manager.enable and not relabel and not hidden:
+            self.blit_manager.add_artists(changed)
+            self.blit_manager.update(axs)
+            return
 
         for ax in axs:
             self.reset_ax_lim(ax)
 
-        self.canvas_draw()
+        if idle and not hidden:
+            self.canvas.draw_idle()
+        else:
+            self.canvas_draw()
+
+
+    def frame_stats(self):
+        '''
+        return number and mean time (ms) of blitted and full frames
+        '''
+        return self.blit_manager.summary()
 
 
     def get_data(self, ls=[]):
@@ -1199,27 +1292,18 @@ class MatplotlibWidget(QWidget):
             # logger.info(key) 
             if key not in ['temp', 'C', 'colorbar']:
                 if  l_list is None or key in l_list: # clear all or key
+                    self.pending.pop(key, None) # drop the update not drawn
                     # self.l[key][0].set_xdata([])
                     # self.l[key][0].set_ydata([])
                     
                     
                     if isinstance(self.l[key], ErrorbarContainer): # errorbar plot
                         # clear errorbar
-                        line, caplines, barlinecols = self.l[key]
-                        line.set_data([], [])
-
-                        error_positions = ([],[]), ([],[]), ([],[]), ([],[]) 
-                        # Update the caplines 
-                        for i, pos in enumerate(error_positions): 
-                            # logger.info('i %s', i) 
-                            # logger.info(caplines) 
-                            # logger.info('caplines_len %s', len(caplines)) 
-                            caplines[i].set_data(pos) 
-                        # Update the error bars 
-                        barlinecols[0].set_segments(zip(zip([],[]), zip([],[]))) 
-                        barlinecols[1].set_segments(zip(zip([],[]), zip([],[]))) 
+                        set_errorbar_data(self.l[key], [], [], [], [])
                     else:
                         self.l[key][0].set_data([], []) # line plot
+                        if self.lod is not None:
+                            self.lod.discard(self.l[key][0])
 
 
 
@@ -1304,14 +1388,41 @@ class MatplotlibWidget(QWidget):
     def canvas_draw(self):
         '''
         redraw canvas after data changed
+        the draw is deferred to showEvent if the widget is not shown
         '''
+        if self.defer_draw and not self.isVisible():
+            self.draw_deferred = True
+            return
+        self.draw_deferred = False
+        t_start = time.perf_counter()
         self.canvas.draw()
+        self.blit_manager.add_frame('full', time.perf_counter() - t_start)
         # self.canvas.draw_idle()
         # self.canvas.draw_event()
         # self.canvas.draw_cursor()
         self.canvas.flush_events() # flush the GUI events 
 
 
+    def showEvent(self, event):
+        super(MatplotlibWidget, self).showEvent(event)
+        callbacks, self.show_callbacks = self.show_callbacks, {}
+        for func in callbacks.values():
+            func()
+        if self.draw_deferred: # not drawn by the callbacks
+            self.canvas_draw()
+
+
+    def call_on_show(self, func, key=None):
+        '''
+        call func at the next time the widget is shown (now if it is shown)
+        key: a func waiting with the same key is replaced by func. None: func is added
+        '''
+        if self.isVisible():
+            func()
+        else:
+            self.show_callbacks[func if key is None else key] = func
+
+
     def data_show_all(self):
         for ax in self.ax:
             ax.set_autoscale_on(True) # this reactive autoscale which might be turnned of by zoom/pan
@@ -2,14 +2,15 @@
 class for peak tracking and fitting 
 '''
 import numpy as np
-from lmfit import Model, Minimizer, minimize, Parameters, fit_report, printfuncs
-from lmfit.models import ConstantModel
-from scipy.signal import find_peaks, find_peaks_cwt, peak_widths, peak_prominences
 from random import randrange
 
 import UISettings
 from modules import UIModules
 
+# imported at the first fitting
+lmfit = UIModules.lazy_import('lmfit')
+scipy_signal = UIModules.lazy_import('scipy.signal')
+
 # for debugging
 import traceback
 
@@ -49,9 +50,9 @@ def make_gmod(n):
     input:
     n:    number of peaks
     '''
-    gmod = ConstantModel(prefix='g_')
+    gmod = lmfit.models.ConstantModel(prefix='g_')
     for i in np.arange(n):
-        gmod_i = Model(fun_G, prefix='p'+str(i)+'_', name='g'+str(i))
+        gmod_i = lmfit.Model(fun_G, prefix='p'+str(i)+'_', name='g'+str(i))
         gmod += gmod_i
     return gmod
 
@@ -62,9 +63,9 @@ def make_bmod(n):
     input:
     n:    number of peaks
     '''
-    bmod = ConstantModel(prefix='g_')
+    bmod = lmfit.models.ConstantModel(prefix='g_')
     for i in np.arange(n):
-        bmod_i = Model(fun_B, prefix='p'+str(i)+'_', name='b'+str(i))
+        bmod_i = lmfit.Model(fun_B, prefix='p'+str(i)+'_', name='b'+str(i))
         bmod += bmod_i
     return bmod
 
@@ -75,13 +76,13 @@ def make_gbmodel(n=1):
     input:
     n:    number of peaks
     '''
-    gmod = ConstantModel(prefix='g_')
-    bmod = ConstantModel(prefix='b_')
+    gmod = lmfit.models.ConstantModel(prefix='g_')
+    bmod = lmfit.models.ConstantModel(prefix='b_')
 
     for i in np.arange(n):
         # gmod and bmod sharing the same varible so use the same prefix
-        gmod_i = Model(fun_G, prefix='p'+str(i)+'_', name='g'+str(i))
-        bmod_i = Model(fun_B, prefix='p'+str(i)+'_', name='b'+str(i))
+        gmod_i = lmfit.Model(fun_G, prefix='p'+str(i)+'_', name='g'+str(i))
+        bmod_i = lmfit.Model(fun_B, prefix='p'+str(i)+'_', name='b'+str(i))
         gmod += gmod_i
         bmod += bmod_i
     
@@ -99,13 +100,13 @@ def make_models(n=1):
     '''
     gmods = []
     bmods = []
-    gc = ConstantModel(prefix='g_')
-    bc = ConstantModel(prefix='b_')
+    gc = lmfit.models.ConstantModel(prefix='g_')
+    bc = lmfit.models.ConstantModel(prefix='b_')
 
     for i in np.arange(n):
         # gmod and bmod sharing the same varible so use the same prefix
-        gmod_i = Model(fun_G, prefix='p'+str(i)+'_', name='g'+str(i)) + gc
-        bmod_i = Model(fun_B, prefix='p'+str(i)+'_', name='b'+str(i)) + bc
+        gmod_i = lmfit.Model(fun_G, prefix='p'+str(i)+'_', name='g'+str(i)) + gc
+        bmod_i = lmfit.Model(fun_B, prefix='p'+str(i)+'_', name='b'+str(i)) + bc
         gmods.append(gmod_i)
         bmods.append(bmod_i)
     
@@ -121,12 +122,12 @@ def make_model_n(n=1):
         gmod = the nth model of G
         bmod = the nth model of B
     '''
-    gc = ConstantModel(prefix='g_')
-    bc = ConstantModel(prefix='b_')
+    gc = lmfit.models.ConstantModel(prefix='g_')
+    bc = lmfit.models.ConstantModel(prefix='b_')
 
     # gmod and bmod sharing the same varible so use the same prefix
-    gmod = Model(fun_G, prefix='p'+str(i)+'_', name='g'+str(i)) + gc
-    bmod = Model(fun_B, prefix='p'+str(i)+'_', name='b'+str(i)) + bc
+    gmod = lmfit.Model(fun_G, prefix='p'+str(i)+'_', name='g'+str(i)) + gc
+    bmod = lmfit.Model(fun_B, prefix='p'+str(i)+'_', name='b'+str(i)) + bc
     
     return gmod, bmod
 
@@ -137,20 +138,20 @@ def make_models_pars(n=1):
     input:
     n:    number of peaks
     '''
-    gmod = ConstantModel(prefix='g_', name='cg')
+    gmod = lmfit.models.ConstantModel(prefix='g_', name='cg')
     gpars = gmod.make_params(c=0)
-    bmod = ConstantModel(prefix='b_', name='cb')
+    bmod = lmfit.models.ConstantModel(prefix='b_', name='cb')
     bpars = bmod.make_params(c=0)
 
     for i in np.arange(1, n+1):
         # gmod and bmod sharing the same varible so use the same prefix
-        gmod_i = Model(fun_G, prefix='p'+str(i)+'_', name='g'+str(i))
+        gmod_i = lmfit.Model(fun_G, prefix='p'+str(i)+'_', name='g'+str(i))
         gpars.update(gmod_i.make_params())
         gpars['p'+str(i)+'_amp'].set(0, min=0)
         gpars['p'+str(i)+'_cen'].set()
         gpars['p'+str(i)+'_wid'].set(1, min=1)
         gpars['p'+str(i)+'_phi'].set(0, min=-np.pi/2, max=np.pi/2)
-        bmod_i = Model(fun_B, prefix='p'+str(i)+'_', name='b'+str(i))
+        bmod_i = lmfit.Model(fun_B, prefix='p'+str(i)+'_', name='b'+str(i))
         bpars.update(bmod_i.make_params())
         bpars['p'+str(i)+'_amp'].set(0, min=0)
         bpars['p'+str(i)+'_cen'].set()
@@ -246,7 +247,7 @@ def findpeaks_py(x, resonance, output=None, sortstr=None, threshold=None, promin
     logger.info('f distance %s', distance / (x[1] - x[0])) 
     logger.info(prominence) 
     logger.info('f width %s', width / (x[1] - x[0])) 
-    peaks, props = find_peaks(
+    peaks, props = scipy_signal.find_peaks(
         resonance, 
         threshold=threshold, 
         distance=max(1, distance / (x[1] - x[0])), # make it >= 1
@@ -322,8 +323,8 @@ def guess_peak_factors(freq, resonance):
     elif peak_finder_method == 'py_func': 
         #TODO if find_peaks(x) is necessary?
         cen_index = np.argmax(resonance) # use max value as peak
-        prominences = peak_prominences(resonance, np.array([cen_index])) # tuple of 3 arrays
-        widths = peak_widths(resonance, np.array([cen_index]), prominence_data=prominences, rel_height=0.5)
+        prominences = scipy_signal.peak_prominences(resonance, np.array([cen_index])) # tuple of 3 arrays
+        widths = scipy_signal.peak_widths(resonance, np.array([cen_index]), prominence_data=prominences, rel_height=0.5)
         
         cen = freq[cen_index] # peak center
         # use prominence as amp since the peak we are looking for is th tallest one
@@ -889,7 +890,7 @@ class PeakTracker:
             chn_name = self.active_chn
             harm = self.active_harm
 
-        params = Parameters()
+        params = lmfit.Parameters()
 
         # rough guess
         f = self.get_input(key='f', chn_name=chn_name, harm=harm)
@@ -1045,7 +1046,7 @@ class PeakTracker:
         # logger.info(B) 
         logger.info('mm params %s', self.harmoutput[chn_name][harm]['params']) 
         try:
-            result = minimize(
+            result = lmfit.minimize(
                 res_GB, 
                 self.get_output(key='params'), 
                 method='leastsq', 
@@ -1054,7 +1055,7 @@ class PeakTracker:
                 xtol=config_default['xtol'], ftol=config_default['ftol'],
                 nan_policy='omit', # ('raise' default, 'propagate', 'omit')
                 )
-            print(fit_report(result)) 
+            print(lmfit.fit_report(result)) 
             print('success: ', result.success)
             print('message: ', result.message)
             print('lmdif_message: ', result.lmdif_message)
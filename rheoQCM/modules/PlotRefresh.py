@@ -0,0 +1,494 @@
+'''
+modules for refreshing the matplotlib figures fast
+'''
+
+import time
+from collections import deque
+import numpy as np
+from matplotlib.collections import Collection
+from matplotlib.path import Path
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def errorbar_segments(x, y, xerr, yerr):
+    '''
+    return the ends of the error bars (x - xerr, x + xerr, y - yerr, y + yerr) and
+    the segments of the x and y error bars as (N, 2, 2) arrays
+    x, y: (N,) arrays or series
+    xerr, yerr: (N,) arrays, series or scalars (e.g. nan)
+    '''
+    x, y, xerr, yerr = np.broadcast_arrays(*[np.asarray(val, dtype=float) for val in [x, y, xerr, yerr]])
+    ends = [x - xerr, x + xerr, y - yerr, y + yerr]
+    xsegs = np.stack([np.stack([ends[0], y], axis=-1), np.stack([ends[1], y], axis=-1)], axis=1)
+    ysegs = np.stack([np.stack([x, ends[2]], axis=-1), np.stack([x, ends[3]], axis=-1)], axis=1)
+    return ends, xsegs, ysegs
+
+
+def set_segments_path(collection, segs):
+    '''
+    set (N, 2, 2) segments of a LineCollection as one path (moveto and lineto of each segment)
+    instead of a path of each segment. it is drawn in one call
+    '''
+    codes = np.tile(np.array([Path.MOVETO, Path.LINETO], dtype=Path.code_type), len(segs))
+    try:
+        Collection.set_paths(collection, [Path(segs.reshape(-1, 2), codes)])
+    except NotImplementedError: # LineCollection only takes segments
+        collection.set_segments(segs)
+
+
+def set_errorbar_data(container, x, y, xerr, yerr):
+    '''
+    set data of an errorbar plot (ErrorbarContainer with x and y error bars)
+    '''
+    line, caplines, barlinecols = container
+    line.set_data(x, y) # keep x, y (e.g. series for picking)
+    (xlo, xhi, ylo, yhi), xsegs, ysegs = errorbar_segments(x, y, xerr, yerr)
+    xv, yv = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    for capline, pos in zip(caplines, [(xlo, yv), (xhi, yv), (xv, ylo), (xv, yhi)]):
+        capline.set_data(*pos)
+    set_segments_path(barlinecols[0], xsegs)
+    set_segments_path(barlinecols[1], ysegs)
+
+
+def _first_hits(hit, seg):
+    '''
+    return the first positions in hit of each segment (seg: segment of each position in hit, sorted)
+    '''
+    return hit[np.r_[True, seg[hit][1:] != seg[hit][:-1]]] if hit.size else hit
+
+
+def minmax_xbins(x, y, x0, x1, nbins=None):
+    '''
+    min/max decimation of a line by x
+    return sorted positions of the first, last, min and max points of each of nbins bins of x in [x0, x1]
+    and the nearest points out of [x0, x1] (to keep the line to the edges of the view)
+    x, y: (N,) arrays. points with nan x or y are not selected
+    nbins: None for all points in [x0, x1]
+    '''
+    valid = np.flatnonzero(np.isfinite(x) & np.isfinite(y))
+    xv, yv = x[valid], y[valid]
+    sel = []
+    if xv.size > 1 and np.all(xv[1:] >= xv[:-1]): # sorted x (e.g. time). bins are contiguous
+        i0, i1 = np.searchsorted(xv, [x0, x1], side='left')[0], np.searchsorted(xv, x1, side='right')
+        if i0 > 0:
+            sel.append(valid[[i0 - 1]])
+        if i1 < xv.size:
+            sel.append(valid[[i1]])
+        if i1 > i0:
+            if nbins is None:
+                sel.append(valid[i0:i1])
+            else:
+                xs, ys = xv[i0:i1], yv[i0:i1]
+                starts = np.searchsorted(xs, np.linspace(x0, x1, nbins + 1)[:-1], side='left')
+                starts = np.unique(starts[starts < xs.size]) # non-empty bins
+                ends = np.r_[starts[1:], xs.size] - 1
+                counts = ends - starts + 1
+                seg = np.repeat(np.arange(starts.size), counts) # bin of each point
+                # first position of min and max in each bin
+                rows_min = _first_hits(np.flatnonzero(ys == np.repeat(np.minimum.reduceat(ys, starts), counts)), seg)
+                rows_max = _first_hits(np.flatnonzero(ys == np.repeat(np.maximum.reduceat(ys, starts), counts)), seg)
+                sel.append(valid[i0 + np.concatenate([starts, ends, rows_min, rows_max])])
+    else:
+        inside = (xv >= x0) & (xv <= x1)
+        pos = valid[inside]
+        if pos.size and nbins is None:
+            sel.append(pos)
+        elif pos.size:
+            if x1 > x0:
+                bins = np.minimum(((xv[inside] - x0) / (x1 - x0) * nbins).astype(int), nbins - 1)
+            else:
+                bins = np.zeros(pos.size, dtype=int)
+            order = np.lexsort((yv[inside], bins)) # by bin then y
+            bins_sorted = bins[order]
+            starts = np.flatnonzero(np.r_[True, bins_sorted[1:] != bins_sorted[:-1]])
+            ends = np.r_[starts[1:], bins_sorted.size] - 1
+            pos_sorted = pos[order]
+            sel.extend([
+                pos_sorted[starts], # min
+                pos_sorted[ends], # max
+                np.minimum.reduceat(pos_sorted, starts), # first
+                np.maximum.reduceat(pos_sorted, starts), # last
+            ])
+        # nearest points out of the range
+        left, right = xv < x0, xv > x1
+        if left.any():
+            sel.append(valid[left][[np.argmax(xv[left])]])
+        if right.any():
+            sel.append(valid[right][[np.argmin(xv[right])]])
+    if not sel:
+        return np.array([], dtype=int)
+    return np.unique(np.concatenate(sel))
+
+
+class LineLOD:
+    '''
+    level of detail of lines with many points in an axes.
+    The full data of the lines are kept and the lines are set with the decimated
+    data (minmax_xbins) in bins of px_per_bin pixels over the visible x range (the
+    whole data if x is autoscaled), so a redraw walks about 4 points per bin
+    however long the data is. Lines with no more than min_pts visible points (e.g.
+    zoomed in) have all the points in the view.
+    The decimation is rebuilt when the x limits change: at the button release of
+    zoom/pan, or at once for other changes (e.g. toolbar home/back).
+    '''
+    def __init__(self, ax, lines, px_per_bin=1, min_pts=None):
+        self.ax = ax
+        self.canvas = ax.figure.canvas
+        self.px_per_bin = px_per_bin
+        self.min_pts = min_pts # default: 4 points per bin
+        self.full = {line: None for line in lines} # {line: (x, y)} full data of lines
+        self.rows = {} # {line: positions of the shown points in the full data} None for full data
+        self._key = None # (x0, x1, nbins) of the decimation
+        self._pressed = False
+        self._stale = False
+        self.ax.callbacks.connect('xlim_changed', self._on_xlim)
+        self.canvas.mpl_connect('button_press_event', self._on_press)
+        self.canvas.mpl_connect('button_release_event', self._on_release)
+
+
+    def has(self, line):
+        return line in self.full
+
+
+    def _as_float(self, data):
+        try:
+            return np.asarray(data, dtype=float)
+        except (TypeError, ValueError): # not numbers
+            return None
+
+
+    def get_key(self):
+        '''
+        return (x0, x1, nbins) of the decimation in the scale of the x axis
+        '''
+        nbins = max(int(self.ax.bbox.width / self.px_per_bin), 1)
+        transform = self.ax.xaxis.get_transform()
+        if self.ax.get_autoscalex_on(): # the whole data
+            x0, x1 = np.inf, -np.inf
+            for data in self.full.values():
+                if data is None:
+                    continue
+                x = self._as_float(data[0])
+                if x is None or not x.size:
+                    continue
+                x = transform.transform(x)
+                x = x[np.isfinite(x)]
+                if x.size:
+                    x0, x1 = min(x0, x.min()), max(x1, x.max())
+        else:
+            x0, x1 = sorted(transform.transform(np.array(self.ax.get_xlim(), dtype=float)))
+        return (x0, x1, nbins)
+
+
+    def _decimate(self, line):
+        x, y = self.full[line]
+        rows = None
+        xf, yf = self._as_float(x), self._as_float(y)
+        x0, x1, nbins = self._key
+        min_pts = self.min_pts or 4 * nbins
+        if xf is not None and yf is not None and xf.size > min_pts and np.isfinite(x0):
+            xf = self.ax.xaxis.get_transform().transform(xf)
+            nvisible = np.count_nonzero((xf >= x0) & (xf <= x1))
+            if nvisible > min_pts:
+                rows = minmax_xbins(xf, yf, x0, x1, nbins)
+            elif nvisible < xf.size: # zoomed in. all points in the view
+                rows = minmax_xbins(xf, yf, x0, x1)
+        self.rows[line] = rows
+        if rows is None:
+            line.set_data(x, y)
+        elif hasattr(x, 'iloc'): # keep index of series
+            line.set_data(x.iloc[rows], y.iloc[rows])
+        else:
+            line.set_data(np.asarray(x)[rows], np.asarray(y)[rows])
+
+
+    def set_data(self, data):
+        '''
+        set full data of lines
+        data: {line: (x, y)}
+        '''
+        self.full.update(data)
+        key = self.get_key()
+        if key != self._key: # decimate all lines with the new bins
+            self._key = key
+            data = {line: val for line, val in self.full.items() if val is not None}
+        for line in data:
+            self._decimate(line)
+
+
+    def discard(self, line):
+        '''
+        clear the full data of line (line data cleared)
+        '''
+        if line in self.full:
+            self.full[line] = None
+            self.rows.pop(line, None)
+
+
+    def rebuild(self):
+        '''
+        decimate the lines again if the bins changed
+        return True if rebuilt
+        '''
+        key = self.get_key()
+        if key == self._key:
+            return False
+        self._key = key
+        for line, val in self.full.items():
+            if val is not None:
+                self._decimate(line)
+        return True
+
+
+    def get_data(self, line):
+        '''
+        return full data (x, y) of line
+        '''
+        if self.full.get(line) is None:
+            return line.get_data()
+        return self.full[line]
+
+
+    def full_pos(self, line, ind):
+        '''
+        return position in the full data of point ind of line
+        '''
+        rows = self.rows.get(line)
+        return ind if rows is None else int(rows[ind])
+
+
+    def _on_xlim(self, ax):
+        if self._pressed: # zooming/panning
+            self._stale = True
+        else:
+            self.rebuild()
+
+
+    def _on_press(self, event):
+        self._pressed = True
+
+
+    def _on_release(self, event):
+        self._pressed = False
+        if self._stale:
+            self._stale = False
+            if self.rebuild():
+                self.canvas.draw_idle()
+
+
+class BlitManager:
+    '''
+    redraw the artists with changed data of a figure over a cached background (blitting)
+    instead of drawing the whole figure (axes, ticks, labels, layout) again.
+    The background is the figure without the changed artists. It is captured
+    with a full draw when it is missing, and dropped by any other full draw of
+    the canvas (resize, zoom/pan, new lines, ...).
+    The axes are autoscaled (full draw) only if the data leave the current limits
+    or fill less than shrink of them.
+    '''
+    def __init__(self, canvas, enable=True, shrink=0.5, nframes=200):
+        self.canvas = canvas
+        self.fig = canvas.figure
+        self.enable = enable
+        self.shrink = shrink # autoscale if data span < shrink * view span
+        self.artists = {} # changed artists drawn over the background (dict as ordered set)
+        self.bg = None # cached background
+        self._capturing = False
+        self.nfull = 0 # number of full draws of the canvas
+        self.frames = {'blit': deque(maxlen=nframes), 'full': deque(maxlen=nframes)} # frame time in s
+        self.cid = self.canvas.mpl_connect('draw_event', self._on_draw)
+
+
+    def _on_draw(self, event):
+        self.nfull += 1
+        if not self._capturing:
+            self.bg = None # other artists, limits or size may be changed
+
+
+    def add_artists(self, artists):
+        for artist in artists:
+            if artist not in self.artists: # drawn in the background. capture it again without the artist
+                self.bg = None
+            self.artists[artist] = None
+
+
+    def add_frame(self, kind, dt):
+        self.frames[kind].append(dt)
+
+
+    def in_limits(self, ax):
+        '''
+        check if the data of visible lines in ax are in the view limits and fill at least shrink of them
+        axes with autoscale off (zoomed/panned) are always in limits
+        '''
+        ax.relim(visible_only=True)
+        data_lim, view_lim = ax.dataLim, ax.viewLim
+        for autoscale_on, axis, (d0, d1), (v0, v1) in [
+            (ax.get_autoscalex_on(), ax.xaxis, data_lim.intervalx, view_lim.intervalx),
+            (ax.get_autoscaley_on(), ax.yaxis, data_lim.intervaly, view_lim.intervaly),
+            ]:
+            if not autoscale_on:
+                continue
+            # compare in the scale of the axis (e.g.: log10 for log scale)
+            d0, d1, v0, v1 = axis.get_transform().transform(np.array([d0, d1, v0, v1], dtype=float))
+            if not np.all(np.isfinite([d0, d1])): # no data
+                continue
+            d0, d1 = min(d0, d1), max(d0, d1)
+            v0, v1 = min(v0, v1), max(v0, v1)
+            if d0 < v0 or d1 > v1: # out of limits
+                return False
+            if (d1 - d0) < self.shrink * (v1 - v0): # too small
+                return False
+        return True
+
+
+    def draw_artists(self):
+        for artist in list(self.artists):
+            if artist.axes is None and artist.figure is None: # removed from figure
+                self.artists.pop(artist)
+                continue
+            self.fig.draw_artist(artist)
+
+
+    def capture(self):
+        '''
+        full draw of the figure without the changed artists to cache the background.
+        then draw the artists on it
+        '''
+        for artist in self.artists:
+            artist.set_animated(True) # skipped by full draw
+        self._capturing = True
+        try:
+            self.canvas.draw()
+            self.bg = self.canvas.copy_from_bbox(self.fig.bbox)
+        finally:
+            self._capturing = False
+            for artist in self.artists:
+                artist.set_animated(False) # keep them in other draws (e.g.: savefig)
+        self.draw_artists()
+        self.canvas.blit(self.fig.bbox)
+
+
+    def update(self, axs):
+        '''
+        redraw the figure after data of self.artists in axs changed
+        return kind of the frame: 'blit' or 'full'
+        '''
+        t_start = time.perf_counter()
+        rescale = [ax for ax in axs if not self.in_limits(ax)]
+        for ax in rescale:
+            ax.autoscale_view(True, True, True)
+        if rescale or self.bg is None:
+            self.capture()
+            kind = 'full'
+        else:
+            self.canvas.restore_region(self.bg)
+            self.draw_artists()
+            self.canvas.blit(self.fig.bbox)
+            kind = 'blit'
+        self.add_frame(kind, time.perf_counter() - t_start)
+        return kind
+
+
+    def summary(self):
+        '''
+        return number and mean time (ms) of blitted and full frames in the recent frames
+        '''
+        stats = {'full_draws': self.nfull}
+        for kind, frames in self.frames.items():
+            stats[kind] = len(frames)
+            stats[kind + '_ms'] = float(np.mean(frames) * 1e3) if frames else np.nan
+        return stats
+
+
+class RedrawScheduler:
+    '''
+    collect the line updates (args of MatplotlibWidget.update_data) of the widgets
+    and apply them at most max_rate times per second.
+    The widgets keep the pending updates by line (submit_data) and a new update of
+    a line replaces the pending one (the superseded frame is dropped). flush applies
+    the pending updates of each widget in one update_data call.
+    start_timer(ms) is called to flush after ms (e.g. QTimer.singleShot) when the
+    first update is submitted after a flush.
+    max_rate=0 applies the updates at once.
+    '''
+    def __init__(self, max_rate=10, start_timer=None, nscans=100):
+        self.min_interval = 1 / max_rate if max_rate else 0 # in s
+        self.start_timer = start_timer
+        self.dirty = {} # widgets with pending updates (dict as ordered set)
+        self.widgets = {} # all widgets updated to count their full draws
+        self.timer_started = False
+        self.t_flush = -np.inf # time of last flush
+        self.nsubmitted = 0 # number of line updates submitted
+        self.nsuperseded = 0 # number of line updates replaced before drawn
+        self.nflushes = 0
+        self.scan_draws = deque(maxlen=nscans) # full draws of each scan
+        self._draws_at_scan = 0
+
+
+    def submit(self, widget, *args):
+        '''
+        submit updates of lines of widget as widget.update_data(*args)
+        '''
+        self.widgets[widget] = None
+        self.nsubmitted += len(args)
+        if not self.min_interval or self.start_timer is None: # no scheduling
+            widget.update_data(*args)
+            return
+        self.nsuperseded += widget.submit_data(*args)
+        self.dirty[widget] = None
+        if not self.timer_started:
+            self.timer_started = True
+            self.start_timer(int(self.delay() * 1000))
+
+
+    def delay(self):
+        '''
+        time (s) till the next flush is allowed
+        '''
+        return max(0, self.t_flush + self.min_interval - time.perf_counter())
+
+
+    def flush(self):
+        '''
+        apply the pending updates of the widgets
+        '''
+        self.timer_started = False
+        dirty, self.dirty = self.dirty, {}
+        for widget in dirty:
+            widget.flush_data()
+        self.t_flush = time.perf_counter()
+        self.nflushes += 1
+
+
+    def full_draws(self):
+        return sum(widget.blit_manager.nfull for widget in self.widgets)
+
+
+    def start_scans(self):
+        '''
+        start counting the full draws of scans (e.g. when a test starts)
+        '''
+        self.scan_draws.clear()
+        self._draws_at_scan = self.full_draws()
+
+
+    def end_scan(self):
+        '''
+        count the full draws since the end of the last scan
+        '''
+        draws = self.full_draws()
+        self.scan_draws.append(draws - self._draws_at_scan)
+        self._draws_at_scan = draws
+
+
+    def summary(self):
+        return {
+            'submitted': self.nsubmitted,
+            'superseded': self.nsuperseded,
+            'flushes': self.nflushes,
+            'full_draws': self.full_draws(),
+            'full_draws_per_scan': float(np.mean(self.scan_draws)) if self.scan_draws else np.nan,
+        }
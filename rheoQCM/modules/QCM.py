@@ -2,16 +2,17 @@
 This module is a modified version of QCM_functions.
 It is used for UI, but you can also use it for data analysis.
 The input and return data are all in form of DataFrame.
+The solver functions also take data of a single queue from arrays (DataSaver.qcm_arrays, queue_from_arrays).
 This module doesn't have plotting functions.
 
 NOTE: Differnt to other modules, the harmonics used in this module are all INT.
 '''
 
 
+from collections import OrderedDict
 import numpy as np
 import pandas as pd
-from scipy import optimize
-from lmfit import Minimizer, minimize, Parameters, fit_report, printfuncs
+# scipy.optimize is imported by the solving functions (startup time)
 
 import logging
 logger = logging.getLogger(__name__)
@@ -61,6 +62,30 @@ def nhcalc2nh(nhcalc):
     '''
     return [int(s) for s in nhcalc] 
 
+def queue_from_arrays(qcm_arrs, i):
+    '''
+    return data of a single queue (row i) of qcm_arrs (DataSaver.qcm_arrays) as a dict 
+    it can be used as qcm_queue in the solver functions instead of a df
+    '''
+    return {key: val[i] for key, val in qcm_arrs.items()}
+
+def queue_val(qcm_queue, col):
+    '''
+    return value of col of a single queue
+    qcm_queue: df (shape[0]=1) or dict from queue_from_arrays
+    '''
+    if isinstance(qcm_queue, dict):
+        return qcm_queue[col]
+    return qcm_queue[col].iloc[0]
+
+def queue_to_df(qcm_queue):
+    '''
+    convert a single queue dict from queue_from_arrays to df (shape[0]=1) with lists in cells as DataSaver.df_qcm
+    '''
+    if not isinstance(qcm_queue, dict):
+        return qcm_queue
+    return pd.DataFrame({key: [val.tolist() if isinstance(val, (np.ndarray, np.generic)) else val] for key, val in qcm_queue.items() if key != 'index'}, index=[qcm_queue.get('index', 0)])
+
 
 
 class QCM:
@@ -339,6 +364,8 @@ class QCM:
             ZL_all = self.calc_ZL(n, layers, 0)
             delfstar_sla_all = self.calc_delfstar_sla(ZL_all)
             
+            from scipy import optimize
+
             def solve_Zmot(x):
                 delfstar = x[0] + 1j * x[1]
                 Zmot = self.calc_Zmot(n, layers, delfstar)
@@ -581,6 +608,7 @@ class QCM:
 
                 x0 = np.array([dlam_refh, phi])
                 # logger.info(x0) 
+                from scipy import optimize
                 soln = optimize.least_squares(ftosolve, x0, bounds=(lb, ub))
                 # logger.info(soln['x']) 
                 dlam_refh = soln['x'][0]
@@ -624,15 +652,13 @@ class QCM:
         '''
         solve the property of a single test.
         nh: list of int
-        qcm_queue:  QCM data. df (shape[0]=1) 
+        qcm_queue:  QCM data. df (shape[0]=1) or dict of a row of qcm arrays (queue_from_arrays)
         calctype: 'SLA' / 'LL'
         film: dict of the film layers information
         return grho_refh, phi, drho, dlam_ref, err
         '''
-        # get fstar
-        fstars = qcm_queue.fstars.iloc[0] # list
         # get delfstar
-        delfstars = qcm_queue.delfstars.iloc[0] # list
+        delfstars = queue_val(qcm_queue, 'delfstars') # list or array
         # logger.info('fstars %s', fstars) 
         # logger.info(delfstars) 
         # convert list to dict to make it easier to do the calculation
@@ -641,7 +667,7 @@ class QCM:
         # logger.info(delfstar) 
 
         # set f1
-        f0s = qcm_queue.f0s.iloc[0]
+        f0s = queue_val(qcm_queue, 'f0s')
         if np.isnan(f0s).all():
             self.f1 = np.nan
         else:
@@ -665,11 +691,35 @@ class QCM:
         return grho_refh, phi, drho, dlam_refh, err
 
 
+    def solve_queues_to_prop(self, nh, qcm_arrs, rows, calctype='SLA', film={}, bulklimit=0.5):
+        '''
+        solve the property of the queues at rows of qcm_arrs in batch.
+        Queues with the same data (e.g.: a layer with constant reference) are solved once.
+        nh: list of int
+        qcm_arrs: dict of arrays (DataSaver.qcm_arrays)
+        rows: positions of the queues in qcm_arrs
+        return grho_refh, phi, drho, dlam_refh (arrays in the order of rows), err (list of dict)
+        '''
+        rows = np.asarray(rows, dtype=int)
+        # data used by the solver: delfstars and f0s (f1)
+        key = np.ascontiguousarray(np.concatenate([qcm_arrs['delfstars'][rows].real, qcm_arrs['delfstars'][rows].imag, qcm_arrs['f0s'][rows]], axis=1))
+        # compare rows as bytes, so rows with nan can be the same
+        key = key.view(np.dtype((np.void, key.dtype.itemsize * key.shape[1]))).reshape(-1)
+        _, first, inverse = np.unique(key, return_index=True, return_inverse=True)
+
+        sols = [self.solve_single_queue_to_prop(nh, queue_from_arrays(qcm_arrs, rows[i]), calctype=calctype, film=film, bulklimit=bulklimit) for i in first]
+        logger.info('%s queues solved with %s solutions', rows.size, len(sols))
+
+        grho_refh, phi, drho, dlam_refh = [np.array([sol[k] for sol in sols], dtype=float).reshape(-1)[inverse] for k in range(4)]
+        err = [sols[i][4] for i in inverse]
+        return grho_refh, phi, drho, dlam_refh, err
+
+
     def solve_single_queue(self, nh, qcm_queue, mech_queue, calctype='SLA', film={}, bulklimit=0.5):
         '''
         solve the property of a single test.
         nh: list of int
-        qcm_queue:  QCM data. df (shape[0]=1) 
+        qcm_queue:  QCM data. df (shape[0]=1) or dict of a row of qcm arrays (queue_from_arrays)
         mech_queue: initialized property data. df (shape[0]=1)
         calctype: 'SLA' / 'LL'
         film: dict of the film layers information
@@ -690,9 +740,9 @@ class QCM:
 
         # now back calculate delfstar, rh and rd from the solution
         # get the marks [1st, 3rd, 5th, ...]
-        marks = qcm_queue.marks.iloc[0]
+        marks = queue_val(qcm_queue, 'marks')
 
-        delfstars = qcm_queue.delfstars.iloc[0] # list
+        delfstars = queue_val(qcm_queue, 'delfstars') # list or array
         delfstar = {int(i*2+1): dfstar for i, dfstar in enumerate(delfstars)}
 
         rd_exp = self.rd_from_delfstar(nh[2], delfstar) # nh[2]
@@ -789,9 +839,9 @@ class QCM:
         mech_queue['lamrhos'] = [lamrhos] # in kg/m2
         mech_queue['delrhos'] = [delrhos] # in kg/m2
         
-        mech_queue['delf_exps'] = qcm_queue['delfs']
+        mech_queue['delf_exps'] = [np.asarray(queue_val(qcm_queue, 'delfs'), dtype=float).tolist()]
         mech_queue['delf_calcs'] = [delf_calcs]
-        mech_queue['delg_exps'] = qcm_queue['delgs']
+        mech_queue['delg_exps'] = [np.asarray(queue_val(qcm_queue, 'delgs'), dtype=float).tolist()]
         mech_queue['delg_calcs'] = [delg_calcs]
         mech_queue['delD_exps'] = [delD_exps]
         mech_queue['delD_calcs'] = [delD_calcs]
@@ -909,6 +959,7 @@ class QCM:
                    
                     # recalculate solution to give the uncertainty, if solution is viable
                     try:
+                        from scipy import optimize
                         soln = optimize.least_squares(ftosolve, x0, bounds=(lb, ub))
 
                         grho_refh = soln['x'][0]
@@ -998,17 +1049,26 @@ class QCM:
         '''
         check if all harmonics in nhcalc are not na
         nh: list of strings
-        qcm_queue: qcm data (df) of a single queue
+        qcm_queue: qcm data (df or dict from queue_from_arrays) of a single queue
         return: True/False
         '''
         # logger.info(nh) 
         # logger.info(nh2i(nh[0])) 
-        # logger.info(qcm_queue.delfstars.values) 
-        # logger.info(qcm_queue.delfstars.iloc[0]) 
-        if np.isnan(qcm_queue.delfstars.iloc[0][nh2i(nh[0])].real) or np.isnan(qcm_queue.delfstars.iloc[0][nh2i(nh[1])].real) or np.isnan(qcm_queue.delfstars.iloc[0][nh2i(nh[2])].imag):
+        delfstars = queue_val(qcm_queue, 'delfstars')
+        if np.isnan(delfstars[nh2i(nh[0])].real) or np.isnan(delfstars[nh2i(nh[1])].real) or np.isnan(delfstars[nh2i(nh[2])].imag):
             return False
         else:
             return True
+
+
+    def all_nhcalc_harm_not_na_arr(self, nh, delfstars):
+        '''
+        vectorized all_nhcaclc_harm_not_na for all queues
+        nh: list of int
+        delfstars: complex array (N, n_harm) (qcm_arrays['delfstars'])
+        return: bool array (N,)
+        '''
+        return ~(np.isnan(delfstars[:, nh2i(nh[0])].real) | np.isnan(delfstars[:, nh2i(nh[1])].real) | np.isnan(delfstars[:, nh2i(nh[2])].imag))
         
         # for h in set(nh):
         #     if np.isnan(qcm_queue.delfstar[nh2i(h)]): # both real and imag are not nan
@@ -1020,8 +1080,21 @@ class QCM:
         # sample, parms
         '''
         calculate with qcm_df and save to mech_df
+        qcm_df: df from DataSaver.df_qcm or dict of arrays from DataSaver.qcm_arrays
         '''
         nh = nhcalc2nh(nhcalc) # list of harmonics (int) in nhcalc
+        if isinstance(qcm_df, dict): # qcm arrays
+            rows = pd.Index(qcm_df['queue_id']).get_indexer(queue_ids) # positions of queue_ids
+            rows = rows[rows >= 0]
+            rows = rows[self.all_nhcalc_harm_not_na_arr(nh, qcm_df['delfstars'][rows])]
+            for i in rows:
+                idx = qcm_df['index'][i]
+                mech_queue = mech_df.loc[[idx], :].copy()  # as a dataframe
+                mech_queue = self.solve_single_queue(nh, queue_from_arrays(qcm_df, i), mech_queue)
+                mech_queue.index = [idx]
+                mech_df.update(mech_queue)
+            return mech_df
+
         for queue_id in queue_ids: # iterate all ids
             # logger.info('queue_id %s', queue_id) 
             # logger.info('qcm_df %s', qcm_df) 
@@ -1254,6 +1327,61 @@ class QCM:
         return new_film
 
 
+class ContourGrids:
+    '''
+    grids of the mechanics contour plots (X: d/lambda, Y: phi in degree, Z)
+    cached by (contour type, nhcalc, refh, dlam limits, phi limits, resolution)
+    the least recently used grids are dropped when more than maxsize are kept
+    '''
+    def __init__(self, qcm, maxsize=8):
+        self.qcm = qcm
+        self.maxsize = maxsize
+        self.grids = OrderedDict() # {key: (mesh1, mesh2)}
+
+
+    def __contains__(self, key):
+        return key in self.grids
+
+
+    def get(self, contour_type, nhcalc, refh, dlam_lim, phi_lim, num):
+        '''
+        return mesh1, mesh2: {'X': array, 'Y': array, 'Z': array} of the two contour plots
+        contour_type: 'normfnormg' or 'rhrd'
+        dlam_lim, phi_lim: (min, max) (phi in degree)
+        num: number of points of each axis
+        '''
+        key = (contour_type, nhcalc, refh, tuple(dlam_lim), tuple(phi_lim), num)
+        if key in self.grids:
+            self.grids.move_to_end(key)
+            return self.grids[key]
+
+        dlam = np.linspace(dlam_lim[0], dlam_lim[1], num)
+        phi = np.linspace(phi_lim[0], phi_lim[1], num)
+        dlam_i, phi_i = np.meshgrid(dlam, phi * np.pi / 180) # convert phi to rad
+        mesh1 = {'X': dlam_i, 'Y': phi_i * 180 / np.pi} # convert back to deg
+        mesh2 = {'X': dlam_i, 'Y': mesh1['Y']}
+
+        self.qcm.refh = refh
+        nh = nhcalc2nh(nhcalc)
+        if contour_type == 'normfnormg':
+            # calculate the z values and reset things to -1 at dlam=0
+            normdelfstar = self.qcm.normdelfstar(refh, dlam_i, phi_i)
+            normdelfstar[:,0] = -1
+            mesh1['Z'], mesh2['Z'] = np.real(normdelfstar), np.imag(normdelfstar)
+        elif contour_type == 'rhrd':
+            # normdelfstar of each harmonic once (rhcalc and rdcalc)
+            normdelfstar = {n: self.qcm.normdelfstar(n, dlam_i, phi_i) for n in set(nh[:3])}
+            mesh1['Z'] = np.real(normdelfstar[nh[0]]) / np.real(normdelfstar[nh[1]])
+            mesh2['Z'] = -np.imag(normdelfstar[nh[2]]) / np.real(normdelfstar[nh[2]])
+        else: # contour_type not found
+            mesh1['Z'], mesh2['Z'] = np.random.rand(*dlam_i.shape), np.random.rand(*dlam_i.shape) # just make some random numbers for fun
+
+        self.grids[key] = (mesh1, mesh2)
+        if len(self.grids) > self.maxsize:
+            self.grids.popitem(last=False)
+        return mesh1, mesh2
+
+
 if __name__ == '__main__':
     qcm = QCM()
     qcm.f1 = 5e6 # Hz
@@ -4,7 +4,6 @@ and return a list of devices (class NI device)
 eg.: device.name ('Dev1'), device.product_category ('ProductCategory.USBDAQ'), device.product_type ('USB-TC01') ...
 """
 
-import nidaqmx
 import logging
 logger = logging.getLogger(__name__)
 
@@ -15,6 +14,7 @@ logger = logging.getLogger(__name__)
 
 def list_devices():
     ''' return a list of connected NI devices '''
+    import nidaqmx.system # imported here for startup time
     system = nidaqmx.system.System.local()
     # list all connected NI devices
     devices = []
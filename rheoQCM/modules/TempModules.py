@@ -1,5 +1,8 @@
-import nidaqmx
-# from nidaqmx import Task
+# nidaqmx is imported by NITempSensor (startup time)
+import importlib.util
+import threading
+import time
+from collections import deque
 import numpy as np
 
 import logging
@@ -8,7 +11,7 @@ logger = logging.getLogger(__name__)
 # another way to let the main code find the temp class in this file is just put a dict here
 class_list = {
     'NITempSensor': 'NITempSensor', # name to access / name to display
-}
+} if importlib.util.find_spec('nidaqmx') is not None else {} # no NI driver (e.g. Linux). only the simulated sensor is available
 
 class NITempSensor():
     def __init__(self, device, device_params, thrmcpl_type):
@@ -25,6 +28,8 @@ class NITempSensor():
         }
         '''
 
+        import nidaqmx
+
         self.thrmcpl_chan = device.name + '/' + device_params['thrmcpl_chan']
         self.thrmcpl_type = getattr(nidaqmx.constants.ThermocoupleType, thrmcpl_type)
         if device_params['cjc_source']: 
@@ -58,31 +63,282 @@ class NITempSensor():
     #     data = self.task.read(number_of_samples_per_channel=self.nsamples)
     #     return np.mean(data)
 
-    def get_tempC(self):
+    def add_chan(self, task):
         if self.cjc_source:
-            with nidaqmx.Task() as task:
-                task.ai_channels.add_ai_thrmcpl_chan(
-                    self.thrmcpl_chan,
-                    # name_to_assign_to_channel="", 
-                    # min_val=0.0,
-                    # max_val=100.0, 
-                    # units=nidaqmx.constants.TemperatureUnits.DEG_C,
-                    thermocouple_type=self.thrmcpl_type,
-                    # cjc_source=nidaqmx.constants.CJCSource.CONSTANT_USER_VALUE, 
-                    cjc_source=self.cjc_source, 
-                    # cjc_val=20.0,
-                    # cjc_channel=""
-                    )
-                data = task.read(number_of_samples_per_channel=self.nsamples)
-                return np.mean(data)
+            task.ai_channels.add_ai_thrmcpl_chan(
+                self.thrmcpl_chan,
+                thermocouple_type=self.thrmcpl_type,
+                cjc_source=self.cjc_source, 
+                )
         else:
-            with nidaqmx.Task() as task:
-                task.ai_channels.add_ai_thrmcpl_chan(
-                    self.thrmcpl_chan,
-                    thermocouple_type=self.thrmcpl_type,
-                    )
-                data = task.read(number_of_samples_per_channel=self.nsamples)
-                return np.mean(data)
+            task.ai_channels.add_ai_thrmcpl_chan(
+                self.thrmcpl_chan,
+                thermocouple_type=self.thrmcpl_type,
+                )
+
+
+    def open(self):
+        '''
+        create the task kept open for read (used by TempSampler)
+        '''
+        import nidaqmx
+        self.task = nidaqmx.Task()
+        try:
+            self.add_chan(self.task)
+        except:
+            self.close()
+            raise
+
+
+    def read(self):
+        '''
+        return temperature in C read by the task of open
+        '''
+        data = self.task.read(number_of_samples_per_channel=self.nsamples)
+        return np.mean(data)
+
+
+    def close(self):
+        if getattr(self, 'task', None) is not None:
+            self.task.close()
+            self.task = None
+
+
+    def get_tempC(self):
+        '''
+        return temperature in C read by a new task
+        '''
+        import nidaqmx
+        with nidaqmx.Task() as task:
+            self.add_chan(task)
+            data = task.read(number_of_samples_per_channel=self.nsamples)
+            return np.mean(data)
+
+
+class SimTempSensor():
+    '''
+    simulated temperature sensor with the interface of NITempSensor for test without NI devices
+    temperature (C) at time t (time.time()):
+        t0 + drift * (t - start) / 60 + amp * sin(2 pi (t - start) / period) + noise
+    setup: time in s to create a task (each get_tempC)
+    latency: time in s of each read
+    '''
+    def __init__(self, t0=25, drift=0.1, amp=0, period=600, noise=0.01, nsamples=1, setup=0.05, latency=0.02, seed=None):
+        self.t0 = t0 # in C
+        self.drift = drift # in C/min
+        self.amp = amp # in C
+        self.period = period # in s
+        self.noise = noise # std in C
+        self.nsamples = nsamples
+        self.setup = setup
+        self.latency = latency
+        self.start = time.time()
+        self.rng = np.random.default_rng(seed)
+
+
+    def true_tempC(self, t):
+        '''
+        temperature without noise at t (float or array)
+        '''
+        dt = np.asarray(t) - self.start
+        return self.t0 + self.drift * dt / 60 + self.amp * np.sin(2 * np.pi * dt / self.period)
+
+
+    def open(self):
+        time.sleep(self.setup)
+
+
+    def read(self):
+        time.sleep(self.latency)
+        return np.mean(self.true_tempC(time.time()) + self.noise * self.rng.standard_normal(self.nsamples))
+
+
+    def close(self):
+        pass
+
+
+    def get_tempC(self):
+        self.open()
+        try:
+            return self.read()
+        finally:
+            self.close()
+
+
+class TempSampler():
+    '''
+    read the sensor in a background thread every interval s with the task kept open (sensor.open/read/close)
+    and keep the temperatures with their time (time.time() at the middle of the read) in a ring buffer of maxlen
+    the temperature at a time is interpolated from the buffer without waiting for the sensor (temp_at)
+    it can be used in place of the sensor (get_tempC)
+    '''
+    def __init__(self, sensor, interval=0.5, maxlen=1200, max_age=5):
+        '''
+        sensor: class with open, read and close (NITempSensor, SimTempSensor)
+        interval: time in s between the starts of reads
+        max_age: nan is returned for times later than the last sample by more than max_age s (sensor not read)
+        '''
+        self.sensor = sensor
+        self.interval = interval
+        self.max_age = max_age
+        self.t = np.full(maxlen, np.nan) # ring buffer of time
+        self.temp = np.full(maxlen, np.nan) # ring buffer of temperature in C
+        self.n = 0 # number of samples written
+
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._ready = threading.Event() # set after the first read (or error)
+        self._thread = None
+        self.error = None # last read error
+        self.stats = {}
+
+
+    def start(self, timeout=None):
+        '''
+        start sampling and wait for the first read at most timeout s
+        return True if a temperature is read
+        '''
+        if not self.is_running():
+            self.n = 0
+            self.error = None
+            self.stats = {'reads': 0, 'errors': 0, 'queries': 0, 'held': 0, 'stale': 0, 'latency': deque(maxlen=1000), 'period': deque(maxlen=1000), 'age': deque(maxlen=1000)}
+            self._stop_event.clear()
+            self._ready.clear()
+            self._thread = threading.Thread(target=self._run, name='temp_sampler', daemon=True)
+            self._thread.start()
+        self._ready.wait(timeout)
+        return self.n > 0
+
+
+    def stop(self, wait=True, timeout=None):
+        self._stop_event.set()
+        if wait and self._thread is not None:
+            self._thread.join(timeout)
+
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+
+    def _run(self):
+        try:
+            self.sensor.open()
+        except Exception as e:
+            logger.exception('failed to open temperature sensor')
+            self.error = e
+            self._ready.set()
+            return
+
+        t_next = time.monotonic()
+        t_last = None
+        try:
+            while not self._stop_event.is_set():
+                t_start = time.time()
+                try:
+                    temp = self.sensor.read()
+                except Exception as e:
+                    if self.error is None: # log the first error only
+                        logger.exception('failed to read temperature sensor')
+                    self.error = e
+                    self.stats['errors'] += 1
+                else:
+                    t_end = time.time()
+                    with self._lock:
+                        i = self.n % len(self.t)
+                        self.t[i], self.temp[i] = (t_start + t_end) / 2, temp
+                        self.n += 1
+                    self.stats['reads'] += 1
+                    self.stats['latency'].append(t_end - t_start)
+                    if t_last is not None:
+                        self.stats['period'].append(t_start - t_last)
+                    t_last = t_start
+                self._ready.set()
+
+                # next read on the grid of interval
+                t_next += self.interval
+                if t_next < time.monotonic(): # read longer than interval
+                    t_next = time.monotonic()
+                self._stop_event.wait(t_next - time.monotonic())
+        finally:
+            self.sensor.close()
+
+
+    def get_data(self):
+        '''
+        return t, temp: arrays of the samples in the buffer in time order
+        '''
+        with self._lock:
+            maxlen = len(self.t)
+            if self.n <= maxlen:
+                return self.t[:self.n].copy(), self.temp[:self.n].copy()
+            i = self.n % maxlen
+            return np.concatenate((self.t[i:], self.t[:i])), np.concatenate((self.temp[i:], self.temp[:i]))
+
+
+    def temp_at(self, t):
+        '''
+        return temperature in C at t (time.time()) interpolated from the buffer
+        the last temperature is returned for t after the last sample (held) and nan if it is older than max_age
+        '''
+        with self._lock:
+            if self.n == 0:
+                raise RuntimeError('No temperature read from sensor: {}'.format(self.error))
+            maxlen = len(self.t)
+            i_last = (self.n - 1) % maxlen
+            t_last, temp_last = self.t[i_last], self.temp[i_last]
+            if t >= t_last:
+                temp = None
+            else: # samples are few. interpolate from all in time order
+                if self.n <= maxlen:
+                    ts, temps = self.t[:self.n], self.temp[:self.n]
+                else:
+                    ts, temps = np.roll(self.t, -(i_last + 1)), np.roll(self.temp, -(i_last + 1))
+                temp = np.interp(t, ts, temps)
+
+        self.stats['queries'] += 1
+        self.stats['age'].append(t - t_last)
+        if temp is not None:
+            return temp
+        if t - t_last > self.max_age: # sensor is not read
+            self.stats['stale'] += 1
+            return np.nan
+        self.stats['held'] += 1
+        return temp_last
+
+
+    def get_tempC(self):
+        '''
+        return temperature in C now
+        '''
+        return self.temp_at(time.time())
+
+
+    def drift_rate(self):
+        '''
+        return drift of temperature in C/min by linear fit of the buffer
+        '''
+        t, temp = self.get_data()
+        if len(t) < 2:
+            return np.nan
+        return np.polyfit(t - t[0], temp, 1)[0] * 60
+
+
+    def summary(self):
+        '''
+        return counts and times (s) of reads and queries
+            latency: mean time of reads, latency_max
+            period: mean time between reads, jitter: std of period
+            age: mean time from the last sample to the queried times (negative: interpolated)
+            drift: drift of temperature in C/min
+        '''
+        stats = {key: val for key, val in self.stats.items() if not isinstance(val, deque)}
+        for key in ['latency', 'period', 'age']:
+            stats[key] = float(np.mean(self.stats[key])) if self.stats.get(key) else np.nan
+        stats['latency_max'] = float(np.max(self.stats['latency'])) if self.stats.get('latency') else np.nan
+        stats['jitter'] = float(np.std(self.stats['period'])) if self.stats.get('period') else np.nan
+        stats['drift'] = float(self.drift_rate())
+        return stats
+
 
 ############## test code below
 
@@ -92,6 +348,7 @@ class NITempSensor():
 
 if __name__ == "__main__":
     import matplotlib.pyplot as plt
+    import nidaqmx
     def get_temp(device, ai_channel, thrmpl_type):
         
         nsample = devices_dict.get(device.product_type, [])
@@ -6,11 +6,52 @@ import sys
 import os, subprocess
 import inspect
 import re
+import importlib
+import time
 import numpy as np
 
 import logging
 logger = logging.getLogger(__name__)
 
+lazy_import_times = {} # {module name: time (s) of import by LazyModule}
+
+
+class LazyModule:
+    '''
+    module imported at the first access of its attributes
+    e.g.: lmfit = LazyModule('lmfit'); lmfit.Model(...)
+    the import time is kept in lazy_import_times
+    '''
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+
+    def _load(self):
+        if self._module is None:
+            t_start = time.perf_counter()
+            self.__dict__['_module'] = importlib.import_module(self._name)
+            lazy_import_times[self._name] = time.perf_counter() - t_start
+            logger.info('lazy import %s: %.3f s', self._name, lazy_import_times[self._name])
+        return self._module
+
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+
+    def __repr__(self):
+        return '<LazyModule {} ({})>'.format(self._name, 'loaded' if self._module is not None else 'not loaded')
+
+
+def lazy_import(name):
+    '''
+    return module name if it is imported already, else a LazyModule of name
+    '''
+    if name in sys.modules:
+        return sys.modules[name]
+    return LazyModule(name)
+
 def open_file(path):
     '''
     open the folder given by path
@@ -25,12 +25,12 @@ import math
 import json
 import shutil
 import datetime, time
+startup_times = {'start': time.perf_counter()} # time of startup steps (logged after the window is shown)
 import numpy as np
 import pandas as pd
-import scipy.signal
 # from collections import OrderedDict
 # import types
-from PyQt5.QtCore import pyqtSlot, Qt, QEvent, QTimer, QEventLoop, QCoreApplication, QSize, qFatal, QT_VERSION 
+from PyQt5.QtCore import pyqtSlot, pyqtSignal, Qt, QEvent, QTimer, QEventLoop, QCoreApplication, QSize, qFatal, QT_VERSION 
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QMainWindow, QFileDialog, QActionGroup, QComboBox, QCheckBox, QTabBar, QTabWidget, QVBoxLayout, QHBoxLayout, QGridLayout, QLineEdit, QCheckBox, QComboBox, QSpinBox, QDoubleSpinBox, QRadioButton, QMenu, QAction, QMessageBox, QTableWidgetItem, QSizePolicy, QFrame, QLabel, QPlainTextEdit
 )
@@ -55,17 +55,25 @@ if 'time_str_format' not in settings_default:
     settings_default['time_str_format'] = config_default['time_str_format']
 if 'vna_path' not in settings_default:
     settings_default['vna_path'] = config_default['vna_path']
+if 'raw_storage' not in settings_default:
+    settings_default['raw_storage'] = config_default['raw_storage']
 
 
 # packages from program itself
-from modules import UIModules, PeakTracker, DataSaver
+from modules import UIModules, PeakTracker, DataSaver, Acquisition, PlotRefresh
 from modules import QCM as QCM 
 from modules.MatplotlibWidget import MatplotlibWidget
 
 import _version
 
+startup_times['imports'] = time.perf_counter() - startup_times['start']
 
-if UIModules.system_check() == 'win32': # windows
+
+if config_default['vna_simulator']['enable']: # simulated analyzer for test without myVNA
+    from modules.AccessMyVNA_dummy import AccessMyVNA
+    from modules import TempModules # simulated temperature sensor (TempModules.SimTempSensor)
+    logger.warning('Simulated analyzer is used in place of myVNA!')
+elif UIModules.system_check() == 'win32': # windows
     import struct
     if struct.calcsize('P') * 8 == 32: # 32-bit version Python
         try:
@@ -172,6 +180,11 @@ class QCMApp(QMainWindow):
     '''
     The settings of the app is stored in a dict by widget names
     '''
+    # signals from the acquisition thread (self.acq_engine)
+    acq_data_ready = pyqtSignal()
+    acq_plot_ready = pyqtSignal()
+    acq_stopped = pyqtSignal()
+
     def __init__(self):
         super(QCMApp, self).__init__()
         self.ui = Ui_MainWindow()
@@ -184,12 +197,16 @@ class QCMApp(QMainWindow):
         self.peak_tracker = PeakTracker.PeakTracker(max_harm=self.settings['max_harmonic'])
         self.vna_tracker = VNATracker()
         self.qcm = QCM.QCM()
+        # grids of contour plots
+        self.contour_grids = QCM.ContourGrids(self.qcm, maxsize=config_default['contour_array']['cache_size'])
 
         # define instrument state variables
 
         self.UITab = 0 # 0: Control; 1: Settings;, 2: Data; 3: Mechanics
         #### initialize the attributes for data saving
         self.data_saver = DataSaver.DataSaver(ver=_version.__version__, settings=self.settings)
+        if config_default['data_saver_write_behind']:
+            self.data_saver.start_writer()
 
         self.vna = None # vna class
         self.temp_sensor = None # class for temp sensor
@@ -210,7 +227,7 @@ class QCMApp(QMainWindow):
         self.system = UIModules.system_check()
         # initialize AccessMyVNA
         #TODO add more code to disable settings_control tab and widges in settings_settings tab
-        if self.system == 'win32': # windows
+        if self.system == 'win32' or config_default['vna_simulator']['enable']: # windows or simulated analyzer
             try:
                 # test if MyVNA program is available
                 with AccessMyVNA() as vna:
@@ -227,6 +244,32 @@ class QCMApp(QMainWindow):
             # self.vna = AccessMyVNA() # for test only
             pass
         logger.info(self.vna) 
+        # scan harmonics with vna and process the data while scanning
+        self.scan_pipeline = Acquisition.ScanPipeline(self.vna, pipeline=config_default['vna_scan_pipeline'])
+        # collect data in a background thread. the UI saves and plots the results
+        self.acq_engine = None
+        if config_default['acquisition_thread']:
+            self.acq_engine = Acquisition.AcquisitionEngine(
+                self.vna,
+                PeakTracker.PeakTracker(max_harm=self.settings['max_harmonic']), # not shared with the UI
+                pipeline=config_default['vna_scan_pipeline'],
+                plot_policy=config_default['acquisition_plot_policy'],
+                max_pending=config_default['acquisition_max_pending'],
+                on_data=self.acq_data_ready.emit,
+                on_plot=self.acq_plot_ready.emit,
+                on_stopped=self.acq_stopped.emit,
+            )
+            self.acq_data_ready.connect(self.on_acquisition_data)
+            self.acq_plot_ready.connect(self.on_acquisition_plot)
+            self.acq_stopped.connect(self.on_acquisition_stopped)
+        self.acq_spans = {} # spans received from self.acq_engine {chn_name: {harm: span}}
+        self.acq_span_vers = {} # {(chn_name, harm): version of the plan with the span changed in the UI}
+
+        # apply line updates of the plots at most plot_max_rate times per second
+        self.plot_scheduler = PlotRefresh.RedrawScheduler(
+            max_rate=config_default['plot_max_rate'],
+            start_timer=lambda ms: QTimer.singleShot(ms, self.plot_scheduler.flush),
+        )
 
         # does it necessary???
         # if self.vna is not None: # only set the timer when vna is available
@@ -726,7 +769,7 @@ class QCMApp(QMainWindow):
         self.ui.comboBox_tempmodule.activated.connect(self.update_widget)
 
         # add comboBox_tempdevice to treeWidget_settings_settings_hardware
-        if self.vna and self.system == 'win32':
+        if self.vna and self.system == 'win32' and not config_default['vna_simulator']['enable']:
             config_default['tempdevs_opts'] = TempDevices.dict_available_devs(config_default['tempdevices_dict'])
             self.create_combobox(
                 'comboBox_tempdevice',
@@ -1471,6 +1514,23 @@ class QCMApp(QMainWindow):
 
     #region #########  functions ##############
 
+    def closeEvent(self, event):
+        '''
+        write data queued in data_saver to file before closing the window
+        '''
+        if self.acq_engine is not None and self.acq_engine.is_running():
+            self.timer.stop()
+            # saved here. not again by the signal emitted when the thread ends
+            self.acq_stopped.disconnect(self.on_acquisition_stopped)
+            # wait for the running cycle and save the pending results
+            self.acq_engine.stop(wait=True)
+            self.on_acquisition_stopped()
+        if hasattr(self.temp_sensor, 'stop'): # TempModules.TempSampler. join the thread and close the sensor
+            self.temp_sensor.stop()
+        self.data_saver.stop_writer()
+        super(QCMApp, self).closeEvent(event)
+
+
     def link_tab_page(self, tab_idx):
         self.UITab = tab_idx
         if tab_idx in [0, 2]: # link settings_control to spectra_show and data_data
@@ -1565,6 +1625,18 @@ class QCMApp(QMainWindow):
 
             # test scheduler? start/end increasement
 
+            # count redraws of the scans from now on
+            self.plot_scheduler.start_scans()
+
+            if hasattr(self.temp_sensor, 'start'): # TempModules.TempSampler (stopped when the last test stopped)
+                self.temp_sensor.start(timeout=config_default['temp_sampler']['timeout'])
+
+            if self.acq_engine is not None: # data are collected by self.acq_engine in a background thread
+                self.idle = False
+                self.acq_engine.temp_sensor = self.temp_sensor
+                self.acq_spans, self.acq_span_vers = {}, {}
+                self.acq_engine.start(plan=self.get_acquisition_plan())
+
             # start the timer
             self.timer.start(0)
 
@@ -1590,7 +1662,9 @@ class QCMApp(QMainWindow):
             #     logger.info('looping') 
 
             # write dfs and settings to file
-            if self.idle == True: # Timer stopped while timeout func is not running (test stopped while waiting)
+            if self.acq_engine is not None and self.acq_engine.is_running(): # saved in on_acquisition_stopped
+                self.acq_engine.stop()
+            elif self.idle == True: # Timer stopped while timeout func is not running (test stopped while waiting)
                 self.process_saving_when_stop()
                 logger.info('data saved while waiting') 
 
@@ -1599,6 +1673,8 @@ class QCMApp(QMainWindow):
         '''
         process saving fitted data when test is stopped
         '''
+        # no row is being acquired
+        self.data_saver.end_acquisition()
         # save data
         self.data_saver.save_data()
         # write UI information to file
@@ -1606,8 +1682,19 @@ class QCMApp(QMainWindow):
 
         self.counter = 0 # reset counter
 
-        logger.info('data saver samp') 
-        logger.info(self.data_saver.samp) 
+        logger.info('data saver samp')
+        logger.info(self.data_saver.samp)
+
+        # redraw time of the spectra figures in the test
+        logger.info('plot redraws: %s', self.plot_scheduler.summary())
+        logger.info('frames mpl_spectra_fit: %s', self.ui.mpl_spectra_fit.frame_stats())
+        for harm in self.all_harm_list(as_str=True):
+            logger.info('frames mpl_sp%s: %s', harm, getattr(self.ui, 'mpl_sp' + harm).frame_stats())
+        # read latency and drift of the temperature sampler
+        if hasattr(self.temp_sensor, 'summary'):
+            logger.info('temperature sampler: %s', self.temp_sensor.summary())
+            # the sensor is not read till the next test starts
+            self.temp_sensor.stop()
 
         # enable features
         self.enable_widgets(
@@ -2048,6 +2135,8 @@ class QCMApp(QMainWindow):
         if fileName:
             if self.data_saver.path: # there is file
 
+                # write queued data before copying
+                self.data_saver.flush()
                 # copy file
                 try:
                     shutil.copyfile(self.data_saver.path, fileName)
@@ -2071,8 +2160,10 @@ class QCMApp(QMainWindow):
         # codes for data exporting
         if fileName:
             print('Exporting data ...')
-            self.data_saver.data_exporter(fileName) # do the export
+            stat = self.data_saver.data_exporter(fileName) # do the export
             print('Data is exported.')
+            if stat: # streamed export
+                print('{} rows in {:.2f} s ({:.0f} rows/s, {:.2f} MB)'.format(stat['rows'], stat['seconds'], stat['rows_per_s'], stat['bytes'] / 1e6))
         
 
     def process_messagebox(self, text='Your selection was paused!', message=[], opts=True, forcepop=False):
@@ -2162,7 +2253,10 @@ class QCMApp(QMainWindow):
         self.vna_tracker = VNATracker()
 
         if not settings: # reset UI
+            self.data_saver.stop_writer() # write queued data of the old file
             self.data_saver = DataSaver.DataSaver(ver=_version.__version__, settings=self.settings)
+            if config_default['data_saver_write_behind']:
+                self.data_saver.start_writer()
             # enable widgets
             self.enable_widgets(
                 'pushButton_runstop_disable_list',
@@ -2440,20 +2534,8 @@ class QCMApp(QMainWindow):
         '''
         if harm is None:
             harm = self.settings_harm
-        # get freq_range
-        bf1, bf2 = self.settings['freq_range'][harm] # in Hz
-        # check f1, and f2
-
-        if f1 and (f1 < bf1 or f1 >= bf2): # f1 out of limt
-            f1 = bf1
-            #TODO update statusbar 'lower bound out of limit and reseted. (You can increase the range in settings)'
-        if f2 and (f2 > bf2 or f2 <= bf1): # f2 out of limt
-            f2 = bf2
-            #TODO update statusbar 'upper bond out of limit and reseted. (You can increase the range in settings)'
-        if f1 and f2 and (f1 >= f2):
-            f2 = bf2
-
-        return [f1, f2]
+        #TODO update statusbar 'lower/upper bound out of limit and reseted. (You can increase the range in settings)'
+        return Acquisition.span_check(self.settings['freq_range'][harm], f1, f2)
 
 
     def get_spectraTab_mode(self):
@@ -2471,7 +2553,9 @@ class QCMApp(QMainWindow):
             else:
                 mode = None
         else: # test is running
-            if self.reading == True: # vna and/or temperature sensor is reading data
+            # the analyzer is used by acq_engine till it stops
+            reading = self.reading or (self.acq_engine is not None and self.acq_engine.is_running())
+            if reading == True: # vna and/or temperature sensor is reading data
                 if self.UITab == 2: # Data
                     mode  = 'refit'
                 else:
@@ -2545,10 +2629,7 @@ class QCMApp(QMainWindow):
             chn_name = self.settings_chn['name']
 
         # get the vna reset flag
-        freq_span = self.get_freq_span(harm=harm, chn_name=chn_name)
-        steps = int(self.get_harmdata('lineEdit_scan_harmsteps', harm=harm, chn_name=chn_name))
-        setflg = self.vna_tracker.set_check(f=freq_span, steps=steps, chn=self.get_chn_by_name(chn_name))
-        logger.info(setflg) 
+        setflg = self.get_vna_setflg(harm=harm, chn_name=chn_name)
 
         logger.info(self.vna) 
         with self.vna:
@@ -2563,6 +2644,17 @@ class QCMApp(QMainWindow):
         return f, G, B
 
 
+    def get_vna_setflg(self, harm, chn_name):
+        '''
+        return the flags (setflg) to set vna for scanning harm of chn_name
+        '''
+        freq_span = self.get_freq_span(harm=harm, chn_name=chn_name)
+        steps = int(self.get_harmdata('lineEdit_scan_harmsteps', harm=harm, chn_name=chn_name))
+        setflg = self.vna_tracker.set_check(f=freq_span, steps=steps, chn=self.get_chn_by_name(chn_name))
+        logger.info(setflg) 
+        return setflg
+
+
     def get_vna_data_no_with(self, harm=None, chn_name=None):
         '''
         NOTE: no with condition used. It can be used for
@@ -2582,10 +2674,7 @@ class QCMApp(QMainWindow):
             chn_name = self.settings_chn['name']
 
         # get the vna reset flag
-        freq_span = self.get_freq_span(harm=harm, chn_name=chn_name)
-        steps = int(self.get_harmdata('lineEdit_scan_harmsteps', harm=harm, chn_name=chn_name))
-        setflg = self.vna_tracker.set_check(f=freq_span, steps=steps, chn=self.get_chn_by_name(chn_name))
-        logger.info(setflg) 
+        setflg = self.get_vna_setflg(harm=harm, chn_name=chn_name)
         ret = self.vna.set_vna(setflg)
         logger.info('self.vna._nstep: %s', self.vna._nsteps) 
         if ret == 0:
@@ -2804,6 +2893,7 @@ class QCMApp(QMainWindow):
             getattr(self.ui, 'mpl_sp' + harm).clr_lines()
             # clear .t['chi']
             getattr(self.ui, 'mpl_sp' + harm).update_sp_text_chi()
+            getattr(self.ui, 'mpl_sp' + harm).canvas_draw()
             # set labels
             getattr(self.ui, 'mpl_sp' + harm).ax[0].set_xlabel(xlabel)
             getattr(self.ui, 'mpl_sp' + harm).ax[1].set_ylabel(y2label)
@@ -2815,6 +2905,7 @@ class QCMApp(QMainWindow):
         for harm in self.all_harm_list(as_str=True):
             # clear .t['chi']
             getattr(self.ui, 'mpl_sp' + harm).update_sp_text_chi()
+            getattr(self.ui, 'mpl_sp' + harm).canvas_draw()
 
 
     def on_clicked_pushButton_spectra_fit_fit(self):
@@ -3284,10 +3375,11 @@ class QCMApp(QMainWindow):
         # logger.info('data_list\n', data_list) 
         '''
 
+        mpl = getattr(self.ui, 'mpl_' + plt_str)
         # clear .lt lines
-        getattr(self.ui, 'mpl_' + plt_str).clr_lines(l_list=['lt'])
+        data_list.extend([{'ln': ln, 'x': [], 'y': []} for ln in mpl.l if ln.startswith('lt')])
         # update mpl_<plt_str>
-        getattr(self.ui, 'mpl_' + plt_str).update_data(*data_list)
+        self.plot_scheduler.submit(mpl, *data_list)
 
         # # get keys of harms don't want to plot
         # clr_list = ['l'+harm for harm in self.all_harm_list(as_str=True) if not self.settings.get('checkBox_' + plt_str + '_h' + harm, False)]
@@ -4456,11 +4548,10 @@ class QCMApp(QMainWindow):
         idx_joined = idx
         queue_ids = chn_queue_ids
 
-        # 2. get qcm data (columns=['queue_id', 't', 'temp', 'marks', 'fstars', 'fs', 'gs', 'delfstars', 'delfs', 'delgs', 'f0stars', 'f0s', 'g0s'])
-        # 'delf', 'delgs' may not necessary
-        qcm_df = self.data_saver.df_qcm(chn_name) 
+        # 2. get qcm data as arrays (keys=['index', 'queue_id', 't', 'temp', 'marks', 'fstars', 'fs', 'gs', 'delfstars', 'delfs', 'delgs', 'f0stars', 'f0s', 'g0s'])
+        qcm_arrs = self.data_saver.qcm_arrays(chn_name) 
+        qcm_rows = pd.Index(qcm_arrs['index']) # to get positions in qcm_arrs by index
 
-        qcm_df_calc = qcm_df.loc[idx] # df of calc layer
 
         # 3. layer calc's source and index
         if dic['source'] == 'ind': # dic is still where the loop break
@@ -4472,7 +4563,6 @@ class QCMApp(QMainWindow):
                 idx = calc_idx
                 idx_joined = calc_idx_joined
                 queue_ids = chn_queue_ids[idx_joined] # overwrite queue_id with queue_id calculated with given idx
-                qcm_df_calc = qcm_df.loc[idx_joined] # df of calc layer
             else: # idx_joined = []
                 # logger.info('idx_joined is empty') 
                 pass
@@ -4549,25 +4639,21 @@ class QCMApp(QMainWindow):
                     if idx_layer_joined:
                         queue_ids_layer = layer_queue_ids[idx_layer_joined]
 
-                    # create qcm_df
-                    qcm_df_layer_chn = self.data_saver.df_qcm(layer_chn)
-                    qcm_df_layer = qcm_df_layer_chn.loc[idx_layer_joined] # df of current layer
-                    # create qcm_df by interpolation
-                    qcm_df_layer = self.data_saver.shape_qcmdf_b_to_a(qcm_df_calc, qcm_df_layer, idx, idx_layer)
-                    # get values for each
-                    # logger.info('qcm_df_layer', qcm_df_layer) 
-
                     nh = QCM.nhcalc2nh(nhcalc)
-                    for ind in idx_joined:
-                        if n == 0: # electrode layer
-                            electrode = QCM.prop_default['electrode']
+                    if n == 0: # electrode layer
+                        electrode = QCM.prop_default['electrode']
+                        for ind in idx_joined:
                             prop_dict[ind][n].update(**electrode)
-                        else: # upper layers
-                            qcm_queue = qcm_df_layer.loc[[ind], :].copy() # as a dataframe
-                            # get prop
-                            drho, grho_refh, phi, dlam_refh, err = self.qcm.solve_single_queue_to_prop(nh, qcm_queue, calctype, bulklimit=bulklimit)
-
-                            prop_dict[ind][n].update(drho=drho, grho=grho_refh, phi=phi, n=refh)
+                    else: # upper layers
+                        # create qcm arrays of current layer with rows of calc layer by interpolation
+                        qcm_arrs_layer = self.data_saver.shape_qcm_arrays_b_to_a(qcm_arrs, self.data_saver.qcm_arrays(layer_chn), idx, idx_layer)
+                        if qcm_arrs_layer is None:
+                            print('Check index format of layer {}!'.format(n))
+                            return
+                        # get prop of all queues in batch
+                        grho_refh, phi, drho, dlam_refh, err = self.qcm.solve_queues_to_prop(nh, qcm_arrs_layer, qcm_rows.get_indexer(idx_joined), calctype, bulklimit=bulklimit)
+                        for i, ind in enumerate(idx_joined):
+                            prop_dict[ind][n].update(drho=drho[i], grho=grho_refh[i], phi=phi[i], n=refh)
                 else: 
                     print('source not defined!')
 
@@ -4581,10 +4667,12 @@ class QCMApp(QMainWindow):
         
         # if live update is not needed, use QCM.analyze to replace. the codes should be the same
         nh = QCM.nhcalc2nh(nhcalc)
+        # check harmonics of all queues at once
+        not_na = self.qcm.all_nhcalc_harm_not_na_arr(nh, qcm_arrs['delfstars'])
         for ind in idx_joined: # iterate all ids
             # logger.info('ind', ind) 
             # qcm data of queue_id
-            qcm_queue = qcm_df.loc[[ind], :].copy() # as a dataframe
+            qcm_queue = QCM.queue_from_arrays(qcm_arrs, qcm_rows.get_loc(ind)) # as a dict
             # mechanic data of queue_id
             mech_queue = mech_df.loc[[ind], :].copy()  # as a dataframe 
             # !! The copy here will not work, since mech_df contains object and the data change to mech_queue will be updated in mech_df 
@@ -4594,7 +4682,7 @@ class QCMApp(QMainWindow):
             mech_queue['queue_id'] = mech_queue['queue_id'].astype('int')
 
             # obtain the solution for the properties
-            if self.qcm.all_nhcaclc_harm_not_na(nh, qcm_queue):
+            if not_na[qcm_rows.get_loc(ind)]:
                 # solve a single queue
                 mech_queue = self.qcm.solve_single_queue(nh, qcm_queue, mech_queue, calctype=calctype, film=prop_dict[ind], bulklimit=bulklimit)
 
@@ -4792,11 +4880,12 @@ class QCMApp(QMainWindow):
         if not self.data_saver.path: # no data
             return
 
-        qcm_df = self.data_saver.df_qcm(chn_name)
+        qcm_arrs = self.data_saver.qcm_arrays(chn_name)
+        qcm_rows = pd.Index(qcm_arrs['index'])
         
         # check index range
-        if ind not in qcm_df.index:
-            ind = qcm_df.index[-1] # set ind as the max
+        if ind not in qcm_rows:
+            ind = qcm_rows[-1] # set ind as the max
             self.ui.spinBox_spectra_mechanics_currid.setValue(ind)
             logger.info('exceeds the index. reset to %s', ind) 
         else:
@@ -4821,11 +4910,10 @@ class QCMApp(QMainWindow):
             # logger.info('mech_df: %s', mech_df) 
 
             # get queue_id
-            # logger.info(qcm_df.queue_id) 
-            queue_id = qcm_df.queue_id.loc[ind]
+            queue_id = qcm_arrs['queue_id'][qcm_rows.get_loc(ind)]
 
             # qcm data of queue_id
-            qcm_queue = qcm_df.loc[[ind], :].copy() # as a dataframe
+            qcm_queue = QCM.queue_from_arrays(qcm_arrs, qcm_rows.get_loc(ind)) # as a dict
             # mechanic data of queue_id
             mech_queue = mech_df.loc[[ind], :].copy()  # as a dataframe 
             # logger.info('qcm_queue: %s', qcm_queue) 
@@ -4924,6 +5012,8 @@ class QCMApp(QMainWindow):
         '''
         # convert grho, drho and phi unit in mech_queue
         mech_queue = self.qcm.convert_mech_unit(mech_queue)
+        # qcm_queue from qcm arrays
+        qcm_queue = QCM.queue_to_df(qcm_queue)
 
         # clear table
         table = self.ui.tableWidget_spectra_mechanics_table
@@ -5289,56 +5379,89 @@ class QCMApp(QMainWindow):
     #### mech contour funcs ####
 
 
-    def prep_contour_mesh(self, contour_type=None):
+    def contour_grid_key(self, contour_type, num):
+        '''
+        return the key of the contour grids (args of self.contour_grids.get) by settings
+        '''
+        contour_lim = self.settings['contour_plot_lim_tab']
+        return (
+            contour_type.lower(),
+            self.gen_nhcalc_str(), # str of harmonics
+            self.settings['spinBox_settings_mechanics_nhcalc_n3'], # refh (int)
+            (contour_lim['dlam']['min'], contour_lim['dlam']['max']),
+            (contour_lim['phi']['min'], contour_lim['phi']['max']),
+            num,
+        )
+
+
+    def prep_contour_mesh(self, contour_type=None, num=None):
         '''
         create contour mesh for both normf/normg & rh/rd
         mesh1 = {'X': array, 'Y': array, 'Z': array}
         mesh2 = {'X': array, 'Y': array, 'Z': array}
+        num: number of points of each axis (contour_array['num'] by default)
+        the grids are cached by self.contour_grids
         '''
-        # initialize return values
-        mesh1, mesh2 = {}, {}
+        if num is None:
+            num = config_default['contour_array']['num']
 
-        contour_lim = self.settings['contour_plot_lim_tab']
-        contour_array = config_default['contour_array']
+        # set self.qcm.refh
+        self.qcm.refh = self.settings['spinBox_settings_mechanics_nhcalc_n3'] # int
 
-        # make meshgrid for contour
-        phi = np.linspace(contour_lim['phi']['min'], contour_lim['phi']['max'], contour_array['num']) 
-        dlam = np.linspace(contour_lim['dlam']['min'], contour_lim['dlam']['max'], contour_array['num'])
+        return self.contour_grids.get(*self.contour_grid_key(contour_type, num))
 
-        dlam_i, phi_i = np.meshgrid(dlam, phi * np.pi / 180) # convert phi to rad
 
-        mesh1['X'], mesh1['Y'] = dlam_i, phi_i * 180 / np.pi # convert back to deg
-        mesh2['X'], mesh2['Y'] = dlam_i, phi_i * 180 / np.pi # convert back to deg
+    def make_contours(self):
+        '''
+        plot contours by settings
+        if the grids are not cached, a coarse grid (contour_array['num_coarse']) is plotted first
+        and refined to contour_array['num'] later
+        the data on the contours are kept
+        '''
+        contour_type = self.settings['comboBox_settings_mechanics_contourtype']
+        contour_array = config_default['contour_array']
+        num, num_coarse = contour_array['num'], contour_array['num_coarse']
 
-        # set self.qcm.refh
-        self.qcm.refh = self.settings['spinBox_settings_mechanics_nhcalc_n3'] # int
+        key = self.contour_grid_key(contour_type, num)
+        if num_coarse and num_coarse < num and key not in self.contour_grids:
+            self.plot_contours(contour_type, num_coarse)
+            # refine after the UI is updated
+            QTimer.singleShot(0, lambda: self.refine_contours(key))
+        else:
+            self.plot_contours(contour_type, num)
 
-        nhcalc = self.gen_nhcalc_str() # str of harmonics
-        nh = QCM.nhcalc2nh(nhcalc) # list of harmonics in int
+        # linkxy
+        self.ui.mpl_contour1.ax[0].get_shared_x_axes().join(
+            self.ui.mpl_contour1.ax[0],
+            self.ui.mpl_contour2.ax[0]
+        )
+        self.ui.mpl_contour1.ax[0].get_shared_y_axes().join(
+            self.ui.mpl_contour1.ax[0],
+            self.ui.mpl_contour2.ax[0]
+        )
 
-        if contour_type.lower() == 'normfnormg':
-            # calculate the z values and reset things to -1 at dlam=0
-            normdelfstar = self.qcm.normdelfstar(self.qcm.refh, dlam_i, phi_i)
-            normdelfstar[:,0] = -1
+        self.set_contour_lims()
 
-            mesh1['Z'], mesh2['Z'] = np.real(normdelfstar), np.imag(normdelfstar)
-            
-        elif contour_type.lower() == 'rhrd':
-            rh_i = self.qcm.rhcalc(nh, dlam_i, phi_i)
-            rd_i = self.qcm.rdcalc(nh, dlam_i, phi_i)
-            mesh1['Z'], mesh2['Z'] = rh_i, rd_i
-        else: # contour_type not found
-            mesh1['Z'], mesh2['Z'] = np.random.rand(*dlam_i.shape), np.random.rand(*dlam_i.shape) # just make some random numbers for fun
 
-        return mesh1, mesh2
+    def refine_contours(self, key):
+        '''
+        plot the contours with the grids of key if settings not changed
+        '''
+        contour_type = self.settings['comboBox_settings_mechanics_contourtype']
+        num = config_default['contour_array']['num']
+        if key != self.contour_grid_key(contour_type, num): # changed. plotted by the new make_contours
+            return
+        if not self.ui.mpl_contour1.isVisible(): # refine when the contours are shown. replaces the refinement waiting for the older grids
+            self.ui.mpl_contour1.call_on_show(lambda: self.refine_contours(key), key='refine_contours')
+            return
+        self.plot_contours(contour_type, num)
+        self.set_contour_lims()
 
 
-    def make_contours(self):
+    def plot_contours(self, contour_type, num):
         '''
-        plot contours by settings
+        plot contours of contour_type with grids of num x num points
         '''
-        # get factors
-        contour_type = self.settings['comboBox_settings_mechanics_contourtype']
         contour_array = config_default['contour_array']
         contour_lim = self.settings['contour_plot_lim_tab']
         # logger.info('contour_array: %s', contour_array) 
@@ -5358,23 +5481,11 @@ class QCMApp(QMainWindow):
             title2 = config_default['contour_title']['rd']
         else:
             levels1, levels2 = contour_array['levels'], contour_array['levels']
+            title1, title2 = '', ''
 
-        mesh1, mesh2 = self.prep_contour_mesh(contour_type=contour_type)
-        self.ui.mpl_contour1.init_contour(**mesh1, levels=levels1, cmap=cmap, title=title1)
-        self.ui.mpl_contour2.init_contour(**mesh2, levels=levels2, cmap=cmap, title=title2)
-
-        # linkxy
-        self.ui.mpl_contour1.ax[0].get_shared_x_axes().join(
-            self.ui.mpl_contour1.ax[0],
-            self.ui.mpl_contour2.ax[0]
-        )
-        self.ui.mpl_contour1.ax[0].get_shared_y_axes().join(
-            self.ui.mpl_contour1.ax[0],
-            self.ui.mpl_contour2.ax[0]
-        )
-
-        # add data to contour
-        self.add_data_to_contour()
+        mesh1, mesh2 = self.prep_contour_mesh(contour_type=contour_type, num=num)
+        self.ui.mpl_contour1.update_contour(**mesh1, levels=levels1, cmap=cmap, title=title1)
+        self.ui.mpl_contour2.update_contour(**mesh2, levels=levels2, cmap=cmap, title=title2)
 
 
     def add_data_to_contour(self):
@@ -5422,26 +5533,40 @@ class QCMApp(QMainWindow):
         if self.vna: # add not for testing code
             if checked: # checkbox is checked
                 # if not self.temp_sensor: # tempModule is not initialized
-                # get all tempsensor settings
-                tempmodule_name = self.settings['comboBox_tempmodule'] # get temp module
-
-                thrmcpltype = self.settings['comboBox_thrmcpltype'] # get thermocouple type
-                tempdevice = TempDevices.device_info(self.settings['comboBox_tempdevice']) #get temp device info
-
-                # # check senor availability
-                # package_str = config_default['tempmodules_path'][2:].replace('/', '.') + tempmodule_name
-                # logger.info(package_str) 
-                # import package
-                temp_sensor = getattr(TempModules, tempmodule_name)
-
                 try:
-                    self.temp_sensor = temp_sensor(
-                        tempdevice,
-                        config_default['tempdevices_dict'][tempdevice.product_type],
-                        thrmcpltype,
-                    )
+                    if config_default['vna_simulator']['enable']: # simulated sensor
+                        self.temp_sensor = TempModules.SimTempSensor(**config_default['temp_simulator'])
+                    else:
+                        # get all tempsensor settings
+                        tempmodule_name = self.settings['comboBox_tempmodule'] # get temp module
+
+                        thrmcpltype = self.settings['comboBox_thrmcpltype'] # get thermocouple type
+                        tempdevice = TempDevices.device_info(self.settings['comboBox_tempdevice']) #get temp device info
+
+                        # # check senor availability
+                        # package_str = config_default['tempmodules_path'][2:].replace('/', '.') + tempmodule_name
+                        # logger.info(package_str) 
+                        # import package
+                        temp_sensor = getattr(TempModules, tempmodule_name)
+
+                        self.temp_sensor = temp_sensor(
+                            tempdevice,
+                            config_default['tempdevices_dict'][tempdevice.product_type],
+                            thrmcpltype,
+                        )
+                    if config_default['temp_sampler']['enable']: # read the sensor in a background thread
+                        self.temp_sensor = TempModules.TempSampler(
+                            self.temp_sensor,
+                            interval=config_default['temp_sampler']['interval'],
+                            maxlen=config_default['temp_sampler']['maxlen'],
+                            max_age=config_default['temp_sampler']['max_age'],
+                        )
+                        if not self.temp_sensor.start(timeout=config_default['temp_sampler']['timeout']):
+                            self.temp_sensor.stop(wait=False)
+                            raise RuntimeError('No temperature read from sensor: {}'.format(self.temp_sensor.error))
                 except Exception as e: # if failed return
                     print(e)
+                    self.temp_sensor = None
                     #TODO update in statusbar
                     return
 
@@ -5479,6 +5604,9 @@ class QCMApp(QMainWindow):
                     'temp_settings_enable_disable_list'
                 )
                 # reset self.temp_sensor
+                if hasattr(self.temp_sensor, 'stop'): # TempModules.TempSampler
+                    logger.info('temperature sampler: %s', self.temp_sensor.summary())
+                    self.temp_sensor.stop(wait=False)
                 self.temp_sensor = None
 
 
@@ -6551,6 +6679,8 @@ class QCMApp(QMainWindow):
 
         # plot contours
         self.make_contours()
+        # add data to contour
+        self.add_data_to_contour()
 
         ## end of load_settings
 
@@ -6611,7 +6741,6 @@ class QCMApp(QMainWindow):
         data collecting routine
         '''
 
-        self.idle = False
         # self.timer.setSingleShot(True)
         scan_interval = self.settings['spinBox_scaninterval'] * 1000 # in ms
 
@@ -6631,6 +6760,21 @@ class QCMApp(QMainWindow):
         self.bartimer.setInterval(bar_interval)
         self.bartimer.start()
 
+        if self.acq_engine is not None: # data are collected by self.acq_engine (started in on_clicked_pushButton_runstop)
+            if not self.acq_engine.is_running(): # stopped by an error
+                self.ui.pushButton_runstop.setChecked(False)
+                return
+            # settings changed while running
+            spans = self.get_acquisition_span_edits()
+            ver = self.acq_engine.set_plan(self.get_acquisition_plan(), spans=spans)
+            for chn_name, harm_spans in spans.items():
+                for harm, span in harm_spans.items():
+                    self.acq_spans.setdefault(chn_name, {})[harm] = span
+                    self.acq_span_vers[(chn_name, harm)] = ver
+            return
+
+        self.idle = False
+
         ## start to read data
         # set channels to collect data
         chn_name_list = []
@@ -6662,156 +6806,49 @@ class QCMApp(QMainWindow):
             gs[chn_name] = []
             curr_temp[chn_name] = None
 
-            self.reading = True
             # read time
-            curr_time[chn_name] = datetime.datetime.now().strftime(config_default['time_str_format'])
+            t_scan = time.time()
+            curr_time[chn_name] = datetime.datetime.fromtimestamp(t_scan).strftime(config_default['time_str_format'])
             logger.info(curr_time)
 
             # read temp if checked
-            if self.settings['checkBox_settings_temp_sensor'] == True: # record temperature data
+            if self.settings['checkBox_settings_temp_sensor'] == True and not hasattr(self.temp_sensor, 'temp_at'): # record temperature data
                 curr_temp[chn_name] = self.temp_sensor.get_tempC()
                 # update status bar
                 self.statusbar_temp_update(curr_temp=curr_temp[chn_name])
 
+            self.reading = True
             with self.vna:
-                # data collecting and plot
-                for harm in harm_list:
-                    # get data
-                    logger.info(harm_list) 
-                    f[chn_name][harm], G[chn_name][harm], B[chn_name][harm] = self.get_vna_data_no_with(harm=harm, chn_name=chn_name)
-
-                    logger.info('check:') 
-                    logger.info(f[chn_name][harm] is None) 
-                    logger.info(f[chn_name][harm][0] == f[chn_name][harm][-1]) 
-                    if (f[chn_name][harm] is None) or (f[chn_name][harm][0] == f[chn_name][harm][-1]): # vna error
-                        print('Analyzer connection error!')
-                        # stop test
-                        self.idle = True
-                        self.ui.pushButton_runstop.setChecked(False)
-                        # alert
-                        process = self.process_messagebox(
-                            text='Failed to connect with analyzer!',
-                            message=['Please check the connection and power.'],
-                            opts=False,
-                            forcepop=True,
-                        )
-                        return
-
-                    # put f, G, B to peak_tracker for later fitting and/or tracking
-                    self.peak_tracker.update_input(chn_name, harm, harmdata=self.settings['harmdata'], freq_span=self.settings['freq_span'], fGB=[f[chn_name][harm], G[chn_name][harm], B[chn_name][harm]])
+                # scan harmonics and process (fit, track and plot) the previous harmonic while scanning
+                def process_harm(chn_name, harm, f_harm, G_harm, B_harm):
+                    f[chn_name][harm], G[chn_name][harm], B[chn_name][harm] = f_harm, G_harm, B_harm
+                    fs_val, gs_val = self.process_scan_data(chn_name, harm, f_harm, G_harm, B_harm)
+                    fs[chn_name].append(fs_val)
+                    gs[chn_name].append(gs_val)
 
-                    # plot data in sp<harm>
-                    if self.settings['radioButton_spectra_showGp']: # checked
-                        getattr(self.ui, 'mpl_sp' + str(harm)).update_data({'ln': 'lG', 'x': f[chn_name][harm], 'y': G[chn_name][harm]})
-                    elif self.settings['radioButton_spectra_showBp']: # checked
-                        getattr(self.ui, 'mpl_sp' + str(harm)).update_data({'ln': 'lG', 'x': f[chn_name][harm], 'y': G[chn_name][harm]}, {'ln': 'lB', 'x': f[chn_name][harm], 'y': B[chn_name][harm]})
-                    elif self.settings['radioButton_spectra_showpolar']: # checked
-                        getattr(self.ui, 'mpl_sp' + str(harm)).update_data({'ln': 'lP', 'x': G[chn_name][harm], 'y': B[chn_name][harm]})
-
-            # set xticks
-            # self.mpl_set_faxis(getattr(self.ui, 'mpl_sp' + str(harm)).ax[0])
+                data = self.scan_pipeline.run(chn_name, harm_list, lambda chn_name, harm: self.get_vna_setflg(harm=harm, chn_name=chn_name), process=process_harm)
 
             self.reading = False
 
-            # fitting and tracking
-            for harm in harm_list:
-                if self.get_harmdata('checkBox_harmfit', harm=harm, chn_name=chn_name): # checked to fit
-
-                    fit_result = self.peak_tracker.peak_fit(chn_name, harm, components=False)
-                    logger.info(fit_result) 
-                    logger.info(fit_result['v_fit']) 
-                    # logger.info(fit_result['comp_g']) 
-
-                    # plot fitted data
-                    if self.settings['radioButton_spectra_showGp']: # checked
-                        getattr(self.ui, 'mpl_sp' + harm).update_data({'ln': 'lGfit', 'x': f[chn_name][harm], 'y': fit_result['fit_g']})
-                    elif self.settings['radioButton_spectra_showBp']: # checked
-                        getattr(self.ui, 'mpl_sp' + harm).update_data({'ln': 'lGfit', 'x': f[chn_name][harm], 'y': fit_result['fit_g']}, {'ln': 'lBfit', 'x': f[chn_name][harm], 'y': fit_result['fit_b']})
-                    elif self.settings['radioButton_spectra_showpolar']: # checked
-                        getattr(self.ui, 'mpl_sp' + harm).update_data({'ln': 'lPfit', 'x': fit_result['fit_g'], 'y': fit_result['fit_b']})
-
-                    # update lsp
-                    factor_span = self.peak_tracker.get_output(key='factor_span', chn_name=chn_name, harm=harm)
-                    if 'g_c' in fit_result['v_fit']: # fitting successed
-                        gc_list = [fit_result['v_fit']['g_c']['value']] * 2 # make its len() == 2
-                        bc_list = [fit_result['v_fit']['b_c']['value']] * 2 # make its len() == 2
-                    else: # fitting failed
-                        gc_list = [np.nan, np.nan]
-                        bc_list = [np.nan, np.nan]
-
-                    logger.info(factor_span) 
-                    logger.info(gc_list) 
-                    if self.settings['radioButton_spectra_showGp'] or self.settings['radioButton_spectra_showBp']: # show G or GB
-
-                        getattr(self.ui, 'mpl_sp' + harm).update_data({'ln': 'lsp', 'x':factor_span, 'y': gc_list})
-                    elif self.settings['radioButton_spectra_showpolar']: # polar plot
-                        idx = np.where((f[chn_name][harm] >= factor_span[0]) & (f[chn_name][harm] <= factor_span[1]))
-
-                        getattr(self.ui, 'mpl_sp' + harm).update_data({'ln': 'lsp', 'x':fit_result['fit_g'][idx], 'y': fit_result['fit_b'][idx]})
-
-
-                    # update srec
-                    cen_rec_freq = fit_result['v_fit']['cen_rec']['value']
-                    cen_rec_G = self.peak_tracker.get_output(key='gmod', chn_name=chn_name, harm=harm).eval(
-                        self.peak_tracker.get_output(key='params', chn_name=chn_name, harm=harm),
-                        x=cen_rec_freq
-                    )
-
-                    # save data to fs and gs
-                    fs[chn_name].append(fit_result['v_fit']['cen_rec']['value']) # fs
-                    gs[chn_name].append(fit_result['v_fit']['wid_rec']['value'] ) # gs = half_width
-                    logger.info(cen_rec_freq) 
-                    logger.info(cen_rec_G) 
-
-                    if self.settings['radioButton_spectra_showGp'] or self.settings['radioButton_spectra_showBp']: # show G or GB
-                        getattr(self.ui, 'mpl_sp' + harm).update_data({'ln': 'srec', 'x': cen_rec_freq, 'y': cen_rec_G})
-                    elif self.settings['radioButton_spectra_showpolar']: # polar plot
-                        cen_rec_B = self.peak_tracker.get_output(key='bmod', chn_name=chn_name, harm=harm).eval(
-                            self.peak_tracker.get_output(key='params', chn_name=chn_name, harm=harm),
-                            x=cen_rec_freq
-                        )
-
-                        getattr(self.ui, 'mpl_sp' + harm).update_data({'ln': 'srec', 'x': cen_rec_G, 'y': cen_rec_B})
-
-                    if self.settings['checkBox_spectra_showchi']: # show chi square
-                        getattr(self.ui, 'mpl_sp' + harm).update_sp_text_chi(fit_result['v_fit']['chisqr'])
-                else: # collect data w/o fitting
-                    # save data to fs and gs
-                    fs[chn_name].append(np.nan) # fs
-                    gs[chn_name].append(np.nan) # gs = half_width
-                    # clear lines
-                    getattr(self.ui, 'mpl_sp' + harm).clr_lines(l_list=['lGfit', 'lBfit', 'lPfit', 'lsp', 'srec'])
-
-                ## get tracking data
-                # get span from tracking
-                span, cen_trk_freq = self.peak_tracker.peak_track(chn_name=chn_name, harm=harm)
-                # check span range is in range
-                span = self.span_check(harm, *span)
-                # save span
-                self.set_freq_span(span, harm=harm, chn_name=chn_name)
-                # update UI
-                self.update_frequencies()
-
-                # update strk
-                cen_trk_G = G[chn_name][harm][
-                    np.argmin(np.abs(f[chn_name][harm] - cen_trk_freq))
-                    ]
-
-                logger.info(cen_trk_freq) 
-                logger.info(cen_trk_G) 
-
-
-                if self.settings['radioButton_spectra_showGp'] or self.settings['radioButton_spectra_showBp']: # show G or GB
-                    getattr(self.ui, 'mpl_sp' + harm).update_data({'ln': 'strk', 'x': cen_trk_freq, 'y': cen_trk_G})
-                elif self.settings['radioButton_spectra_showpolar']: # polar plot
-                    cen_trk_B = B[chn_name][harm][
-                    np.argmin(np.abs(f[chn_name][harm] - cen_trk_freq))
-                    ]
-
-                    getattr(self.ui, 'mpl_sp' + harm).update_data({'ln': 'strk', 'x': cen_trk_G, 'y': cen_trk_B})
+            # temperature at the scan time sampled while scanning
+            if self.settings['checkBox_settings_temp_sensor'] == True and hasattr(self.temp_sensor, 'temp_at'):
+                curr_temp[chn_name] = self.temp_sensor.temp_at(t_scan)
+                # update status bar
+                self.statusbar_temp_update(curr_temp=curr_temp[chn_name])
 
-                # set xticks
-                # self.mpl_set_faxis(getattr(self.ui, 'mpl_sp' + str(harm)).ax[0])
+            if data is None: # vna error
+                print('Analyzer connection error!')
+                # stop test
+                self.idle = True
+                self.ui.pushButton_runstop.setChecked(False)
+                # alert
+                process = self.process_messagebox(
+                    text='Failed to connect with analyzer!',
+                    message=['Please check the connection and power.'],
+                    opts=False,
+                    forcepop=True,
+                )
+                return
 
         # Save scan data to file, fitting data in RAM to file
         if self.spectra_refresh_modulus() == 0: # check if to save by intervals
@@ -6835,6 +6872,7 @@ class QCMApp(QMainWindow):
 
         # increase counter
         self.counter += 1
+        self.plot_scheduler.end_scan()
 
         self.idle = True
 
@@ -6844,6 +6882,188 @@ class QCMApp(QMainWindow):
         self.set_status_pts()
 
 
+    def process_scan_data(self, chn_name, harm, f, G, B):
+        '''
+        fit, track and plot the scanned data of harm and chn_name
+        return fs, gs of the harmonic
+        '''
+        fs_val, gs_val, span, frame = Acquisition.fit_and_track(
+            self.peak_tracker, chn_name, harm, f, G, B,
+            self.settings['harmdata'],
+            self.settings['freq_span'],
+            freq_range=self.settings['freq_range'][harm],
+            fit=self.get_harmdata('checkBox_harmfit', harm=harm, chn_name=chn_name),
+        )
+        # save span
+        self.set_freq_span(span, harm=harm, chn_name=chn_name)
+        # update UI
+        self.update_frequencies()
+
+        self.plot_scan_frame(frame)
+
+        return fs_val, gs_val
+
+
+    def plot_scan_frame(self, frame):
+        '''
+        plot the spectra, fitting and tracking of a harmonic in sp<harm>
+        frame: dict from Acquisition.fit_and_track
+        '''
+        harm = frame['harm']
+        f, G, B = frame['f'], frame['G'], frame['B']
+        mpl = getattr(self.ui, 'mpl_sp' + str(harm))
+
+        # plot data in sp<harm>
+        if self.settings['radioButton_spectra_showGp']: # checked
+            self.plot_scheduler.submit(mpl, {'ln': 'lG', 'x': f, 'y': G})
+        elif self.settings['radioButton_spectra_showBp']: # checked
+            self.plot_scheduler.submit(mpl, {'ln': 'lG', 'x': f, 'y': G}, {'ln': 'lB', 'x': f, 'y': B})
+        elif self.settings['radioButton_spectra_showpolar']: # checked
+            self.plot_scheduler.submit(mpl, {'ln': 'lP', 'x': G, 'y': B})
+
+        fit = frame['fit']
+        if fit is not None: # fitted
+            # plot fitted data
+            if self.settings['radioButton_spectra_showGp']: # checked
+                self.plot_scheduler.submit(mpl, {'ln': 'lGfit', 'x': f, 'y': fit['fit_g']})
+            elif self.settings['radioButton_spectra_showBp']: # checked
+                self.plot_scheduler.submit(mpl, {'ln': 'lGfit', 'x': f, 'y': fit['fit_g']}, {'ln': 'lBfit', 'x': f, 'y': fit['fit_b']})
+            elif self.settings['radioButton_spectra_showpolar']: # checked
+                self.plot_scheduler.submit(mpl, {'ln': 'lPfit', 'x': fit['fit_g'], 'y': fit['fit_b']})
+
+            # update lsp
+            factor_span = fit['factor_span']
+            if self.settings['radioButton_spectra_showGp'] or self.settings['radioButton_spectra_showBp']: # show G or GB
+                self.plot_scheduler.submit(mpl, {'ln': 'lsp', 'x':factor_span, 'y': fit['gc_list']})
+            elif self.settings['radioButton_spectra_showpolar']: # polar plot
+                idx = np.where((f >= factor_span[0]) & (f <= factor_span[1]))
+                self.plot_scheduler.submit(mpl, {'ln': 'lsp', 'x':fit['fit_g'][idx], 'y': fit['fit_b'][idx]})
+
+            # update srec
+            if self.settings['radioButton_spectra_showGp'] or self.settings['radioButton_spectra_showBp']: # show G or GB
+                self.plot_scheduler.submit(mpl, {'ln': 'srec', 'x': fit['cen_rec_freq'], 'y': fit['cen_rec_G']})
+            elif self.settings['radioButton_spectra_showpolar']: # polar plot
+                self.plot_scheduler.submit(mpl, {'ln': 'srec', 'x': fit['cen_rec_G'], 'y': fit['cen_rec_B']})
+
+            if self.settings['checkBox_spectra_showchi']: # show chi square
+                mpl.update_sp_text_chi(fit['chisqr'])
+        else: # collect data w/o fitting
+            # clear lines
+            self.plot_scheduler.submit(mpl, *[{'ln': ln, 'x': [], 'y': []} for ln in ['lGfit', 'lBfit', 'lPfit', 'lsp', 'srec']])
+
+        # update strk
+        if self.settings['radioButton_spectra_showGp'] or self.settings['radioButton_spectra_showBp']: # show G or GB
+            self.plot_scheduler.submit(mpl, {'ln': 'strk', 'x': frame['cen_trk_freq'], 'y': frame['cen_trk_G']})
+        elif self.settings['radioButton_spectra_showpolar']: # polar plot
+            self.plot_scheduler.submit(mpl, {'ln': 'strk', 'x': frame['cen_trk_G'], 'y': frame['cen_trk_B']})
+
+
+    def get_acquisition_plan(self):
+        '''
+        return the plan of data collection for self.acq_engine from current settings
+        '''
+        chn_name_list = [chn_name for chn_name in ['samp', 'ref'] if self.settings['checkBox_activechn_' + chn_name]]
+        harm_list = self.get_all_checked_harms()
+        return {
+            'interval': self.settings['spinBox_scaninterval'], # in s
+            'chn_names': chn_name_list,
+            'harm_list': harm_list,
+            'chns': {chn_name: self.get_chn_by_name(chn_name) for chn_name in chn_name_list},
+            'cal': self.vna_tracker.cal,
+            'steps': {chn_name: {harm: int(self.get_harmdata('lineEdit_scan_harmsteps', harm=harm, chn_name=chn_name)) for harm in harm_list} for chn_name in chn_name_list},
+            'harmdata': self.settings['harmdata'],
+            'freq_span': self.settings['freq_span'],
+            'freq_range': self.settings['freq_range'],
+            'fit': {chn_name: {harm: self.get_harmdata('checkBox_harmfit', harm=harm, chn_name=chn_name) for harm in harm_list} for chn_name in chn_name_list},
+            'temp': self.settings['checkBox_settings_temp_sensor'] == True,
+            'time_str_format': config_default['time_str_format'],
+        }
+
+
+    def get_acquisition_span_edits(self):
+        '''
+        return spans {chn_name: {harm: span}} changed in the UI after they were received from self.acq_engine
+        '''
+        spans = {}
+        for chn_name, harm_spans in self.acq_spans.items():
+            for harm, span in harm_spans.items():
+                span_ui = self.settings['freq_span'][chn_name][harm]
+                if not np.array_equal(span_ui, span):
+                    spans.setdefault(chn_name, {})[harm] = list(span_ui)
+        return spans
+
+
+    def on_acquisition_data(self):
+        '''
+        save the data collected by self.acq_engine
+        '''
+        for result in self.acq_engine.get_data():
+            if result['error']: # vna error
+                print(result['error'])
+                # stop test
+                self.ui.pushButton_runstop.setChecked(False)
+                # alert
+                process = self.process_messagebox(
+                    text='Failed to connect with analyzer!',
+                    message=['Please check the connection and power.'],
+                    opts=False,
+                    forcepop=True,
+                )
+                return
+
+            chn_name_list, harm_list = result['chn_names'], result['harm_list']
+            # spans tracked by acq_engine
+            for chn_name in chn_name_list:
+                for harm in harm_list:
+                    if result['plan_ver'] < self.acq_span_vers.get((chn_name, harm), 0): # collected before the span changed in the UI is used
+                        continue
+                    self.set_freq_span(result['freq_span'][chn_name][harm], harm=harm, chn_name=chn_name)
+                    self.acq_spans.setdefault(chn_name, {})[harm] = list(self.settings['freq_span'][chn_name][harm])
+                if result['temp'][chn_name] is not None:
+                    self.statusbar_temp_update(curr_temp=result['temp'][chn_name])
+            self.update_frequencies()
+
+            # Save scan data to file, fitting data in RAM to file
+            if self.spectra_refresh_modulus() == 0: # check if to save by intervals
+                self.writing = True
+                # save raw
+                self.data_saver.dynamic_save(chn_name_list, harm_list, t=result['t'], temp=result['temp'], f=result['f'], G=result['G'], B=result['B'], fs=result['fs'], gs=result['gs'], marks=[0 for _ in harm_list])
+                # save data
+                self.data_saver.save_data()
+                # plot data
+                self.update_mpl_plt12()
+                self.writing = False
+
+            # increase counter
+            self.counter += 1
+            self.plot_scheduler.end_scan()
+
+        # display total points collected
+        self.set_status_pts()
+
+
+    def on_acquisition_plot(self):
+        '''
+        plot the frames from self.acq_engine
+        '''
+        for frame in self.acq_engine.get_plot_frames():
+            self.plot_scan_frame(frame)
+
+
+    def on_acquisition_stopped(self):
+        '''
+        save the rest data when self.acq_engine is stopped
+        '''
+        logger.info('acquisition: %s', self.acq_engine.summary())
+        self.on_acquisition_data()
+        self.on_acquisition_plot()
+        self.idle = True
+        # spans of vna changed by acq_engine
+        self.vna_tracker = VNATracker()
+        if not self.timer.isActive(): # test stopped
+            self.process_saving_when_stop()
+
+
     def data_refit(self, chn_name, sel_idx_dict, regenerate=False):
         '''
         data refit routine
@@ -6918,14 +7138,14 @@ class QCMApp(QMainWindow):
 
                 # plot data in sp<harm> and fitting
                 if self.settings['radioButton_spectra_showGp']: # checked
-                    getattr(self.ui, 'mpl_sp' + harm).update_data(
+                    self.plot_scheduler.submit(getattr(self.ui, 'mpl_sp' + harm),
                         {'ln': 'lG', 'x': f, 'y': G},
                         {'ln': 'lGfit','x': f, 'y': fit_result['fit_g']},
                         {'ln': 'lsp', 'x': factor_span, 'y': gc_list},
                         {'ln': 'srec', 'x': cen_rec_freq, 'y': cen_rec_G}
                     )
                 elif self.settings['radioButton_spectra_showBp']: # checked
-                    getattr(self.ui, 'mpl_sp' + harm).update_data(
+                    self.plot_scheduler.submit(getattr(self.ui, 'mpl_sp' + harm),
                         {'ln':
                          'lG', 'x': f, 'y': G},
                         {'ln':
@@ -6947,7 +7167,7 @@ class QCMApp(QMainWindow):
                         x=cen_rec_freq
                     )
 
-                    getattr(self.ui, 'mpl_sp' + harm).update_data({'ln': 'lP', 'x': G, 'y': B},
+                    self.plot_scheduler.submit(getattr(self.ui, 'mpl_sp' + harm), {'ln': 'lP', 'x': G, 'y': B},
                         {'ln':
                         'lPfit', 'x': fit_result['fit_g'], 'y': fit_result['fit_b']},
                         {'ln':
@@ -7142,8 +7362,16 @@ if __name__ == '__main__':
         sys.excepthook = exception_hook 
 
     app = QApplication(sys.argv)
+    t_start = time.perf_counter()
     qcm_app = QCMApp()
+    startup_times['window'] = time.perf_counter() - t_start
     qcm_app.show()
+    # time to the first event (window shown)
+    def log_startup_times():
+        startup_times['shown'] = time.perf_counter() - startup_times['start']
+        startup_times.pop('start')
+        logger.info('startup times (s): %s, lazy imports: %s', startup_times, UIModules.lazy_import_times)
+    QTimer.singleShot(0, log_startup_times)
     sys.exit(app.exec_())
 
 
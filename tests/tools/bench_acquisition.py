@@ -0,0 +1,213 @@
+'''
+Load test of the acquisition loop with the simulated analyzer (AccessMyVNA_dummy).
+It runs the steps of data_collection without the UI: scanning the harmonics of
+each channel (Acquisition.ScanPipeline), fitting and tracking the peaks
+(PeakTracker) and saving the queue (DataSaver.dynamic_save), and reports the
+time of each step per scan and the error of the fitted peaks to the simulated
+ones. The serial loop (processing after each scan) is compared with the
+pipelined one (processing the previous harmonic during the scan).
+With --mode thread, the loop runs in Acquisition.AcquisitionEngine at fixed
+intervals while a slow consumer (the UI saving and plotting) takes the results,
+and the timing of the scans and the dropped plot frames are reported.
+Run it from the repository root:
+    python tests/tools/bench_acquisition.py -n 20 -l 1
+    python tests/tools/bench_acquisition.py -n 20 --mode thread -i 2 -u 1.5
+Use -p to profile the loop with cProfile.
+'''
+
+import os
+import sys
+import argparse
+import copy
+import cProfile
+import datetime
+import pstats
+import tempfile
+import threading
+import time
+import numpy as np
+import pandas as pd
+
+root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+sys.path.insert(0, os.path.join(root, 'rheoQCM', 'modules'))
+sys.path.insert(0, os.path.join(root, 'rheoQCM'))
+import UISettings
+import DataSaver
+from PeakTracker import PeakTracker
+from AccessMyVNA_dummy import AccessMyVNA
+from Acquisition import ScanPipeline, AcquisitionEngine
+
+
+time_str_format = '%Y-%m-%d %H:%M:%S.%f'
+settings = {'max_harmonic': 9, 'time_str_format': time_str_format}
+span_width = 10 # initial span in half bandwidth
+
+
+class Loop:
+    '''
+    acquisition loop as data_collection runs it
+    '''
+    def __init__(self, vna, chn_names, harm_list, folder, fit=True, pipeline=True):
+        self.vna = vna
+        self.scan_pipeline = ScanPipeline(vna, pipeline=pipeline)
+        self.chn_names = chn_names
+        self.harm_list = harm_list
+        self.fit = fit
+        self.harmdata = copy.deepcopy(UISettings.settings_default['harmdata'])
+        self.freq_span = {chn_name: {} for chn_name in ['samp', 'ref']}
+        for chn_name in chn_names:
+            for harm in harm_list:
+                cen, wid = vna.true_peak(harm)
+                self.freq_span[chn_name][harm] = [cen - span_width * wid, cen + span_width * wid]
+        self.peak_tracker = PeakTracker(max_harm=settings['max_harmonic'])
+        self.data_saver = None
+        if hasattr(pd.DataFrame, 'append'): # dynamic_save appends rows with DataFrame.append
+            self.data_saver = DataSaver.DataSaver(settings=settings)
+            self.data_saver.init_file(os.path.join(folder, 'acquisition.h5'), settings=settings, t0=datetime.datetime.now().strftime(time_str_format))
+        self.times = {'cycle': [], 'wait': [], 'overlap': [], 'fit': [], 'track': [], 'save': []}
+        self.errors = {'f': [], 'g': []} # fitted - simulated (Hz)
+
+    def get_setflg(self, chn_name, harm):
+        return {'f': self.freq_span[chn_name][harm], 'steps': self.harmdata[chn_name][harm]['lineEdit_scan_harmsteps'], 'chn': 1 if chn_name == 'samp' else 2, 'cal': {}}
+
+    def process(self, chn_name, harm, f, G, B):
+        self.peak_tracker.update_input(chn_name, harm, harmdata=self.harmdata, freq_span=self.freq_span, fGB=[f, G, B])
+        t_start = time.perf_counter()
+        if self.fit:
+            fit_result = self.peak_tracker.peak_fit(chn_name, harm, components=False)
+            self.fs[chn_name].append(fit_result['v_fit']['cen_rec']['value'])
+            self.gs[chn_name].append(fit_result['v_fit']['wid_rec']['value'])
+            cen, wid = self.peaks[chn_name][harm]
+            self.errors['f'].append(self.fs[chn_name][-1] - cen)
+            self.errors['g'].append(self.gs[chn_name][-1] - wid)
+        else:
+            self.fs[chn_name].append(np.nan)
+            self.gs[chn_name].append(np.nan)
+        self.t_fit += time.perf_counter() - t_start
+
+        t_start = time.perf_counter()
+        span, cen_trk_freq = self.peak_tracker.peak_track(chn_name=chn_name, harm=harm)
+        if not any(np.isnan(span)):
+            self.freq_span[chn_name][harm] = span
+        self.t_track += time.perf_counter() - t_start
+
+    def run_once(self):
+        f, G, B, curr_time, curr_temp = {}, {}, {}, {}, {}
+        self.fs, self.gs = {}, {}
+        self.peaks = {} # simulated (cen, wid) by the span center at the scan time
+        self.t_fit = self.t_track = 0
+        t_cycle = t_wait = t_overlap = 0
+        for chn_name in self.chn_names:
+            self.fs[chn_name], self.gs[chn_name] = [], []
+            self.peaks[chn_name] = {harm: self.vna.true_peak(harm) for harm in self.harm_list}
+            curr_time[chn_name] = datetime.datetime.now().strftime(time_str_format)
+            curr_temp[chn_name] = np.nan
+
+            with self.vna:
+                data = self.scan_pipeline.run(chn_name, self.harm_list, self.get_setflg, process=self.process)
+            f[chn_name] = {harm: val[0] for harm, val in data.items()}
+            G[chn_name] = {harm: val[1] for harm, val in data.items()}
+            B[chn_name] = {harm: val[2] for harm, val in data.items()}
+            t_cycle += self.scan_pipeline.last['cycle']
+            t_wait += self.scan_pipeline.last['wait']
+            t_overlap += self.scan_pipeline.last['overlap']
+
+        t_start = time.perf_counter()
+        if self.data_saver is not None:
+            self.data_saver.dynamic_save(self.chn_names, self.harm_list, t=curr_time, temp=curr_temp, f=f, G=G, B=B, fs=self.fs, gs=self.gs, marks=[0 for _ in self.harm_list])
+        t_save = time.perf_counter() - t_start
+
+        for key, val in zip(['cycle', 'wait', 'overlap', 'fit', 'track', 'save'], [t_cycle + t_save, t_wait, t_overlap, self.t_fit, self.t_track, t_save]):
+            self.times[key].append(val)
+
+    def report(self):
+        nscans = len(self.times['cycle'])
+        print('{} {} scans of {} x harmonics {}'.format(nscans, 'pipelined' if self.scan_pipeline.pipeline else 'serial', self.chn_names, self.harm_list))
+        print('{:<8} {:>12} {:>12}'.format('step', 'mean (ms)', 'max (ms)'))
+        for key, val in self.times.items():
+            print('{:<8} {:12.2f} {:12.2f}'.format(key, np.mean(val) * 1e3, np.max(val) * 1e3))
+        if self.errors['f']:
+            print('fit error (Hz): f {:.3g} +/- {:.3g}, gamma {:.3g} +/- {:.3g}'.format(np.mean(self.errors['f']), np.std(self.errors['f']), np.mean(self.errors['g']), np.std(self.errors['g'])))
+        if self.data_saver is None:
+            print('save: n/a (dynamic_save needs DataFrame.append)')
+
+
+def run_thread(vna, chn_names, harm_list, folder, nscans, interval, ui_load, fit=True):
+    '''
+    run AcquisitionEngine with a consumer spending ui_load s on each result
+    '''
+    loop = Loop(vna, chn_names, harm_list, folder, fit=fit) # for spans, harmdata and saving
+    plan = {
+        'interval': interval,
+        'chn_names': chn_names,
+        'harm_list': harm_list,
+        'chns': {'samp': 1, 'ref': 2},
+        'cal': {},
+        'steps': {chn_name: {harm: loop.harmdata[chn_name][harm]['lineEdit_scan_harmsteps'] for harm in harm_list} for chn_name in chn_names},
+        'harmdata': loop.harmdata,
+        'freq_span': loop.freq_span,
+        'freq_range': {harm: [(int(harm) - 0.1) * vna.sim['f1'], (int(harm) + 0.1) * vna.sim['f1']] for harm in harm_list},
+        'fit': {chn_name: {harm: fit for harm in harm_list} for chn_name in chn_names},
+        'temp': False,
+        'time_str_format': time_str_format,
+    }
+    ready = threading.Event()
+    engine = AcquisitionEngine(vna, loop.peak_tracker, on_data=ready.set, on_plot=ready.set)
+    engine.start(plan)
+    nresults, t_ui = 0, []
+    while nresults < nscans:
+        ready.wait()
+        ready.clear()
+        frames = engine.get_plot_frames()
+        results = engine.get_data()
+        t_start = time.perf_counter()
+        for result in results:
+            if loop.data_saver is not None:
+                loop.data_saver.dynamic_save(chn_names, harm_list, t=result['t'], temp=result['temp'], f=result['f'], G=result['G'], B=result['B'], fs=result['fs'], gs=result['gs'], marks=[0 for _ in harm_list])
+        if frames or results:
+            time.sleep(ui_load) # saving and plotting of the UI
+        t_ui.append(time.perf_counter() - t_start)
+        nresults += len(results)
+    engine.stop(wait=True)
+    stats = engine.summary()
+    print('{} threaded scans of {} x harmonics {} every {} s, UI load {} s'.format(nresults, chn_names, harm_list, interval, ui_load))
+    print('cycle time {:.1f} ms, start lateness {:.2f} ms, overruns {}'.format(stats['cycle_time'] * 1e3, stats['lateness'] * 1e3, stats['overruns']))
+    print('plot frames {}, replaced {}, shed {}, max pending results {}'.format(stats['frames'], stats['frames_dropped'], stats['frames_shed'], stats['max_pending']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load test of the acquisition loop with the simulated analyzer.')
+    parser.add_argument('-n', '--nscans', type=int, default=20, help='number of scans')
+    parser.add_argument('-c', '--chn', type=str, default='samp', help='channels (samp, ref, samp,ref)')
+    parser.add_argument('-m', '--harms', type=str, default='1,3,5,7,9', help='harmonics')
+    parser.add_argument('-l', '--latency', type=float, default=1, help='scale of the scan time of the analyzer (0: no wait)')
+    parser.add_argument('-s', '--spurious', type=int, default=0, help='number of spurious peaks around each harmonic')
+    parser.add_argument('--noise', type=float, default=1e-3, help='noise relative to the peak conductance')
+    parser.add_argument('--nofit', action='store_true', help='scan and track without fitting')
+    parser.add_argument('--mode', type=str, default='both', help='serial, pipeline, both or thread')
+    parser.add_argument('-i', '--interval', type=float, default=2, help='scan interval in s (thread)')
+    parser.add_argument('-u', '--ui_load', type=float, default=1, help='time in s the UI spends on results (thread)')
+    parser.add_argument('-p', '--profile', action='store_true', help='profile the loop with cProfile')
+    args = parser.parse_args()
+
+    if args.mode == 'thread':
+        vna = AccessMyVNA(latency_scale=args.latency, spurious=args.spurious, noise=args.noise, seed=0)
+        with tempfile.TemporaryDirectory() as folder:
+            run_thread(vna, args.chn.split(','), args.harms.split(','), folder, args.nscans, args.interval, args.ui_load, fit=not args.nofit)
+        sys.exit(0)
+
+    modes = {'serial': [False], 'pipeline': [True], 'both': [False, True]}[args.mode]
+    profiler = cProfile.Profile() if args.profile else None
+    for pipeline in modes:
+        vna = AccessMyVNA(latency_scale=args.latency, spurious=args.spurious, noise=args.noise, seed=0)
+        with tempfile.TemporaryDirectory() as folder:
+            loop = Loop(vna, args.chn.split(','), args.harms.split(','), folder, fit=not args.nofit, pipeline=pipeline)
+            if profiler:
+                profiler.enable()
+            for _ in range(args.nscans):
+                loop.run_once()
+            if profiler:
+                profiler.disable()
+            loop.report()
+    if profiler:
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(20)
@@ -0,0 +1,146 @@
+'''
+Benchmark of the mechanics contour plots with the Agg backend.
+The legacy rebuild (clearing the axes, computing the grids and drawing the
+contours, the colorbar and the data lines again on every change) is compared
+with QCM.ContourGrids and the in-place contour update of
+MatplotlibWidget.update_contour for repeated changes of the levels and the
+colormap (cached grids) and of the limits (new grids).
+Run it from the repository root:
+    python tests/tools/bench_contour.py -r 10 -g 100,200,400
+'''
+
+import os
+import sys
+import argparse
+import time
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from matplotlib import ticker
+from mpl_toolkits.axes_grid1 import make_axes_locatable
+
+root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+sys.path.insert(0, os.path.join(root, 'rheoQCM', 'modules'))
+import QCM
+
+
+nhcalc, refh = '353', 3
+phi_lim, dlam_lim = (0, 90), (0, 1)
+cmaps = ['jet', 'viridis']
+
+
+def legacy_mesh(qcm, contour_type, num, dlam_lim):
+    '''
+    grids as prep_contour_mesh computed them before ContourGrids
+    '''
+    phi = np.linspace(phi_lim[0], phi_lim[1], num)
+    dlam = np.linspace(dlam_lim[0], dlam_lim[1], num)
+    dlam_i, phi_i = np.meshgrid(dlam, phi * np.pi / 180)
+    X, Y = dlam_i, phi_i * 180 / np.pi
+    qcm.refh = refh
+    nh = QCM.nhcalc2nh(nhcalc)
+    if contour_type == 'normfnormg':
+        normdelfstar = qcm.normdelfstar(qcm.refh, dlam_i, phi_i)
+        normdelfstar[:,0] = -1
+        Z1, Z2 = np.real(normdelfstar), np.imag(normdelfstar)
+    else:
+        Z1, Z2 = qcm.rhcalc(nh, dlam_i, phi_i), qcm.rdcalc(nh, dlam_i, phi_i)
+    return {'X': X, 'Y': Y, 'Z': Z1}, {'X': X, 'Y': Y, 'Z': Z2}
+
+
+class Contour:
+    '''
+    contour plot of MatplotlibWidget (init_contour and update_contour)
+    '''
+    def __init__(self):
+        self.fig = plt.figure(figsize=(4, 3), dpi=100)
+        self.ax = [self.fig.add_subplot(111)]
+        self.ax.append(make_axes_locatable(self.ax[0]).append_axes('right', size='5%', pad='2%'))
+        self.l = {}
+
+    def init(self, X, Y, Z, levels, cmap):
+        self.ax[0].cla()
+        self.ax[1].clear()
+        self.l['C'] = self.ax[0].contourf(X, Y, Z, levels=levels, cmap=cmap)
+        self.l['colorbar'] = self.fig.colorbar(self.l['C'], cax=self.ax[1])
+        self.l['colorbar'].locator = ticker.MaxNLocator(nbins=6)
+        self.l['colorbar'].update_ticks()
+        for i in range(1, 10, 2):
+            self.l['l' + str(i)] = self.ax[0].plot([], [], markerfacecolor='none', alpha=0.75)
+            for key in ['p', 'pm']:
+                self.l[key + str(i)] = self.ax[0].errorbar([], [], yerr=np.nan, xerr=np.nan, marker='o', linestyle='none', alpha=0.75, capsize=3)
+        self.fig.canvas.draw()
+
+    def update(self, X, Y, Z, levels, cmap):
+        self.l['C'].remove()
+        self.l['C'] = self.ax[0].contourf(X, Y, Z, levels=levels, cmap=cmap)
+        self.l['colorbar'].update_normal(self.l['C'])
+        self.l['colorbar'].locator = ticker.MaxNLocator(nbins=6)
+        self.l['colorbar'].update_ticks()
+        self.fig.canvas.draw()
+
+
+def run(contour_type, num, nrepeats, num_coarse):
+    qcm = QCM.QCM()
+    qcm.f1 = 5e6
+    results = {}
+
+    # legacy: rebuild on every change
+    plots = [Contour(), Contour()]
+    t_start = time.perf_counter()
+    for i in range(nrepeats):
+        meshes = legacy_mesh(qcm, contour_type, num, dlam_lim)
+        for plot, mesh in zip(plots, meshes):
+            plot.init(**mesh, levels=20 + i % 2, cmap=cmaps[i % 2])
+    results['legacy'] = (time.perf_counter() - t_start) / nrepeats
+
+    # cached grids and in-place update: levels and colormap changed
+    grids = QCM.ContourGrids(qcm)
+    plots = [Contour(), Contour()]
+    for plot, mesh in zip(plots, grids.get(contour_type, nhcalc, refh, dlam_lim, phi_lim, num)):
+        plot.init(**mesh, levels=20, cmap=cmaps[0])
+    t_start = time.perf_counter()
+    for i in range(nrepeats):
+        meshes = grids.get(contour_type, nhcalc, refh, dlam_lim, phi_lim, num)
+        for plot, mesh in zip(plots, meshes):
+            plot.update(**mesh, levels=20 + i % 2, cmap=cmaps[i % 2])
+    results['cached'] = (time.perf_counter() - t_start) / nrepeats
+
+    # new limits: first frame on the coarse grid
+    t_coarse, t_fine = [], []
+    for i in range(nrepeats):
+        lim = (0, 1 + 0.1 * (i + 1))
+        t_start = time.perf_counter()
+        meshes = grids.get(contour_type, nhcalc, refh, lim, phi_lim, num_coarse)
+        for plot, mesh in zip(plots, meshes):
+            plot.update(**mesh, levels=20, cmap=cmaps[0])
+        t_coarse.append(time.perf_counter() - t_start)
+        t_start = time.perf_counter()
+        meshes = grids.get(contour_type, nhcalc, refh, lim, phi_lim, num)
+        for plot, mesh in zip(plots, meshes):
+            plot.update(**mesh, levels=20, cmap=cmaps[0])
+        t_fine.append(time.perf_counter() - t_start)
+    results['coarse'] = np.mean(t_coarse)
+    results['refined'] = np.mean(t_fine)
+
+    # the grids are the same as the legacy ones
+    for mesh, mesh_legacy in zip(grids.get(contour_type, nhcalc, refh, dlam_lim, phi_lim, num), legacy_mesh(qcm, contour_type, num, dlam_lim)):
+        assert np.allclose(mesh['Z'], mesh_legacy['Z'], equal_nan=True)
+
+    plt.close('all')
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark of the mechanics contour plots.')
+    parser.add_argument('-r', '--nrepeats', type=int, default=10, help='number of changes')
+    parser.add_argument('-g', '--grids', type=str, default='100,200,400', help='grid sizes (points of each axis)')
+    parser.add_argument('-c', '--coarse', type=int, default=25, help='size of the coarse grid')
+    args = parser.parse_args()
+
+    print('{:<12} {:>6} {:>12} {:>12} {:>12} {:>12}'.format('type', 'num', 'legacy (ms)', 'cached (ms)', 'coarse (ms)', 'refined (ms)'))
+    for contour_type in ['normfnormg', 'rhrd']:
+        for num in [int(n) for n in args.grids.split(',')]:
+            results = run(contour_type, num, args.nrepeats, args.coarse)
+            print('{:<12} {:>6} {:12.1f} {:12.1f} {:12.1f} {:12.1f}'.format(contour_type, num, *[results[key] * 1e3 for key in ['legacy', 'cached', 'coarse', 'refined']]))
@@ -0,0 +1,122 @@
+'''
+Benchmark of the harmonic column accessors of DataSaver.
+It loads a data file and compares the list-in-cell conversions used before
+(legacy: np.array(s.values.tolist()) / Series.apply per call) with the
+cached dense arrays (DataSaver.get_harm_arr / HarmonicTable) and the cached
+delta values (DataSaver.get_delta_arr) and the decimated query
+(DataSaver.query_window).
+Run it from the repository root:
+    python tests/tools/bench_harm_table.py -f test_data/polymer.h5 -r 50 -t 1000
+'''
+
+import os
+import sys
+import argparse
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__)))), 'rheoQCM', 'modules'))
+import DataSaver
+
+
+time_str_format = '%Y-%m-%d %H:%M:%S.%f'
+
+
+def legacy_columns(df, col, mark=False):
+    '''
+    list column to columns as get_list_column_to_columns did before
+    '''
+    s = df[col].copy()
+    if not mark:
+        return pd.DataFrame(s.values.tolist(), s.index)
+    arr_s = np.array(s.values.tolist(), dtype=float)
+    arr_m = np.array(df['marks'].values.tolist(), dtype=float)
+    if np.any(arr_m == 1):
+        arr_s = arr_s * arr_m
+        arr_s[arr_s == 0] = np.nan
+    return pd.DataFrame(arr_s, index=s.index)
+
+
+def legacy_with_marks(df):
+    return df.marks.apply(lambda x: True if 1 in x else False).any()
+
+
+def legacy_norm(df, col):
+    return df[col].apply(lambda x: list(np.array(x, dtype=float) / np.arange(1, len(x)*2+1, 2)))
+
+
+def legacy_delta_norm(df, col, ref):
+    '''
+    delta values normalized by harmonic as convert_col_to_delta_val did before (per call)
+    '''
+    return df[col].apply(lambda x: list((np.array(x, dtype=float) - np.array(ref, dtype=float)) / np.arange(1, len(x)*2+1, 2)))
+
+
+def legacy_mark_sel(df, sel_idx_dict, mark_val=1):
+    '''
+    mark selected points as mark_data did before (one copy and apply per harmonic)
+    '''
+    for harm, idx in sel_idx_dict.items():
+        df = df.copy()
+        s = df.marks.copy()
+        s.loc[idx] = s.loc[idx].apply(lambda x: [mark_val if (str(i*2+1) == harm) and (mark is not None) else mark for i, mark in enumerate(x)])
+        df['marks'] = s
+    return df
+
+
+def timeit(func, repeat):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - t0) / repeat * 1e3 # ms
+
+
+def run(path, chn_name, repeat, tile):
+    data_saver = DataSaver.DataSaver(settings={'max_harmonic': 9, 'time_str_format': time_str_format})
+    data_saver.load_file(path)
+    if tile > 1: # repeat rows to emulate a long test
+        setattr(data_saver, chn_name, pd.concat([getattr(data_saver, chn_name)] * tile, ignore_index=True))
+        prop = getattr(data_saver, chn_name + '_prop')
+        for mech_key in prop:
+            prop[mech_key] = pd.concat([prop[mech_key]] * tile, ignore_index=True)
+    df = getattr(data_saver, chn_name)
+    print('{}: {} rows of {}'.format(os.path.basename(path), df.shape[0], chn_name))
+
+    cases = [
+        ('fs to columns', lambda: legacy_columns(df, 'fs'), lambda: data_saver.get_list_column_to_columns(chn_name, 'fs')),
+        ('gs to columns (marked)', lambda: legacy_columns(df, 'gs', mark=True), lambda: data_saver.get_list_column_to_columns(chn_name, 'gs', mark=True)),
+        ('marks to columns', lambda: legacy_columns(df, 'marks'), lambda: data_saver.get_list_column_to_columns(chn_name, 'marks')),
+        ('with_marks', lambda: legacy_with_marks(df), lambda: data_saver.with_marks(chn_name)),
+        ('fs norm by harm', lambda: legacy_norm(df, 'fs'), lambda: data_saver._norm_arr_by_harm(data_saver.get_harm_arr(chn_name, 'fs'))),
+    ]
+    data_saver.get_delta_arr(chn_name, 'fs') # calculate the reference
+    cases.append(('delfn (derived)', lambda: legacy_delta_norm(df, 'fs', data_saver.exp_ref[chn_name]['f0']), lambda: data_saver.get_delta_arr(chn_name, 'fs', norm=True)))
+    cases.append(('delfn (1000 pts)', lambda: legacy_delta_norm(df, 'fs', data_saver.exp_ref[chn_name]['f0']), lambda: data_saver.query_window(chn_name, ['t', 'delfns'], npts=1000)))
+    sel_idx_dict = {harm: list(df.index[::3]) for harm in ['1', '3', '5']}
+    cases.append(('mark selection', lambda: legacy_mark_sel(df, sel_idx_dict), lambda: data_saver.selector_mark_sel(chn_name, sel_idx_dict, 1)))
+    for mech_key, mech_df in getattr(data_saver, chn_name + '_prop').items():
+        cases.append(('prop {} drho'.format(mech_key), lambda mech_df=mech_df: legacy_columns(mech_df, 'drho'), lambda mech_key=mech_key: data_saver.get_mech_column_to_columns(chn_name, mech_key, 'drho')))
+
+    print('{:<28} {:>12} {:>12} {:>8}'.format('query', 'legacy (ms)', 'cached (ms)', 'speedup'))
+    for name, legacy, cached in cases:
+        t_legacy = timeit(legacy, repeat)
+        t_cached = timeit(cached, repeat)
+        print('{:<28} {:12.3f} {:12.3f} {:8.1f}'.format(name, t_legacy, t_cached, t_legacy / t_cached))
+
+    # the decimated query keeps at most npts rows for all columns
+    for method in ['minmax', 'lttb']:
+        nrows = data_saver.query_window(chn_name, ['t', 'delfns', 'delgns'], npts=1000, method=method)['rows'].size
+        assert nrows <= min(df.shape[0], 1000)
+        print('query_window {}: {} rows (npts = 1000)'.format(method, nrows))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark harmonic column accessors of DataSaver.')
+    parser.add_argument('-f', '--file', type=str, default=os.path.join('test_data', 'polymer.h5'), help='data file (.h5)')
+    parser.add_argument('-c', '--chn', type=str, default='samp', help='channel name')
+    parser.add_argument('-r', '--repeat', type=int, default=50, help='number of repeats of each query')
+    parser.add_argument('-t', '--tile', type=int, default=1, help='repeat rows of the data t times')
+    args = parser.parse_args()
+
+    run(args.file, args.chn, args.repeat, args.tile)
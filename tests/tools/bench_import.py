@@ -0,0 +1,94 @@
+'''
+Benchmark of importing QCM-D/QCM-Z spreadsheets by DataSaver.import_data_from_df.
+It compares the row by row import used before (dynamic_save per row, which
+also creates an empty raw group per row) with the bulk import
+(DataSaver._save_queues_bulk) and reports read and import throughput.
+Run it from the repository root:
+    python tests/tools/bench_import.py -d test_data/QCM-D -t 300
+'''
+
+import os
+import sys
+import argparse
+import datetime
+import glob
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+sys.path.insert(0, os.path.join(root, 'rheoQCM', 'modules'))
+sys.path.insert(0, os.path.join(root, 'rheoQCM'))
+import DataSaver
+from UISettings import config_default
+
+
+time_str_format = '%Y-%m-%d %H:%M:%S.%f'
+settings = {'max_harmonic': 9, 'time_str_format': time_str_format}
+f1 = 5e6 # Hz
+t0 = datetime.datetime(2020, 1, 1)
+
+
+def new_data_saver(path, data_format):
+    data_saver = DataSaver.DataSaver(settings=settings)
+    data_saver.init_file(path, settings=settings, t0=t0.strftime(time_str_format))
+    data_saver.mode = data_format
+    return data_saver
+
+
+def legacy_import(data_saver, samp):
+    '''
+    save rows of samp (imported by the bulk import) one by one with dynamic_save as import_data_from_df did before
+    '''
+    harm_cols = [i for i, mark in enumerate(samp.marks.iloc[0]) if mark == 0]
+    harm_list = [str(i * 2 + 1) for i in harm_cols]
+    fGB = {'samp': {harm: np.nan for harm in harm_list}}
+    marks = [0 for _ in harm_list]
+    for row in samp.itertuples():
+        data_saver.dynamic_save(['samp'], harm_list, t={'samp': row.t}, temp={'samp': row.temp}, f=fGB, G=fGB, B=fGB, fs={'samp': [row.fs[i] for i in harm_cols]}, gs={'samp': [row.gs[i] for i in harm_cols]}, marks=marks)
+
+
+def run(path, data_format, tile, legacy_rows, folder):
+    t_start = time.perf_counter()
+    df = pd.read_excel(path) if path.endswith('.xlsx') else pd.read_csv(path)
+    t_read = time.perf_counter() - t_start
+    if tile > 1: # repeat rows to emulate a long test
+        t_col = df.columns[0]
+        step = np.nanmax(df[t_col]) + 1
+        df = pd.concat([df.assign(**{t_col: df[t_col] + step * i}) for i in range(tile)], ignore_index=True)
+    nrows = df.shape[0]
+    name = os.path.basename(path)
+
+    # bulk
+    data_saver = new_data_saver(os.path.join(folder, 'bulk.h5'), data_format)
+    t_start = time.perf_counter()
+    data_saver.import_data_from_df(df.copy(), t0, t0.strftime(time_str_format), f1, 0, config_default)
+    data_saver.save_data()
+    t_bulk = time.perf_counter() - t_start
+
+    # legacy (row by row)
+    legacy = 'n/a (needs DataFrame.append)'
+    if hasattr(pd.DataFrame, 'append'):
+        samp = data_saver.samp.iloc[:legacy_rows]
+        data_saver = new_data_saver(os.path.join(folder, 'legacy.h5'), data_format)
+        t_start = time.perf_counter()
+        legacy_import(data_saver, samp)
+        data_saver.save_data()
+        legacy = '{:10.0f} rows/s'.format(samp.shape[0] / (time.perf_counter() - t_start))
+
+    print('{:<36} {:>8} rows  read {:8.3f} s  bulk {:10.0f} rows/s  legacy {}'.format(name, nrows, t_read, nrows / t_bulk, legacy))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark importing QCM-D/QCM-Z spreadsheets.')
+    parser.add_argument('-d', '--dir', type=str, default=os.path.join('test_data', 'QCM-D'), help='folder of .xlsx/.csv files')
+    parser.add_argument('-m', '--mode', type=str, default='qcmd', help='data format (qcmd, qcmz)')
+    parser.add_argument('-t', '--tile', type=int, default=1, help='repeat rows of the data t times')
+    parser.add_argument('-l', '--legacy_rows', type=int, default=2000, help='max rows imported by the row by row import')
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.dir, '*.xlsx')) + glob.glob(os.path.join(args.dir, '*.csv')))
+    with tempfile.TemporaryDirectory() as folder:
+        for path in paths:
+            run(path, args.mode, args.tile, args.legacy_rows, folder)
@@ -0,0 +1,279 @@
+'''
+Benchmark of redrawing the figures during the acquisition with the Agg backend.
+It updates a spectra figure (G, B, fitting and tracking lines on twin axes as
+MatplotlibWidget.init_sp) and a data figure (delf of the harmonics growing over
+time) as data_collection does for each scan, and compares the full redraw
+(relim, autoscale_view and canvas.draw for each update) with blitting the
+changed lines (PlotRefresh.BlitManager). The time of each frame is reported.
+The updates of the spectra of all harmonics and the data figure in a scan are
+also submitted to PlotRefresh.RedrawScheduler with different max redraw rates,
+and the drawing time and the full draws per scan are reported.
+The data figure with long data is redrawn with all points and decimated by
+PlotRefresh.LineLOD. The errorbar plots of a prop figure are updated by the
+former zip-based code and PlotRefresh.set_errorbar_data.
+Run it from the repository root:
+    python tests/tools/bench_plot_refresh.py -n 200
+    python tests/tools/bench_plot_refresh.py -n 50 -r 0,10,4 -t 0.01
+    python tests/tools/bench_plot_refresh.py -n 0 -s 1000,100000,1000000
+'''
+
+import os
+import sys
+import argparse
+import time
+import numpy as np
+import pandas as pd
+
+import matplotlib
+matplotlib.use('Agg')
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+sys.path.insert(0, os.path.join(root, 'rheoQCM', 'modules'))
+from PlotRefresh import BlitManager, RedrawScheduler, LineLOD, set_errorbar_data
+
+
+harm_list = ['1', '3', '5', '7', '9']
+
+
+def spectra_figure():
+    fig = Figure(tight_layout={'pad': 0.05}, dpi=100, figsize=(3, 2))
+    canvas = FigureCanvasAgg(fig)
+    ax0 = fig.add_subplot(111)
+    ax1 = ax0.twinx()
+    for ax in [ax0, ax1]:
+        ax.margins(x=0, y=.05)
+    l = {
+        'lG': ax0.plot([], [], marker='.', linestyle='none', markerfacecolor='none')[0],
+        'lB': ax1.plot([], [], marker='.', linestyle='none', markerfacecolor='none')[0],
+        'lGfit': ax0.plot([], [], color='k')[0],
+        'lBfit': ax1.plot([], [], color='k')[0],
+        'srec': ax0.plot([], [], marker='x', linestyle='none', color='g')[0],
+        'strk': ax0.plot([], [], marker='+', linestyle='none', color='r')[0],
+    }
+    canvas.draw()
+    return canvas, [ax0, ax1], l
+
+
+def data_figure():
+    fig = Figure(tight_layout={'pad': 0.2}, dpi=100, figsize=(5, 4))
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
+    l = {harm: ax.plot([], [], marker='o', markerfacecolor='none')[0] for harm in harm_list}
+    canvas.draw()
+    return canvas, [ax], l
+
+
+def spectra_frames(i, npts, drift):
+    '''
+    updates of a spectra figure in one scan: spectrum, fitting, recorded and tracked centers
+    the center drifts by drift (in half bandwidth) per scan
+    '''
+    cen, wid = 5e6 + drift * 500 * i, 500.
+    f = np.linspace(5e6 - 5000, 5e6 + 5000, npts) # span kept
+    G = wid**2 / ((f - cen)**2 + wid**2) + np.random.normal(0, 1e-3, npts)
+    B = wid * (f - cen) / ((f - cen)**2 + wid**2) + np.random.normal(0, 1e-3, npts)
+    return [
+        [('lG', f, G), ('lB', f, B)],
+        [('lGfit', f, G), ('lBfit', f, B)],
+        [('srec', [cen], [1])],
+        [('strk', [cen], [1])],
+    ]
+
+
+def data_frames(i):
+    t = np.arange(i + 1)
+    return [[(harm, t, -int(harm) * (100 + t * 0.1)) for harm in harm_list]]
+
+
+class Widget:
+    '''
+    figure with the update methods of MatplotlibWidget (update_data, submit_data, flush_data)
+    '''
+    def __init__(self, make_figure, blit, shrink=0.5, nframes=200):
+        self.canvas, self.axs, self.l = make_figure()
+        self.blit_manager = BlitManager(self.canvas, enable=blit, shrink=shrink, nframes=nframes)
+        self.pending = {}
+        self.frame_times = []
+
+    def update_data(self, *args, idle=False):
+        t_start = time.perf_counter()
+        for arg in args:
+            self.l[arg['ln']].set_data(arg['x'], arg['y'])
+        axs = set(self.l[arg['ln']].axes for arg in args)
+        if self.blit_manager.enable:
+            self.blit_manager.add_artists([self.l[arg['ln']] for arg in args])
+            self.blit_manager.update(axs)
+        else: # MatplotlibWidget.reset_ax_lim and canvas_draw
+            for ax in axs:
+                ax.relim(visible_only=True)
+                ax.autoscale_view(True, True, True)
+            self.canvas.draw()
+        self.frame_times.append(time.perf_counter() - t_start)
+
+    def submit_data(self, *args):
+        nsuperseded = 0
+        for arg in args:
+            nsuperseded += arg['ln'] in self.pending
+            self.pending[arg['ln']] = arg
+        return nsuperseded
+
+    def flush_data(self):
+        args, self.pending = list(self.pending.values()), {}
+        if args:
+            self.update_data(*args, idle=True)
+
+
+def run(make_figure, make_frames, nscans, blit, shrink=0.5):
+    widget = Widget(make_figure, blit, shrink=shrink, nframes=nscans * 4)
+    for i in range(nscans):
+        for frame in make_frames(i):
+            widget.update_data(*[{'ln': ln, 'x': x, 'y': y} for ln, x, y in frame])
+    return widget.frame_times, widget.blit_manager.summary()
+
+
+def run_scheduled(nscans, npts, drift, blit, max_rate, t_process):
+    '''
+    submit the frames of harm_list spectra and the data figure to a RedrawScheduler
+    as data_collection does. t_process (s) between the frames emulates the processing
+    of each harmonic. Timers of the scheduler run in a simple event loop.
+    '''
+    widgets = {harm: Widget(spectra_figure, blit) for harm in harm_list}
+    widgets['data'] = Widget(data_figure, blit)
+    timers = [] # time to flush
+    scheduler = RedrawScheduler(max_rate=max_rate, start_timer=lambda ms: timers.append(time.perf_counter() + ms / 1000))
+    scheduler.start_scans()
+
+    def process_events():
+        for t_due in list(timers):
+            if time.perf_counter() >= t_due:
+                timers.remove(t_due)
+                scheduler.flush()
+
+    t_start = time.perf_counter()
+    for i in range(nscans):
+        for harm in harm_list:
+            for frame in spectra_frames(i, npts, drift):
+                scheduler.submit(widgets[harm], *[{'ln': ln, 'x': x, 'y': y} for ln, x, y in frame])
+                t_end = time.perf_counter() + t_process
+                while time.perf_counter() < t_end:
+                    process_events()
+        for frame in data_frames(i):
+            scheduler.submit(widgets['data'], *[{'ln': ln, 'x': x, 'y': y} for ln, x, y in frame])
+        scheduler.end_scan()
+    while timers: # the rest
+        process_events()
+    t_total = time.perf_counter() - t_start
+    stats = scheduler.summary()
+    t_draw = sum(sum(widget.frame_times) for widget in widgets.values())
+    print('{:<26} {:8.1f} ms/scan drawing  {:6.1f} full draws/scan  updates {} superseded {} flushes {}  total {:.2f} s'.format(
+        'scheduled {} /s {}'.format(max_rate, 'blit' if blit else 'full'), t_draw * 1e3 / nscans, stats['full_draws_per_scan'], stats['submitted'], stats['superseded'], stats['flushes'], t_total)
+    )
+
+
+def run_lod(sizes, lod):
+    '''
+    redraw the data figure with harm_list lines of n points (1 Hz data) for n in sizes,
+    with all points or decimated by LineLOD, and zoomed in to 1/1000 of the data
+    '''
+    canvas, axs, l = data_figure()
+    ax = axs[0]
+    line_lod = LineLOD(ax, list(l.values())) if lod else None
+    for n in sizes:
+        t = np.arange(n, dtype=float)
+        data = {l[harm]: (t, -int(harm) * (100 + t * 1e-3) + np.random.normal(0, 1, n)) for harm in harm_list}
+        t_start = time.perf_counter()
+        if lod:
+            line_lod.set_data(data)
+        else:
+            for line, (x, y) in data.items():
+                line.set_data(x, y)
+        ax.relim(visible_only=True)
+        ax.autoscale_view(True, True, True)
+        canvas.draw()
+        t_update = time.perf_counter() - t_start
+
+        t_start = time.perf_counter()
+        ax.set_xlim(n / 2, n / 2 + max(n / 1000, 10)) # zoom in (rebuilt by xlim_changed)
+        canvas.draw()
+        t_zoom = time.perf_counter() - t_start
+        ax.set_autoscale_on(True) # home
+        ax.autoscale_view(True, True, True)
+        shown = sum(len(line.get_xdata()) for line in l.values())
+        print('{:<26} {:>9} pts/line  update {:8.1f} ms  zoomed {:8.1f} ms  points drawn {}'.format('lod' if lod else 'all points', n, t_update * 1e3, t_zoom * 1e3, shown))
+
+
+def legacy_set_errorbar_data(container, x, y, xerr, yerr):
+    '''
+    errorbar update of MatplotlibWidget.update_data before set_errorbar_data
+    '''
+    line, caplines, barlinecols = container
+    line.set_data(x, y)
+    error_positions = (x-xerr,y), (x+xerr,y), (x,y-yerr), (x,y+yerr)
+    for i, pos in enumerate(error_positions):
+        caplines[i].set_data(pos)
+    barlinecols[0].set_segments(zip(zip(x-xerr,y), zip(x+xerr,y)))
+    barlinecols[1].set_segments(zip(zip(x,y-yerr), zip(x,y+yerr)))
+
+
+def run_errorbar(sizes, nrepeat=5):
+    '''
+    update a prop figure (errorbar plots of harm_list as MatplotlibWidget.init_prop) with n points (series)
+    by the legacy update and set_errorbar_data
+    '''
+    fig = Figure(tight_layout={'pad': 0.2}, dpi=100, figsize=(4, 3))
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
+    # initialized with data to have caplines (none for nan errors)
+    l = {harm: ax.errorbar([0], [0], yerr=1, xerr=1, marker='o', markerfacecolor='none', linestyle='none', capsize=4) for harm in harm_list}
+    for n in sizes:
+        x = pd.Series(np.arange(n, dtype=float))
+        data = {harm: (x, x * int(harm), x * 0.01, x * 0.05 * int(harm)) for harm in harm_list}
+        times = {}
+        for name, fun in [('legacy', legacy_set_errorbar_data), ('vectorized', set_errorbar_data)]:
+            t_start = time.perf_counter()
+            for _ in range(nrepeat):
+                for harm, (x, y, xerr, yerr) in data.items():
+                    fun(l[harm], x, y, xerr, yerr)
+            times[name] = (time.perf_counter() - t_start) / nrepeat
+        t_start = time.perf_counter()
+        ax.relim(visible_only=True)
+        ax.autoscale_view(True, True, True)
+        canvas.draw()
+        t_draw = time.perf_counter() - t_start
+        print('{:<26} {:>9} pts/line  update legacy {:8.1f} ms  vectorized {:8.1f} ms  draw {:8.1f} ms'.format('prop errorbar', n, times['legacy'] * 1e3, times['vectorized'] * 1e3, t_draw * 1e3))
+
+
+def report(name, nscans, frame_times, stats):
+    print('{:<26} {:6.2f} ms/frame {:8.1f} ms/scan   blitted {:5} ({:.2f} ms)  full {:5}'.format(
+        name, np.mean(frame_times) * 1e3, np.sum(frame_times) * 1e3 / nscans, stats['blit'], stats['blit_ms'], stats['full_draws'])
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark redrawing the figures with blitting.')
+    parser.add_argument('-n', '--nscans', type=int, default=200, help='number of scans')
+    parser.add_argument('-p', '--npts', type=int, default=400, help='points of each spectrum')
+    parser.add_argument('-d', '--drift', type=float, default=0.01, help='drift of the peak per scan in half bandwidth')
+    parser.add_argument('-r', '--rates', type=str, default='0,10,4', help='max redraws per second of the scheduler (0: redraw on each update)')
+    parser.add_argument('-s', '--sizes', type=str, default='1000,10000,100000,1000000', help='points of the lines of the data figure (level of detail)')
+    parser.add_argument('-e', '--errorbar_sizes', type=str, default='100,1000,10000,100000', help='points of the errorbar plots of the prop figure')
+    parser.add_argument('-t', '--t_process', type=float, default=0.01, help='processing time (s) between the updates of a scan (scheduler)')
+    args = parser.parse_args()
+
+    np.random.seed(0)
+    sizes = [int(n) for n in args.sizes.split(',')]
+    for lod in [False, True]:
+        run_lod(sizes, lod)
+    run_errorbar([int(n) for n in args.errorbar_sizes.split(',')])
+    if args.nscans:
+        for blit in [False, True]:
+            for max_rate in [float(rate) for rate in args.rates.split(',')]:
+                run_scheduled(args.nscans, args.npts, args.drift, blit, max_rate, args.t_process)
+        for blit in [False, True]:
+            name = 'blit' if blit else 'full'
+            frame_times, stats = run(spectra_figure, lambda i: spectra_frames(i, args.npts, args.drift), args.nscans, blit)
+            report('spectra ' + name, args.nscans, frame_times, stats)
+            frame_times, stats = run(data_figure, data_frames, args.nscans, blit)
+            report('data ' + name, args.nscans, frame_times, stats)
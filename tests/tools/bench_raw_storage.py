@@ -0,0 +1,92 @@
+'''
+Benchmark of raw data storage filters of DataSaver.
+It writes synthetic f/G/B sweeps with different settings['raw_storage']
+and reports write throughput, file size and read throughput.
+Run it from the repository root:
+    python tests/tools/bench_raw_storage.py -n 200
+'''
+
+import os
+import sys
+import argparse
+import tempfile
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__)))), 'rheoQCM', 'modules'))
+import DataSaver
+
+
+time_str_format = '%Y-%m-%d %H:%M:%S.%f'
+
+# name: settings['raw_storage']
+storage_opts = {
+    'none': {},
+    'gzip4_shuffle': {'compression': 'gzip', 'compression_opts': 4, 'shuffle': True},
+    'lzf_shuffle': {'compression': 'lzf', 'shuffle': True},
+    'gzip4_shuffle_flinear': {'compression': 'gzip', 'compression_opts': 4, 'shuffle': True, 'f_linear': True},
+    'lzf_shuffle_flinear': {'compression': 'lzf', 'shuffle': True, 'f_linear': True},
+}
+
+
+def make_sweep(harm, npts, rng, f1=5e6):
+    '''
+    return f, G, B of a Lorentzian peak at harm with some noise
+    '''
+    cen = f1 * harm
+    wid = 200 * harm
+    f = np.linspace(cen - 8 * wid, cen + 8 * wid, npts)
+    x = (f - cen) / wid
+    G = 1 / (1 + x**2) + rng.normal(0, 1e-3, npts)
+    B = x / (1 + x**2) + rng.normal(0, 1e-3, npts)
+    return f, G, B
+
+
+def run(name, raw_storage, nqueue, harm_list, npts, folder):
+    rng = np.random.default_rng(0)
+    settings = {'max_harmonic': 9, 'time_str_format': time_str_format, 'raw_storage': raw_storage}
+    path = os.path.join(folder, name + '.h5')
+
+    data_saver = DataSaver.DataSaver(settings=settings)
+    data_saver.init_file(path, settings=settings, t0=time.strftime('%Y-%m-%d %H:%M:%S.000000'))
+
+    sweeps = {harm: make_sweep(int(harm), npts, rng) for harm in harm_list}
+    f = {'samp': {harm: sweeps[harm][0] for harm in harm_list}}
+    G = {'samp': {harm: sweeps[harm][1] for harm in harm_list}}
+    B = {'samp': {harm: sweeps[harm][2] for harm in harm_list}}
+    t = {'samp': time.strftime('%Y-%m-%d %H:%M:%S.000000')}
+    temp = {'samp': 25.}
+
+    # write
+    t0 = time.perf_counter()
+    for queue_id in range(nqueue):
+        data_saver.queue_list.append(queue_id)
+        data_saver._save_raw(['samp'], harm_list, t=t, temp=temp, f=f, G=G, B=B)
+    t_write = time.perf_counter() - t0
+
+    # read
+    data_saver.samp = data_saver.samp.iloc[0:0]
+    t0 = time.perf_counter()
+    for queue_id in range(nqueue):
+        for harm in harm_list:
+            data_saver.get_raw('samp', queue_id, harm)
+    t_read = time.perf_counter() - t0
+
+    nbytes = nqueue * len(harm_list) * 3 * npts * 8 # size of raw data in memory
+    size = os.path.getsize(path)
+    print('{:<24} write {:8.1f} MB/s  read {:8.1f} MB/s  size {:8.2f} MB  ratio {:5.2f}'.format(
+        name, nbytes / t_write / 1e6, nbytes / t_read / 1e6, size / 1e6, nbytes / size))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark raw data storage filters of DataSaver.')
+    parser.add_argument('-n', '--nqueue', type=int, default=200, help='number of queues to write')
+    parser.add_argument('-p', '--npts', type=int, default=400, help='number of points in each sweep')
+    parser.add_argument('-H', '--harms', type=str, default='1,3,5,7,9', help='harmonics to write (comma separated)')
+    args = parser.parse_args()
+
+    harm_list = args.harms.split(',')
+    print('{} queues x {} harmonics x {} points'.format(args.nqueue, len(harm_list), args.npts))
+    with tempfile.TemporaryDirectory() as folder:
+        for name, raw_storage in storage_opts.items():
+            run(name, raw_storage, args.nqueue, harm_list, args.npts, folder)
@@ -0,0 +1,94 @@
+'''
+Import-time report of the modules of rheoQCM.
+Each module is imported in a new interpreter with `python -X importtime`. The
+report gives the wall time of the import, the heavy packages loaded by it
+(which should be imported lazily, at first use) and the packages with the
+longest cumulative import time.
+Run it from the repository root:
+    python tests/tools/bench_startup.py -r 3 -t 10
+Use -m to give the modules (e.g. -m modules.PeakTracker,rheoQCM).
+'''
+
+import os
+import sys
+import argparse
+import subprocess
+import time
+
+root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+src = os.path.join(root, 'rheoQCM')
+
+modules_default = [
+    'UISettings',
+    'modules.UIModules',
+    'modules.PlotRefresh',
+    'modules.Acquisition',
+    'modules.TempModules',
+    'modules.QCM',
+    'modules.PeakTracker',
+    'modules.DataSaver',
+    'modules.MatplotlibWidget',
+    'rheoQCM',
+]
+# packages imported at the first use
+lazy_packages = ['lmfit', 'scipy.signal', 'scipy.interpolate', 'scipy.optimize', 'openpyxl', 'nidaqmx']
+
+code = '''
+import sys
+sys.path[:0] = [{src!r}, {modules!r}]
+import {module}
+print('lazy:' + ','.join(name for name in {lazy!r} if name in sys.modules))
+'''
+
+
+def import_time(module):
+    '''
+    import module in a new interpreter
+    return wall time (s), list of lazy packages loaded, {package imported by module: cumulative time (s)}, error
+    '''
+    cmd = [sys.executable, '-X', 'importtime', '-c', code.format(src=src, modules=os.path.join(src, 'modules'), module=module, lazy=lazy_packages)]
+    t_start = time.perf_counter()
+    proc = subprocess.run(cmd, cwd=src, capture_output=True, text=True)
+    t_wall = time.perf_counter() - t_start
+
+    cumulative = {}
+    error = None
+    for line in proc.stderr.splitlines():
+        if line.startswith('import time:'):
+            fields = line[len('import time:'):].split('|')
+            if len(fields) == 3 and fields[1].strip().isdigit():
+                name = fields[2].rstrip()
+                level = (len(name) - len(name.lstrip()) - 1) // 2 # nested imports are indented by 2
+                if level == 1: # packages imported by the module
+                    cumulative[name.strip()] = int(fields[1]) * 1e-6
+        elif line.strip():
+            error = line.strip() # last line of traceback
+    if proc.returncode != 0:
+        return t_wall, [], cumulative, error
+    loaded = [line[len('lazy:'):] for line in proc.stdout.splitlines() if line.startswith('lazy:')]
+    loaded = [name for name in loaded[-1].split(',') if name] if loaded else []
+    return t_wall, loaded, cumulative, None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Import-time report of the modules of rheoQCM.')
+    parser.add_argument('-m', '--modules', type=str, default=','.join(modules_default), help='modules to import (comma separated)')
+    parser.add_argument('-r', '--repeats', type=int, default=3, help='number of imports of each module (the minimum time is reported)')
+    parser.add_argument('-t', '--top', type=int, default=5, help='number of the slowest packages listed for each module')
+    args = parser.parse_args()
+
+    print('{:<28} {:>10}  {}'.format('module', 'time (s)', 'lazy packages loaded at import'))
+    details = {}
+    for module in args.modules.split(','):
+        results = [import_time(module) for _ in range(args.repeats)]
+        t_wall, loaded, cumulative, error = min(results, key=lambda result: result[0])
+        if error:
+            print('{:<28} {:>10}  {}'.format(module, 'n/a', error))
+            continue
+        print('{:<28} {:10.3f}  {}'.format(module, t_wall, ', '.join(loaded) if loaded else '-'))
+        details[module] = cumulative
+
+    for module, cumulative in (details.items() if args.top else []):
+        print('\n{} slowest imports (cumulative, s):'.format(module))
+        for name, t in sorted(cumulative.items(), key=lambda item: -item[1])[:args.top]:
+            print('    {:<32} {:8.3f}'.format(name, t))
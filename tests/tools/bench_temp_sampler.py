@@ -0,0 +1,80 @@
+'''
+Benchmark of reading the temperature in the acquisition loop with the
+simulated sensor (TempModules.SimTempSensor).
+The direct read (a new task for each scan before scanning, as
+NITempSensor.get_tempC) is compared with TempModules.TempSampler, which reads
+the sensor in a background thread with the task kept open and interpolates the
+temperature at the scan time after scanning. The time the loop waits for the
+temperature and the error to the simulated temperature at the scan time are
+reported with the read latency and drift of the sampler.
+Run it from the repository root:
+    python tests/tools/bench_temp_sampler.py -n 20 -s 0.5 -d 1
+'''
+
+import os
+import sys
+import argparse
+import time
+import numpy as np
+
+root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+sys.path.insert(0, os.path.join(root, 'rheoQCM', 'modules'))
+from TempModules import SimTempSensor, TempSampler
+
+
+def run(sensor, nscans, scan_time, sampler=None):
+    '''
+    scan nscans times (sleep of scan_time) and return wait times and errors of temperature
+    '''
+    waits, errors = [], []
+    for _ in range(nscans):
+        t_scan = time.time()
+        t_start = time.perf_counter()
+        if sampler is None: # read before scanning
+            temp = sensor.get_tempC()
+        waits.append(time.perf_counter() - t_start)
+
+        time.sleep(scan_time) # scanning
+
+        if sampler is not None: # interpolated at the scan time
+            t_start = time.perf_counter()
+            temp = sampler.temp_at(t_scan)
+            waits[-1] += time.perf_counter() - t_start
+        errors.append(temp - sensor.true_tempC(t_scan))
+    return np.array(waits), np.array(errors)
+
+
+def report(name, waits, errors):
+    print('{:<8} {:12.3f} {:12.3f} {:12.4f} {:12.4f}'.format(name, np.mean(waits) * 1e3, np.max(waits) * 1e3, np.mean(errors), np.sqrt(np.mean(errors**2))))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark of reading the temperature in the acquisition loop.')
+    parser.add_argument('-n', '--nscans', type=int, default=20, help='number of scans')
+    parser.add_argument('-s', '--scan_time', type=float, default=0.5, help='time of each scan in s')
+    parser.add_argument('-i', '--interval', type=float, default=0.1, help='interval of the sampler in s')
+    parser.add_argument('-d', '--drift', type=float, default=1, help='drift of temperature in C/min')
+    parser.add_argument('--amp', type=float, default=0.5, help='amplitude of oscillation of temperature in C')
+    parser.add_argument('--period', type=float, default=5, help='period of oscillation of temperature in s')
+    parser.add_argument('--noise', type=float, default=0.01, help='std of noise in C')
+    parser.add_argument('--setup', type=float, default=0.05, help='time in s to create a task')
+    parser.add_argument('--latency', type=float, default=0.02, help='time in s of each read')
+    args = parser.parse_args()
+
+    params = dict(drift=args.drift, amp=args.amp, period=args.period, noise=args.noise, setup=args.setup, latency=args.latency, seed=0)
+    print('{} scans of {} s, temperature drift {} C/min, oscillation {} C / {} s, noise {} C'.format(args.nscans, args.scan_time, args.drift, args.amp, args.period, args.noise))
+    print('{:<8} {:>12} {:>12} {:>12} {:>12}'.format('read', 'wait (ms)', 'max (ms)', 'error (C)', 'rms (C)'))
+
+    sensor = SimTempSensor(**params)
+    report('direct', *run(sensor, args.nscans, args.scan_time))
+
+    sensor = SimTempSensor(**params)
+    sampler = TempSampler(sensor, interval=args.interval)
+    sampler.start(timeout=5)
+    waits, errors = run(sensor, args.nscans, args.scan_time, sampler=sampler)
+    sampler.stop()
+    report('sampler', waits, errors)
+
+    stats = sampler.summary()
+    print('sampler: {} reads, latency {:.2f} ms (max {:.2f}), period {:.2f} ms (jitter {:.3f}), drift {:.3f} C/min, held {}, stale {}'.format(
+        stats['reads'], stats['latency'] * 1e3, stats['latency_max'] * 1e3, stats['period'] * 1e3, stats['jitter'] * 1e3, stats['drift'], stats['held'], stats['stale']))